@@ -0,0 +1,163 @@
+"""
+Rebuild the images of a project's services when the files in their build
+contexts change, and recreate the services which use them.
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import fnmatch
+import logging
+import os
+import time
+
+from docker.errors import APIError
+
+from .const import DEFAULT_TIMEOUT
+from .legacy import forget_legacy_containers
+from .utils import ParallelExecutionError
+
+
+log = logging.getLogger(__name__)
+
+
+def get_excludes(path):
+    """Return the patterns in the `.dockerignore` of the build context at
+    `path`, cleaned like Docker cleans them.
+    """
+    try:
+        with open(os.path.join(path, '.dockerignore')) as f:
+            lines = f.read().splitlines()
+    except IOError:
+        return []
+
+    return [os.path.normpath(line.strip()) for line in lines if line.strip()]
+
+
+def is_excluded(relpath, excludes):
+    """Whether the `.dockerignore` patterns `excludes` match `relpath`, as
+    Docker matches them: `*` and `?` don't match a `/`, and a pattern which
+    matches a directory matches everything in it.
+    """
+    parts = relpath.split(os.sep)
+    for pattern in excludes:
+        pattern_parts = pattern.split('/')
+        if len(pattern_parts) > len(parts):
+            continue
+        if all(fnmatch.fnmatchcase(part, pattern_part)
+               for part, pattern_part in zip(parts, pattern_parts)):
+            return True
+    return False
+
+
+def snapshot_context(path, dockerfiles=('Dockerfile',)):
+    """Return the modification time and size of each file in the build
+    context at `path`, by path relative to it. Files and directories the
+    context's `.dockerignore` excludes aren't read, as they aren't sent to
+    the daemon either, except for the `.dockerignore` itself and
+    `dockerfiles`, which the daemon always reads.
+    """
+    excludes = get_excludes(path)
+    always_read = set(os.path.normpath(name) for name in dockerfiles)
+    always_read.add('.dockerignore')
+    snapshot = {}
+
+    for dirpath, dirnames, filenames in os.walk(path):
+        relpath = os.path.relpath(dirpath, path)
+        if relpath == '.':
+            relpath = ''
+
+        dirnames[:] = [
+            name for name in dirnames
+            if not is_excluded(os.path.join(relpath, name), excludes)
+            or any(read.startswith(os.path.join(relpath, name, ''))
+                   for read in always_read)
+        ]
+
+        for name in filenames:
+            file_relpath = os.path.join(relpath, name)
+            if file_relpath not in always_read and is_excluded(file_relpath, excludes):
+                continue
+            try:
+                stat = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                # Removed since the directory was listed
+                continue
+            snapshot[file_relpath] = (stat.st_mtime, stat.st_size)
+
+    return snapshot
+
+
+class ContextWatcher(object):
+    """
+    Watches the build contexts of `services` for changes, and rebuilds and
+    recreates the services whose contexts changed.
+
+    Contexts are polled every `interval` seconds, and a change is acted on
+    once a poll finds nothing more has changed, so a burst of changes, such
+    as a checkout or an editor saving several files, results in a single
+    build. Services which share a context are built together.
+    """
+
+    def __init__(self, project, services, interval=1, limit=1, timeout=DEFAULT_TIMEOUT):
+        self.project = project
+        self.interval = interval
+        self.limit = limit
+        self.timeout = timeout
+        self.contexts = {}
+        self.dockerfiles = {}
+        self.snapshots = {}
+
+        for service in services:
+            if service.can_be_built():
+                path = service.options['build']
+                self.contexts.setdefault(path, []).append(service.name)
+                self.dockerfiles.setdefault(path, set()).add(
+                    service.options.get('dockerfile') or 'Dockerfile')
+
+    def watch(self):
+        """Rebuild services as their contexts change, until interrupted."""
+        for path in self.contexts:
+            self.snapshots[path] = snapshot_context(path, self.dockerfiles[path])
+
+        log.info("Watching the build contexts of %s..." % ", ".join(
+            sorted(name for names in self.contexts.values() for name in names)))
+
+        pending = set()
+        while True:
+            time.sleep(self.interval)
+            changed = self.poll()
+            if changed:
+                pending.update(changed)
+            elif pending:
+                self.rebuild(pending)
+                pending = set()
+
+    def poll(self):
+        """Snapshot each context again, and return the names of the services
+        whose contexts changed since the last snapshot.
+        """
+        changed = set()
+        for path, service_names in self.contexts.items():
+            snapshot = snapshot_context(path, self.dockerfiles[path])
+            if snapshot != self.snapshots.get(path):
+                log.debug("%s changed", path)
+                changed.update(service_names)
+            self.snapshots[path] = snapshot
+        return changed
+
+    def rebuild(self, service_names):
+        """Rebuild and recreate `service_names`. Errors are logged, and the
+        services are rebuilt on their next change.
+        """
+        # Look for legacy containers again, as a watch runs for a long time
+        forget_legacy_containers(self.project.client, self.project.name)
+        try:
+            self.project.rebuild(
+                sorted(service_names),
+                limit=self.limit,
+                timeout=self.timeout)
+        except APIError as e:
+            log.error("Failed to recreate %s: %s" % (
+                ", ".join(sorted(service_names)), e.explanation))
+        except ParallelExecutionError as e:
+            log.error("Failed to recreate %s: %s" % (
+                ", ".join(sorted(service_names)), e.msg))
@@ -0,0 +1,567 @@
+"""
+A long-running process which serves commands for one project over a unix
+socket, so that they don't pay for starting Python, loading the compose file
+and reading the project's containers from the daemon every time.
+
+`docker-compose agent` starts it. When `COMPOSE_AGENT_SOCKET` is set, the CLI
+sends its command line to the agent, and prints what comes back. Commands the
+agent can't serve, such as those which read from the terminal, or which are
+for another project, run in the CLI as usual.
+
+Only the modules the CLI has already loaded are imported at the top of this
+module, as the CLI imports it before running any command.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+import copy
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import six
+from six.moves import socketserver
+
+from ..config import ConfigurationError
+from ..const import LABEL_PROJECT
+from .docopt_command import NoSuchCommand
+from .errors import UserError
+from .main import TopLevelCommand, dispatch, setup_logging
+
+
+log = logging.getLogger(__name__)
+
+
+# Commands the agent serves, and the options without which they can't be
+# served, as they would read from the terminal or handle signals
+AGENT_COMMANDS = {
+    'build': None,
+    'down': None,
+    'kill': None,
+    'logs': None,
+    'port': None,
+    'ps': None,
+    'pull': None,
+    'restart': None,
+    'rm': '--force',
+    'scale': None,
+    'services': None,
+    'start': None,
+    'stop': None,
+    'up': '-d',
+}
+
+# Commands which only read from the daemon, after which the agent's cache is
+# still up to date
+READ_ONLY_COMMANDS = ['logs', 'port', 'ps', 'services']
+
+# Environment variables which change what a command does. A command is only
+# served if they're the same for the CLI as for the agent.
+AGENT_ENVIRONMENT = [
+    'COMPOSE_API_VERSION',
+    'COMPOSE_FILE',
+    'COMPOSE_HOSTS',
+    'COMPOSE_PARALLEL_LIMIT',
+    'COMPOSE_PLACEMENT',
+    'COMPOSE_PROJECT_NAME',
+    'COMPOSE_SKIP_LEGACY_CHECK',
+    'COMPOSE_STATE_DIR',
+    'DOCKER_CERT_PATH',
+    'DOCKER_CLIENT_TIMEOUT',
+    'DOCKER_HOST',
+    'DOCKER_TLS_VERIFY',
+    'FIG_FILE',
+    'FIG_PROJECT_NAME',
+]
+
+# Events which don't change a container's listing or inspect
+IGNORED_EVENTS = ['attach', 'exec_create', 'exec_start', 'resize', 'top']
+
+# Seconds to wait before subscribing to the events stream again once it has
+# ended, doubled each time it ends again soon after, up to the maximum
+RESUBSCRIBE_DELAY = 1
+MAX_RESUBSCRIBE_DELAY = 60
+
+
+def get_request(argv):
+    return {
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': dict((name, os.environ.get(name)) for name in AGENT_ENVIRONMENT),
+    }
+
+
+def forward(socket_path, argv):
+    """Have the agent listening on `socket_path` run the command line `argv`,
+    printing its output. Returns the command's exit status, or None if there's
+    no agent, or it doesn't serve the command.
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except socket.error as e:
+        log.debug("Not using the agent at %s: %s", socket_path, e)
+        conn.close()
+        return None
+
+    try:
+        conn.sendall(json.dumps(get_request(argv)).encode('utf-8') + b'\n')
+        for line in conn.makefile('rb'):
+            frame = json.loads(line.decode('utf-8'))
+            if 'out' in frame:
+                write(sys.stdout, frame['out'])
+            elif 'err' in frame:
+                write(sys.stderr, frame['err'])
+            elif 'fallback' in frame:
+                log.debug("The agent didn't run the command: %s", frame['fallback'])
+                return None
+            elif 'exit' in frame:
+                return frame['exit']
+    except KeyboardInterrupt:
+        return 1
+    finally:
+        conn.close()
+
+    log.error("The agent stopped before the command finished")
+    return 1
+
+
+def write(stream, text):
+    if sys.version_info[0] < 3:
+        text = text.encode('utf-8')
+    stream.write(text)
+    stream.flush()
+
+
+class FrameWriter(object):
+    """A file-like object which sends what's written to it to the CLI, as
+    `name` frames.
+    """
+
+    def __init__(self, name, output):
+        self.name = name
+        self.output = output
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        if data:
+            self.output.write(json.dumps({self.name: data}).encode('utf-8') + b'\n')
+            self.output.flush()
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class ContainerCache(object):
+    """
+    The listing of a project's containers, and the inspects of those a
+    command has read, as last read from the daemon. The events stream
+    invalidates the parts of it which change. The listing is read again when
+    a command is served, and each inspect when a command reads it.
+
+    The cache is only used while the events stream is followed, as nothing
+    else tells it about changes.
+    """
+
+    def __init__(self, client, labels):
+        self.client = client
+        self.labels = labels
+        self.listing = None
+        self.inspected = {}
+        self.enabled = False
+        # Counts the changes to the cache, so that an inspect read while a
+        # container changed isn't kept
+        self.changes = 0
+        self.lock = threading.Lock()
+
+    def follow(self):
+        """Keep the cache up to date from the events stream, until the
+        stream ends or fails.
+        """
+        from ..watch import follow_events
+
+        with self.lock:
+            self.enabled = True
+        try:
+            follow_events(self.client, self.labels, self.handle_event)
+            log.warn("The events stream ended, so containers aren't cached")
+        except Exception as e:
+            log.warn("Reading the events stream failed, so containers aren't cached: %s" % e)
+        finally:
+            with self.lock:
+                self.enabled = False
+                self.listing = None
+                self.inspected = {}
+                self.changes += 1
+
+    def handle_event(self, event):
+        status = (event.get('status') or '').split(':')[0]
+        if event.get('Type', 'container') != 'container' or status in IGNORED_EVENTS:
+            return
+
+        with self.lock:
+            self.listing = None
+            self.inspected.pop(event.get('id'), None)
+            self.changes += 1
+
+    def invalidate(self):
+        with self.lock:
+            self.listing = None
+            self.inspected = {}
+            self.changes += 1
+
+    def refresh(self):
+        """Read the listing with a single request, if it has been
+        invalidated.
+        """
+        with self.lock:
+            if self.enabled and self.listing is None:
+                self.listing = self.client.containers(
+                    all=True,
+                    filters={'label': self.labels})
+
+    def inspect(self, container_id):
+        """Return the inspect of a container, which is read from the daemon
+        unless it's cached. The inspect of a listed container is cached.
+        """
+        with self.lock:
+            if container_id in self.inspected:
+                return copy.deepcopy(self.inspected[container_id])
+            changes = self.changes
+
+        inspected = self.client.inspect_container(container_id)
+
+        with self.lock:
+            listed = self.listing is not None and any(
+                container['Id'] == container_id for container in self.listing)
+            if listed and changes == self.changes:
+                self.inspected[container_id] = copy.deepcopy(inspected)
+        return inspected
+
+
+class CachedClient(object):
+    """
+    A docker client which answers listings of the project's containers, and
+    inspects of them, from a :class:`ContainerCache`. Everything else goes to
+    the daemon, and once a request which could change a container has been
+    made, the cache isn't used any more until `use_cache` is called.
+    """
+
+    READ_ONLY_METHODS = [
+        'attach',
+        'events',
+        'images',
+        'inspect_image',
+        'logs',
+        'version',
+    ]
+
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+        self.cached = False
+
+    def use_cache(self):
+        self.cached = self.cache.enabled
+
+    def containers(self, all=False, filters=None, **kwargs):
+        listing = self.cache.listing
+        if (not self.cached or listing is None or kwargs or
+                list(filters or {}) != ['label']):
+            return self.client.containers(all=all, filters=filters, **kwargs)
+
+        labels = filters['label']
+        if not set(self.cache.labels) <= set(labels):
+            return self.client.containers(all=all, filters=filters)
+
+        return [
+            dict(container)
+            for container in listing
+            if (all or (container.get('Status') or '').startswith('Up'))
+            and matches_labels(container.get('Labels') or {}, labels)
+        ]
+
+    def inspect_container(self, container):
+        if self.cached:
+            return self.cache.inspect(container)
+        return self.client.inspect_container(container)
+
+    def __getattr__(self, name):
+        if name not in self.READ_ONLY_METHODS:
+            self.cached = False
+        return getattr(self.client, name)
+
+
+def matches_labels(container_labels, labels):
+    """Whether a container's labels match a label filter's `name=value` and
+    `name` patterns.
+    """
+    for label in labels:
+        name, equals, value = label.partition('=')
+        if name not in container_labels or (equals and container_labels[name] != value):
+            return False
+    return True
+
+
+class Agent(object):
+    """
+    Serves the commands of the project `command` was run for. The project is
+    built once, and built again if the compose file changes. Unless `fork` is
+    False, each command runs in a process forked from the agent, so commands
+    can run at the same time, and a long-running one such as `logs` doesn't
+    hold up the others.
+    """
+
+    def __init__(self, command, fork=True):
+        self.command = command
+        self.fork = fork
+        self.environment = get_request([])['env']
+        self.config_filename, self.project_name = self.resolve(
+            command.base_dir,
+            command.project_options['config_path'],
+            command.project_options['project_name'])
+
+        client = command.get_client()
+        self.cache = ContainerCache(
+            client,
+            ['{0}={1}'.format(LABEL_PROJECT, self.project_name)])
+        self.client = CachedClient(client, self.cache)
+        self.project = None
+        self.mtime = None
+
+    def resolve(self, base_dir, config_path, project_name):
+        """Return the compose file and project name for a command line's
+        options.
+        """
+        from .. import config
+
+        config_details = config.find(base_dir, config_path)
+        return (
+            os.path.abspath(config_details.filename),
+            self.command.get_project_name(config_details.working_dir, project_name))
+
+    def get_project(self):
+        from ..project import Project
+
+        mtime = os.stat(self.config_filename).st_mtime
+        if self.project is None or mtime != self.mtime:
+            project_config = self.command.get_project_config(
+                self.config_filename, self.project_name)
+            self.project = Project.from_dicts(
+                self.project_name,
+                project_config.service_dicts,
+                self.client)
+            self.mtime = mtime
+        return self.project
+
+    def serve(self, socket_path):
+        """Serve commands on `socket_path` until interrupted, keeping the
+        cache up to date from the events stream in the background.
+        """
+        events = threading.Thread(target=self.follow_events)
+        events.daemon = True
+        events.start()
+
+        if self.fork:
+            # Forked processes are reaped by the system
+            signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+        if os.path.exists(socket_path):
+            if is_listening(socket_path):
+                raise UserError("An agent is already listening on %s" % socket_path)
+            os.unlink(socket_path)
+
+        server = get_server(self, socket_path)
+        log.info("Serving %s on %s" % (self.project_name, socket_path))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(socket_path)
+
+    def follow_events(self):
+        """Follow the events stream for the cache, subscribing to it again
+        with a growing delay whenever it ends, like when the daemon restarts.
+        Commands aren't served from the cache in between.
+        """
+        delay = 0
+        while True:
+            started = time.time()
+            self.cache.follow()
+            if time.time() - started >= MAX_RESUBSCRIBE_DELAY:
+                delay = 0
+            delay = min(max(delay * 2, RESUBSCRIBE_DELAY), MAX_RESUBSCRIBE_DELAY)
+            log.info("Subscribing to the events stream again in %d seconds" % delay)
+            time.sleep(delay)
+
+    def check(self, request):
+        """Return why the agent can't serve `request`, or None if it can. The
+        name of the command is added to the request.
+        """
+        if request.get('env') != self.environment:
+            return "the environment differs"
+
+        # docopt prints these itself
+        if set(request['argv']) & set(['-h', '--help', '--version']):
+            return "help isn't served"
+
+        try:
+            options, _, command_options = TopLevelCommand().parse(request['argv'], None)
+        except (SystemExit, NoSuchCommand):
+            return "the command line doesn't parse"
+
+        command = request['command'] = options['COMMAND']
+        if command not in AGENT_COMMANDS:
+            return "%s isn't served" % command
+
+        required = AGENT_COMMANDS[command]
+        if required and not command_options.get(required):
+            return "%s is only served with %s" % (command, required)
+
+        if options['--verbose']:
+            return "--verbose isn't served"
+
+        try:
+            project_key = self.resolve(
+                request['cwd'],
+                options['--file'] or request['env'].get('COMPOSE_FILE'),
+                options['--project-name'])
+        except ConfigurationError as e:
+            return e.msg
+
+        if project_key != (self.config_filename, self.project_name):
+            return "it's for another project"
+
+        return None
+
+    def handle(self, rfile, wfile):
+        """Serve a request read from `rfile`, sending the frames of its
+        output to `wfile`.
+        """
+        request = json.loads(rfile.readline().decode('utf-8'))
+        request['argv'] = get_native_argv(request['argv'])
+
+        reason = self.check(request)
+        if reason:
+            send(wfile, {'fallback': reason})
+            return
+
+        self.cache.refresh()
+        self.client.use_cache()
+
+        if not self.fork:
+            self.run(request, wfile)
+        elif self.fork_child() == 0:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            # Connections can't be shared with the agent
+            self.cache.client.close()
+            # The agent's terminal isn't the CLI's
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            try:
+                self.run(request, wfile)
+            finally:
+                os._exit(0)
+
+        # The cache is invalidated as soon as the command starts, so that the
+        # next command reads the containers after this one has changed them
+        if request['command'] not in READ_ONLY_COMMANDS:
+            self.cache.invalidate()
+
+    def fork_child(self):
+        # A lock held by another thread as the process forks stays held in
+        # the child for good, so the events thread can't hold the cache's
+        with self.cache.lock:
+            return os.fork()
+
+    def run(self, request, wfile):
+        """Run a checked request, sending its output, and then its exit
+        status, to `wfile`.
+        """
+        stdout, stderr = sys.stdout, sys.stderr
+        root_logger = logging.getLogger()
+        handlers = root_logger.handlers
+
+        sys.stdout = FrameWriter('out', wfile)
+        sys.stderr = FrameWriter('err', wfile)
+        root_logger.handlers = []
+        setup_logging()
+
+        try:
+            dispatch(AgentCommand(self, request['cwd']), request['argv'])
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = e.code
+            if isinstance(exit_code, six.string_types):
+                sys.stderr.write(exit_code + '\n')
+                exit_code = 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            root_logger.handlers = handlers
+
+        send(wfile, {'exit': exit_code or 0})
+
+
+def get_native_argv(argv):
+    # docopt only matches native strings
+    if six.PY2:
+        return [arg.encode('utf-8') for arg in argv]
+    return argv
+
+
+def send(wfile, frame):
+    wfile.write(json.dumps(frame).encode('utf-8') + b'\n')
+    wfile.flush()
+
+
+class AgentCommand(TopLevelCommand):
+    # Runs command lines against the agent's project, from the directory the
+    # CLI was run in. The docstring is the command line's grammar.
+    __doc__ = TopLevelCommand.__doc__
+
+    def __init__(self, agent, base_dir):
+        self.agent = agent
+        self.base_dir = base_dir
+
+    def get_project(self, config_path=None, project_name=None, verbose=False):
+        return self.agent.get_project()
+
+
+def is_listening(socket_path):
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except socket.error:
+        return False
+    finally:
+        conn.close()
+    return True
+
+
+def get_server(agent, socket_path):
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            agent.handle(self.rfile, self.wfile)
+
+    class Server(socketserver.UnixStreamServer):
+        def server_bind(self):
+            # Commands run with the agent's access to Docker, so only its
+            # user may connect. The socket doesn't accept connections until
+            # it's listening, after this.
+            socketserver.UnixStreamServer.server_bind(self)
+            os.chmod(self.server_address, 0o600)
+
+        def shutdown_request(self, request):
+            # A forked process may still be writing to the connection
+            self.close_request(request)
+
+    return Server(socket_path, RequestHandler)
@@ -1,64 +1,90 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
-from requests.exceptions import ConnectionError, SSLError
+from collections import namedtuple
+import functools
 import logging
 import os
 import re
 import six
 
 from .. import config
-from ..project import Project
-from ..service import ConfigError
 from .docopt_command import DocoptCommand
 from .utils import call_silently, is_mac, is_ubuntu
-from .docker_client import docker_client
-from . import verbose_proxy
 from . import errors
 from .. import __version__
 
 log = logging.getLogger(__name__)
 
 
+ProjectConfig = namedtuple('ProjectConfig', 'name service_dicts get_client')
+
+
 class Command(DocoptCommand):
     base_dir = '.'
 
-    def dispatch(self, *args, **kwargs):
-        try:
-            super(Command, self).dispatch(*args, **kwargs)
-        except SSLError as e:
-            raise errors.UserError('SSL error: %s' % e)
-        except ConnectionError:
-            if call_silently(['which', 'docker']) != 0:
-                if is_mac():
-                    raise errors.DockerNotFoundMac()
-                elif is_ubuntu():
-                    raise errors.DockerNotFoundUbuntu()
-                else:
-                    raise errors.DockerNotFoundGeneric()
-            elif call_silently(['which', 'boot2docker']) == 0:
-                raise errors.ConnectionErrorBoot2Docker()
-            else:
-                raise errors.ConnectionErrorGeneric(self.get_client().base_url)
-
     def perform_command(self, options, handler, command_options):
         if options['COMMAND'] in ('help', 'version'):
             # Skip looking up the compose file.
             handler(None, command_options)
             return
 
+        try:
+            self.perform_project_command(options, handler, command_options)
+        except Exception as e:
+            user_error = self.get_connection_error(e)
+            if user_error is None:
+                raise
+            raise user_error
+
+    def perform_project_command(self, options, handler, command_options):
         if 'FIG_FILE' in os.environ:
             log.warn('The FIG_FILE environment variable is deprecated.')
             log.warn('Please use COMPOSE_FILE instead.')
 
         explicit_config_path = options.get('--file') or os.environ.get('COMPOSE_FILE') or os.environ.get('FIG_FILE')
-        project = self.get_project(
-            explicit_config_path,
+        project_options = dict(
+            config_path=explicit_config_path,
             project_name=options.get('--project-name'),
             verbose=options.get('--verbose'))
+        self.project_options = project_options
+
+        if options['COMMAND'] == 'services':
+            # Only needs the compose file, so don't build a project.
+            handler(self.get_project_config(**project_options), command_options)
+            return
+
+        handler(self.get_project(**project_options), command_options)
+
+    def get_connection_error(self, e):
+        """
+        Return a UserError explaining a failure to talk to the Docker daemon,
+        or None if `e` isn't one. requests is only imported here so that
+        commands which don't need the daemon start quickly.
+        """
+        from requests.exceptions import ConnectionError, SSLError
 
-        handler(project, command_options)
+        if isinstance(e, SSLError):
+            return errors.UserError('SSL error: %s' % e)
+
+        if not isinstance(e, ConnectionError):
+            return None
+
+        if call_silently(['which', 'docker']) != 0:
+            if is_mac():
+                return errors.DockerNotFoundMac()
+            elif is_ubuntu():
+                return errors.DockerNotFoundUbuntu()
+            else:
+                return errors.DockerNotFoundGeneric()
+        elif call_silently(['which', 'boot2docker']) == 0:
+            return errors.ConnectionErrorBoot2Docker()
+        else:
+            return errors.ConnectionErrorGeneric(self.get_client().base_url)
 
     def get_client(self, verbose=False):
+        from .docker_client import docker_client
+        from . import verbose_proxy
+
         client = docker_client()
         if verbose:
             version_info = six.iteritems(client.version())
@@ -69,14 +95,29 @@ class Command(DocoptCommand):
             return verbose_proxy.VerboseProxy('docker', client)
         return client
 
-    def get_project(self, config_path=None, project_name=None, verbose=False):
+    def get_project_config(self, config_path=None, project_name=None, verbose=False):
+        """
+        Load the compose file without building a Project. A client is only
+        created if `get_client` is called.
+        """
         config_details = config.find(self.base_dir, config_path)
 
+        return ProjectConfig(
+            self.get_project_name(config_details.working_dir, project_name),
+            config.load(config_details),
+            functools.partial(self.get_client, verbose=verbose))
+
+    def get_project(self, config_path=None, project_name=None, verbose=False):
+        from ..project import Project
+        from ..service import ConfigError
+
+        project_config = self.get_project_config(config_path, project_name, verbose)
+
         try:
             return Project.from_dicts(
-                self.get_project_name(config_details.working_dir, project_name),
-                config.load(config_details),
-                self.get_client(verbose=verbose))
+                project_config.name,
+                project_config.service_dicts,
+                project_config.get_client())
         except ConfigError as e:
             raise errors.UserError(six.text_type(e))
 
@@ -8,12 +8,35 @@ def docker_client():
     """
     Returns a docker-py client configured using environment variables
     according to the same logic as the official Docker client.
+
+    If `COMPOSE_HOSTS` lists several endpoints, returns a client which
+    spreads containers across all of them, placed using the strategy named
+    by `COMPOSE_PLACEMENT`.
+    """
+    hosts = [
+        host.strip()
+        for host in os.environ.get('COMPOSE_HOSTS', '').split(',')
+        if host.strip()
+    ]
+    if len(hosts) > 1:
+        from .multi_host import MultiHostClient, get_strategy
+
+        return MultiHostClient(
+            [host_client(host) for host in hosts],
+            strategy=get_strategy(os.environ.get('COMPOSE_PLACEMENT') or 'spread'))
+
+    return host_client(hosts[0] if hosts else os.environ.get('DOCKER_HOST'))
+
+
+def host_client(base_url):
+    """
+    Returns a docker-py client for the daemon at `base_url`, using the TLS
+    settings, API version and timeout from the environment.
     """
     cert_path = os.environ.get('DOCKER_CERT_PATH', '')
     if cert_path == '':
         cert_path = os.path.join(os.environ.get('HOME', ''), '.docker')
 
-    base_url = os.environ.get('DOCKER_HOST')
     api_version = os.environ.get('COMPOSE_API_VERSION', '1.19')
 
     tls_config = None
@@ -3,25 +3,20 @@ from __future__ import unicode_literals
 from inspect import getdoc
 from operator import attrgetter
 import logging
+import os
 import re
 import signal
 import sys
 
-from docker.errors import APIError
-import dockerpty
-
 from .. import __version__
 from .. import legacy
-from ..const import DEFAULT_TIMEOUT
-from ..project import NoSuchService, ConfigurationError
-from ..service import BuildError, NeedsBuildError
-from ..config import parse_environment
+from ..const import DEFAULT_TIMEOUT, LABEL_ONE_OFF, LABEL_PROJECT, LABEL_SERVICE
+from ..config import parse_environment, ConfigurationError
 from ..progress_stream import StreamOutputError
+from ..utils import get_error_message
 from .command import Command
 from .docopt_command import NoSuchCommand
 from .errors import UserError
-from .formatter import Formatter
-from .log_printer import LogPrinter
 from .utils import yesno, get_version_info
 
 log = logging.getLogger(__name__)
@@ -34,13 +29,30 @@ It will be removed in a future version of Compose.
 
 def main():
     setup_logging()
+
+    if os.environ.get('COMPOSE_AGENT_SOCKET'):
+        from .agent import forward
+        exit_code = forward(os.environ['COMPOSE_AGENT_SOCKET'], sys.argv[1:])
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    dispatch(TopLevelCommand(), sys.argv[1:])
+
+
+def dispatch(command, argv):
+    """
+    Run the command line `argv` with `command`, logging errors we know how
+    to report and exiting with status 1 for them.
+    """
+    # Legacy containers are looked for again by each command, as the agent
+    # runs several in one process
+    legacy.forget_legacy_containers()
     try:
-        command = TopLevelCommand()
-        command.sys_dispatch()
+        command.dispatch(argv, None)
     except KeyboardInterrupt:
         log.error("\nAborting.")
         sys.exit(1)
-    except (UserError, NoSuchService, ConfigurationError, legacy.LegacyError) as e:
+    except (UserError, ConfigurationError, legacy.LegacyError) as e:
         log.error(e.msg)
         sys.exit(1)
     except NoSuchCommand as e:
@@ -48,17 +60,14 @@ def main():
         log.error("")
         log.error("\n".join(parse_doc_section("commands:", getdoc(e.supercommand))))
         sys.exit(1)
-    except APIError as e:
-        log.error(e.explanation)
-        sys.exit(1)
-    except BuildError as e:
-        log.error("Service '%s' failed to build: %s" % (e.service.name, e.reason))
-        sys.exit(1)
     except StreamOutputError as e:
         log.error(e)
         sys.exit(1)
-    except NeedsBuildError as e:
-        log.error("Service '%s' needs to be built, but --no-build was passed." % e.service.name)
+    except Exception as e:
+        message = get_error_message(e)
+        if message is None:
+            raise
+        log.error(message)
         sys.exit(1)
 
 
@@ -95,7 +104,10 @@ class TopLevelCommand(Command):
       -v, --version             Print version and exit
 
     Commands:
+      agent              Serve commands from a long-running process
+      autobuild          Rebuild and recreate services when their code changes
       build              Build or rebuild services
+      down               Stop and remove containers
       help               Get help on a command
       kill               Kill containers
       logs               View output from containers
@@ -106,11 +118,13 @@ class TopLevelCommand(Command):
       rm                 Remove stopped containers
       run                Run a one-off command
       scale              Set number of containers for a service
+      services           List services
       start              Start services
       stop               Stop services
       up                 Create and start containers
       migrate-to-labels  Recreate containers to add labels
       version            Show the Docker-Compose version information
+      watch              Keep containers up and converged
 
     """
     def docopt_options(self):
@@ -118,6 +132,71 @@ class TopLevelCommand(Command):
         options['version'] = get_version_info('compose')
         return options
 
+    def agent(self, project, options):
+        """
+        Serve commands for this project from a long-running process, listening
+        on a unix socket. When `COMPOSE_AGENT_SOCKET` is set to the socket,
+        commands such as `ps`, `port`, `logs`, `up -d` and `scale` are sent to
+        the agent, which has the project loaded and its containers cached, and
+        so runs them faster. Other commands run as usual.
+
+        Usage: agent [options]
+
+        Options:
+            --socket PATH  Unix socket to listen on. Defaults to the value of
+                           COMPOSE_AGENT_SOCKET.
+        """
+        from .agent import Agent
+
+        socket_path = options['--socket'] or os.environ.get('COMPOSE_AGENT_SOCKET')
+        if not socket_path:
+            raise UserError("Give a socket with --socket or COMPOSE_AGENT_SOCKET.")
+
+        Agent(self).serve(socket_path)
+
+    def autobuild(self, project, options):
+        """
+        Create and start containers, like `up -d`, and then rebuild services
+        whenever the files in their build directories change, and recreate
+        them and the services which depend on them. Files excluded by a
+        `.dockerignore` are ignored. Runs until interrupted.
+
+        Usage: autobuild [options] [SERVICE...]
+
+        Options:
+            --parallel NUM         Number of images to build at the same
+                                   time [default: 1]
+            --interval SECONDS     Check for changes every SECONDS seconds.
+                                   Builds start once a check finds nothing
+                                   more has changed. [default: 1]
+            -t, --timeout TIMEOUT  Use this timeout in seconds for container
+                                   shutdown when containers are recreated.
+                                   (default: 10)
+        """
+        service_names = options['SERVICE']
+        timeout = int(options.get('--timeout') or DEFAULT_TIMEOUT)
+
+        try:
+            limit = int(options['--parallel'])
+            interval = float(options['--interval'])
+        except ValueError:
+            raise UserError('--parallel and --interval should be numbers')
+
+        if limit < 1 or interval <= 0:
+            raise UserError('--parallel and --interval should be positive numbers')
+
+        project.up(service_names=service_names, timeout=timeout)
+
+        try:
+            project.autobuild(
+                service_names=service_names,
+                limit=limit,
+                interval=interval,
+                timeout=timeout,
+            )
+        except KeyboardInterrupt:
+            print("Stopped watching")
+
     def build(self, project, options):
         """
         Build or rebuild services.
@@ -166,6 +245,8 @@ class TopLevelCommand(Command):
         Options:
             --no-color  Produce monochrome output.
         """
+        from .log_printer import LogPrinter
+
         containers = project.containers(service_names=options['SERVICE'], stopped=True)
 
         monochrome = options['--no-color']
@@ -202,9 +283,19 @@ class TopLevelCommand(Command):
         Options:
             -q    Only display IDs
         """
+        from .formatter import Formatter
+
+        # Stopped one-off containers aren't shown
         containers = sorted(
-            project.containers(service_names=options['SERVICE'], stopped=True) +
-            project.containers(service_names=options['SERVICE'], one_off=True),
+            [
+                container
+                for container in project.containers(
+                    service_names=options['SERVICE'],
+                    stopped=True,
+                    one_off=None)
+                if container.is_running or
+                container.labels.get(LABEL_ONE_OFF) != "True"
+            ],
             key=attrgetter('name'))
 
         if options['-q']:
@@ -246,6 +337,25 @@ class TopLevelCommand(Command):
             service_names=options['SERVICE'],
         )
 
+    def down(self, project, options):
+        """
+        Stop and remove containers, including one-off containers created by
+        `run`. Each container is removed as soon as it has stopped.
+
+        Usage: down [options] [SERVICE...]
+
+        Options:
+            -t, --timeout TIMEOUT  Specify a shutdown timeout in seconds.
+                                   (default: 10)
+            -v                     Remove volumes associated with containers
+        """
+        timeout = int(options.get('--timeout') or DEFAULT_TIMEOUT)
+        project.down(
+            service_names=options['SERVICE'],
+            timeout=timeout,
+            remove_volumes=options['-v'],
+        )
+
     def rm(self, project, options):
         """
         Remove stopped service containers.
@@ -298,6 +408,9 @@ class TopLevelCommand(Command):
             -T                    Disable pseudo-tty allocation. By default `docker-compose run`
                                   allocates a TTY.
         """
+        from docker.errors import APIError
+        import dockerpty
+
         service = project.get_service(options['SERVICE'])
 
         if options['--allow-insecure-ssl']:
@@ -379,6 +492,9 @@ class TopLevelCommand(Command):
 
             $ docker-compose scale web=2 worker=3
 
+        Several services are scaled at the same time, each one after the
+        services it depends on.
+
         Usage: scale [options] [SERVICE=NUM...]
 
         Options:
@@ -386,6 +502,7 @@ class TopLevelCommand(Command):
                                      (default: 10)
         """
         timeout = int(options.get('--timeout') or DEFAULT_TIMEOUT)
+        service_nums = {}
 
         for s in options['SERVICE=NUM']:
             if '=' not in s:
@@ -396,7 +513,45 @@ class TopLevelCommand(Command):
             except ValueError:
                 raise UserError('Number of containers for service "%s" is not a '
                                 'number' % service_name)
+            service_nums[service_name] = num
+
+        if len(service_nums) == 1:
+            [(service_name, num)] = service_nums.items()
             project.get_service(service_name).scale(num, timeout=timeout)
+        else:
+            project.scale(service_nums, timeout=timeout)
+
+    def services(self, project_config, options):
+        """
+        List the services in the compose file, one per line.
+
+        Only the compose file is read, unless filtering by container state,
+        which needs a single query to the Docker daemon.
+
+        Usage: services [options]
+
+        Options:
+            --filter FILTER  Only list services which are built (build), use an
+                             image (image), or have at least one running
+                             (running) or stopped (stopped) container.
+        """
+        service_filter = options['--filter']
+        service_dicts = project_config.service_dicts
+
+        if service_filter in ('build', 'image'):
+            service_dicts = [s for s in service_dicts if service_filter in s]
+        elif service_filter in ('running', 'stopped'):
+            names = get_service_names_with_containers(
+                project_config.get_client(),
+                project_config.name,
+                running=(service_filter == 'running'))
+            service_dicts = [s for s in service_dicts if s['name'] in names]
+        elif service_filter is not None:
+            raise UserError('Invalid filter "%s", should be one of: build, image, '
+                            'running, stopped' % service_filter)
+
+        for name in sorted(s['name'] for s in service_dicts):
+            print(name)
 
     def start(self, project, options):
         """
@@ -412,14 +567,27 @@ class TopLevelCommand(Command):
 
         They can be started again with `docker-compose start`.
 
+        With `--ordered`, services are stopped in waves, each one after all
+        of the services which depend on it. `--deadline` bounds the whole
+        shutdown: containers which haven't been stopped when it runs out are
+        killed.
+
         Usage: stop [options] [SERVICE...]
 
         Options:
           -t, --timeout TIMEOUT      Specify a shutdown timeout in seconds.
                                      (default: 10)
+          --ordered                  Stop services in reverse dependency order.
+          --deadline SECONDS         Kill any containers which are still running
+                                     SECONDS after stopping begins.
         """
         timeout = int(options.get('--timeout') or DEFAULT_TIMEOUT)
-        project.stop(service_names=options['SERVICE'], timeout=timeout)
+        project.stop(
+            service_names=options['SERVICE'],
+            timeout=timeout,
+            ordered=options['--ordered'],
+            deadline=get_deadline(options['--deadline']),
+        )
 
     def restart(self, project, options):
         """
@@ -453,6 +621,10 @@ class TopLevelCommand(Command):
         If you want to force Compose to stop and recreate all containers, use the
         `--force-recreate` flag.
 
+        To keep a service available while its containers are recreated, use
+        `--batch-size` to replace them a few at a time. With `--start-first`,
+        each new container is started before the old one is stopped.
+
         Usage: up [options] [SERVICE...]
 
         Options:
@@ -469,11 +641,25 @@ class TopLevelCommand(Command):
             -t, --timeout TIMEOUT  Use this timeout in seconds for container shutdown
                                    when attached or when containers are already
                                    running. (default: 10)
+            --batch-size NUM       Recreate at most NUM containers of a service at
+                                   a time, as a rolling update.
+            --batch-delay SECONDS  Seconds to wait between batches of a rolling
+                                   update. (default: 0)
+            --start-first          Start each new container before stopping the one
+                                   it replaces. Has no effect for services which
+                                   publish a fixed host port.
+            --stop-ordered         When attached, stop services in reverse
+                                   dependency order.
+            --stop-deadline SECONDS
+                                   When attached, kill any containers which are
+                                   still running SECONDS after stopping begins.
         """
         if options['--allow-insecure-ssl']:
             log.warn(INSECURE_SSL_WARNING)
 
         detached = options['-d']
+        batch_size, batch_delay = get_rollout_options(options)
+        stop_deadline = get_deadline(options['--stop-deadline'])
 
         monochrome = options['--no-color']
 
@@ -492,10 +678,15 @@ class TopLevelCommand(Command):
             allow_recreate=allow_recreate,
             force_recreate=force_recreate,
             do_build=not options['--no-build'],
-            timeout=timeout
+            timeout=timeout,
+            batch_size=batch_size,
+            start_first=options['--start-first'],
+            batch_delay=batch_delay,
         )
 
         if not detached:
+            from .log_printer import LogPrinter
+
             print("Attaching to", list_containers(to_attach))
             log_printer = LogPrinter(to_attach, attach_params={"logs": True}, monochrome=monochrome)
 
@@ -508,9 +699,44 @@ class TopLevelCommand(Command):
                 signal.signal(signal.SIGINT, handler)
 
                 print("Gracefully stopping... (press Ctrl+C again to force)")
-                project.stop(service_names=service_names, timeout=timeout)
+                project.stop(
+                    service_names=service_names,
+                    timeout=timeout,
+                    ordered=options['--stop-ordered'],
+                    deadline=stop_deadline,
+                )
+
+    def watch(self, project, options):
+        """
+        Create and start containers, like `up -d`, and then keep them that
+        way. Containers which die are started again, containers which are
+        removed are replaced, and containers created with an outdated
+        configuration are recreated, as soon as Docker reports it. Runs until
+        interrupted.
+
+        Usage: watch [options] [SERVICE...]
+
+        Options:
+            --no-build             Don't build an image, even if it's missing
+            -t, --timeout TIMEOUT  Use this timeout in seconds for container
+                                   shutdown when containers are recreated.
+                                   (default: 10)
+        """
+        service_names = options['SERVICE']
+        timeout = int(options.get('--timeout') or DEFAULT_TIMEOUT)
 
-    def migrate_to_labels(self, project, _options):
+        project.up(
+            service_names=service_names,
+            do_build=not options['--no-build'],
+            timeout=timeout,
+        )
+
+        try:
+            project.watch(service_names=service_names, timeout=timeout)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+
+    def migrate_to_labels(self, project, options):
         """
         Recreate containers to add labels
 
@@ -532,9 +758,21 @@ class TopLevelCommand(Command):
 
             docker rm -f myapp_web_1 myapp_db_1 ...
 
-        Usage: migrate-to-labels
+        Containers are migrated in parallel, after the containers of any
+        services they depend on.
+
+        Usage: migrate-to-labels [options]
+
+        Options:
+            --parallel NUM  Number of containers to migrate at the same
+                            time [default: 10]
         """
-        legacy.migrate_project_to_labels(project)
+        try:
+            limit = int(options['--parallel'])
+        except ValueError:
+            raise UserError('--parallel should be a number')
+
+        legacy.migrate_project_to_labels(project, limit=limit)
 
     def version(self, project, options):
         """
@@ -553,3 +791,45 @@ class TopLevelCommand(Command):
 
 def list_containers(containers):
     return ", ".join(c.name for c in containers)
+
+
+def get_service_names_with_containers(client, project_name, running=True):
+    """
+    Return the names of services with at least one running (or stopped)
+    container, using the state reported by a single container listing.
+    """
+    labels = [
+        '{0}={1}'.format(LABEL_PROJECT, project_name),
+        '{0}=False'.format(LABEL_ONE_OFF),
+    ]
+    return set(
+        (container.get('Labels') or {}).get(LABEL_SERVICE)
+        for container in client.containers(all=not running, filters={'label': labels})
+        if (container.get('Status') or '').startswith('Up') == running
+    )
+
+
+def get_rollout_options(options):
+    try:
+        batch_size = int(options['--batch-size'] or 0) or None
+        batch_delay = float(options['--batch-delay'] or 0)
+    except ValueError:
+        raise UserError('--batch-size and --batch-delay should be numbers')
+
+    if batch_size is not None and batch_size < 0:
+        raise UserError('--batch-size should be a positive number')
+
+    if batch_delay < 0:
+        raise UserError('--batch-delay should not be negative')
+
+    return batch_size, batch_delay
+
+
+def get_deadline(value):
+    if value is None:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        raise UserError('The deadline should be a number of seconds')
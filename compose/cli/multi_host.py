@@ -0,0 +1,425 @@
+"""
+A client which spreads a project across several independent Docker hosts,
+for when `COMPOSE_HOSTS` lists more than one endpoint.
+
+It has the methods of docker-py's `Client` which Compose uses, so a project
+is built with it like with any other client. Listings are read from every
+host at the same time and merged, calls for a container go to the host it's
+on, and new containers are placed on a host by a placement strategy.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import itertools
+import logging
+import threading
+
+from docker.errors import APIError
+from requests.packages.urllib3.exceptions import ReadTimeoutError
+from six.moves.urllib.parse import urlparse
+
+from ..const import LABEL_PROJECT, LABEL_SERVICE
+from .errors import UserError
+from .multiplexer import Multiplexer
+
+
+log = logging.getLogger(__name__)
+
+
+# A container label which pins a service's containers to one host, given
+# by its address or hostname
+LABEL_HOST = 'com.docker.compose.host'
+
+# Methods whose first argument is the id or name of a container, and which
+# are sent to the host the container is on. These are the ones `Container`
+# and dockerpty call.
+CONTAINER_METHODS = [
+    'attach',
+    'attach_socket',
+    'diff',
+    'export',
+    'inspect_container',
+    'kill',
+    'logs',
+    'pause',
+    'port',
+    'rename',
+    'resize',
+    'restart',
+    'start',
+    'stop',
+    'top',
+    'unpause',
+    'wait',
+]
+
+# Methods whose first argument is the id of an exec instance
+EXEC_METHODS = ['exec_inspect', 'exec_resize', 'exec_start']
+
+
+def spread(hosts, service, project):
+    """Place a container on the host with the fewest containers of its
+    service, and then of its project.
+    """
+    return min(hosts, key=lambda host: (host.count(service), host.count(project)))
+
+
+def binpack(hosts, service, project):
+    """Place a container on the host with the most containers of its
+    project, among those with fewer containers of it than CPUs, so that
+    hosts are filled one at a time. Once every host is full, containers are
+    spread.
+    """
+    with_room = [host for host in hosts if host.count(project) < host.cpus()]
+    if not with_room:
+        return spread(hosts, service, project)
+    return max(with_room, key=lambda host: (host.count(project), -hosts.index(host)))
+
+
+PLACEMENT_STRATEGIES = {
+    'spread': spread,
+    'binpack': binpack,
+}
+
+
+def get_strategy(name):
+    try:
+        return PLACEMENT_STRATEGIES[name]
+    except KeyError:
+        raise UserError(
+            'Unknown placement strategy "%s", should be one of: %s' % (
+                name, ', '.join(sorted(PLACEMENT_STRATEGIES))))
+
+
+class DockerHost(object):
+    """One of the hosts of a :class:`MultiHostClient`, and the containers it
+    knows to be on it.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.containers = {}
+        self.names = {}
+        self.ncpu = None
+
+    @property
+    def base_url(self):
+        return self.client.base_url
+
+    def matches(self, name):
+        return name in (self.base_url, urlparse(self.base_url).hostname)
+
+    def add(self, container_id, labels, names=()):
+        self.containers[container_id] = labels or {}
+        for name in names:
+            self.names[name.lstrip('/')] = container_id
+
+    def has(self, container_id):
+        return container_id in self.containers or container_id in self.names
+
+    def remove(self, container_id):
+        container_id = self.names.get(container_id, container_id)
+        self.containers.pop(container_id, None)
+        for name, other_id in list(self.names.items()):
+            if other_id == container_id:
+                del self.names[name]
+
+    def count(self, label):
+        """The number of containers on this host with the `label=value`
+        pair `label`.
+        """
+        name, value = label
+        return sum(1 for labels in self.containers.values() if labels.get(name) == value)
+
+    def cpus(self):
+        if self.ncpu is None:
+            self.ncpu = self.client.info().get('NCPU') or 1
+        return self.ncpu
+
+
+class MultiHostClient(object):
+    """
+    Sends each request to one or all of several Docker clients, as if they
+    were a single daemon.
+    """
+
+    def __init__(self, clients, strategy=spread):
+        self.hosts = [DockerHost(client) for client in clients]
+        self.strategy = strategy
+        self.exec_hosts = {}
+        self.lock = threading.RLock()
+
+    @property
+    def base_url(self):
+        return ', '.join(host.base_url for host in self.hosts)
+
+    def __getattr__(self, name):
+        if name in CONTAINER_METHODS:
+            return self._routed(name, self.host_of)
+        if name in EXEC_METHODS:
+            return self._routed(name, lambda exec_id: self.exec_hosts[get_id(exec_id)])
+        raise AttributeError(name)
+
+    def _routed(self, name, get_host):
+        def call(resource_id, *args, **kwargs):
+            return getattr(get_host(resource_id).client, name)(resource_id, *args, **kwargs)
+        return call
+
+    def host_of(self, container_id):
+        """Return the host a container is on, asking each host for it if it
+        hasn't been seen in a listing.
+        """
+        for host in self.hosts:
+            if host.has(container_id):
+                return host
+
+        def find(host):
+            try:
+                container = host.client.inspect_container(container_id)
+            except APIError as e:
+                if e.response.status_code == 404:
+                    return None
+                raise
+            return container
+
+        found = each_host(self.hosts, find)
+        for host, container in zip(self.hosts, found):
+            if container is not None:
+                with self.lock:
+                    host.add(
+                        container['Id'],
+                        container['Config'].get('Labels'),
+                        [container['Name']])
+                return host
+
+        # Let the first host report the missing container
+        return self.hosts[0]
+
+    def containers(self, **kwargs):
+        listings = each_host(self.hosts, lambda host: host.client.containers(**kwargs))
+
+        with self.lock:
+            for host, listing in zip(self.hosts, listings):
+                for container in listing:
+                    host.add(
+                        container['Id'],
+                        container.get('Labels'),
+                        container.get('Names') or [])
+
+        return list(itertools.chain.from_iterable(listings))
+
+    def create_container(self, **options):
+        labels = options.get('labels') or {}
+        pending = object()
+
+        with self.lock:
+            host = self.place(options)
+            # Count the container before it's created, so that containers
+            # created at the same time are placed with it counted
+            host.add(pending, labels)
+
+        try:
+            response = host.client.create_container(**options)
+        except Exception:
+            with self.lock:
+                host.remove(pending)
+            raise
+
+        # Swap the placeholder for the container at once, so that it's
+        # counted throughout
+        with self.lock:
+            host.remove(pending)
+            host.add(response['Id'], labels, [options['name']] if options.get('name') else [])
+        return response
+
+    def place(self, options):
+        """Choose the host to create a container with `options` on.
+
+        A container is created on the host given by its `LABEL_HOST` label,
+        or else on the host of the container it replaces, or of the
+        containers it links to or shares volumes or a network with, as it
+        can't reach containers on other hosts. Otherwise its host is chosen
+        by the placement strategy.
+        """
+        labels = options.get('labels') or {}
+
+        if labels.get(LABEL_HOST):
+            for host in self.hosts:
+                if host.matches(labels[LABEL_HOST]):
+                    return host
+            raise UserError('%s is labelled to run on %s, which isn\'t one of %s' % (
+                options.get('name'), labels[LABEL_HOST], self.base_url))
+
+        dependencies = get_dependencies(options)
+        if dependencies:
+            hosts = set(self.host_of(dependency) for dependency in dependencies)
+            if len(hosts) > 1:
+                raise UserError(
+                    '%s depends on containers on different hosts: %s' % (
+                        options.get('name'), ', '.join(sorted(dependencies))))
+            return hosts.pop()
+
+        return self.strategy(
+            self.hosts,
+            (LABEL_SERVICE, labels.get(LABEL_SERVICE)),
+            (LABEL_PROJECT, labels.get(LABEL_PROJECT)))
+
+    def remove_container(self, container_id, **kwargs):
+        host = self.host_of(container_id)
+        host.client.remove_container(container_id, **kwargs)
+        with self.lock:
+            host.remove(container_id)
+
+    def exec_create(self, container_id, *args, **kwargs):
+        host = self.host_of(container_id)
+        response = host.client.exec_create(container_id, *args, **kwargs)
+        self.exec_hosts[get_id(response)] = host
+        return response
+
+    def images(self, **kwargs):
+        """List the images of the first host, with only the tags which are
+        on every host, as a container can be created on any of them.
+        """
+        listings = each_host(self.hosts, lambda host: host.client.images(**kwargs))
+        on_every_host = set.intersection(*[
+            set(tag for image in listing for tag in image.get('RepoTags') or [])
+            for listing in listings
+        ])
+
+        images = []
+        for image in listings[0]:
+            image = dict(image)
+            image['RepoTags'] = [
+                tag for tag in image.get('RepoTags') or []
+                if tag in on_every_host
+            ]
+            images.append(image)
+        return images
+
+    def inspect_image(self, image):
+        """Inspect an image on every host, and return it from the first.
+        An image which is missing from any host is reported as missing, so
+        that it's pulled or built.
+        """
+        return each_host(self.hosts, lambda host: host.client.inspect_image(image))[0]
+
+    def build(self, *args, **kwargs):
+        return self._on_each_host('build', *args, **kwargs)
+
+    def pull(self, *args, **kwargs):
+        return self._on_each_host('pull', *args, **kwargs)
+
+    def _on_each_host(self, name, *args, **kwargs):
+        """Call a method on each host in turn, chaining their output if it's
+        streamed."""
+        if not kwargs.get('stream'):
+            return ''.join(
+                getattr(host.client, name)(*args, **kwargs)
+                for host in self.hosts)
+
+        def stream():
+            for host in self.hosts:
+                for chunk in getattr(host.client, name)(*args, **kwargs):
+                    yield chunk
+        return stream()
+
+    def events(self, since=None, **kwargs):
+        """Follow the events of every host.
+
+        A host's stream which times out while it's idle is subscribed to
+        again on its own, from the time of its last event, so the streams of
+        the other hosts aren't dropped with it. Once the events stop being
+        iterated, each stream stops being read at its next event or timeout.
+        """
+        stopped = threading.Event()
+
+        def follow(host):
+            host_since = since
+            while not stopped.is_set():
+                try:
+                    for event in host.client.events(since=host_since, **kwargs):
+                        yield event
+                        if stopped.is_set():
+                            return
+                        if isinstance(event, dict):
+                            host_since = event.get('time', host_since)
+                    return
+                except ReadTimeoutError:
+                    log.debug("Resubscribing to events of %s since %s",
+                              host.base_url, host_since)
+
+        try:
+            for event in Multiplexer([follow(host) for host in self.hosts]).loop():
+                yield event
+        finally:
+            stopped.set()
+
+    def version(self):
+        return self.hosts[0].client.version()
+
+    def info(self):
+        return self.hosts[0].client.info()
+
+    def close(self):
+        for host in self.hosts:
+            host.client.close()
+
+
+def get_id(resource):
+    # docker-py returns exec instances as dicts, and accepts them as ids
+    if isinstance(resource, dict):
+        return resource.get('Id')
+    return resource
+
+
+def get_dependencies(options):
+    """Return the names or ids of the containers a container with `options`
+    links to, or shares volumes or a network with.
+    """
+    host_config = options.get('host_config') or {}
+    dependencies = set()
+
+    for link in host_config.get('Links') or []:
+        dependencies.add(link.split(':')[0].lstrip('/'))
+
+    for volumes_from in host_config.get('VolumesFrom') or []:
+        dependencies.add(volumes_from.split(':')[0])
+
+    network_mode = host_config.get('NetworkMode') or ''
+    if network_mode.startswith('container:'):
+        dependencies.add(network_mode[len('container:'):])
+
+    previous = (options.get('environment') or {}).get('affinity:container')
+    if previous:
+        dependencies.add(previous.lstrip('='))
+
+    return dependencies
+
+
+def each_host(hosts, func):
+    """Call `func` with each of `hosts` at the same time, and return the
+    results in the same order. If any call fails, the first error is
+    raised once they've all returned.
+    """
+    results = [None] * len(hosts)
+    errors = [None] * len(hosts)
+
+    def call(i, host):
+        try:
+            results[i] = func(host)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [
+        threading.Thread(target=call, args=(i, host))
+        for i, host in enumerate(hosts)
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
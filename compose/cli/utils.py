@@ -4,11 +4,9 @@ from __future__ import division
 
 from .. import __version__
 import datetime
-from docker import version as docker_py_version
 import os
 import platform
 import subprocess
-import ssl
 
 
 def yesno(prompt, default=None):
@@ -131,6 +129,8 @@ def get_version_info(scope):
     if scope == 'compose':
         return versioninfo
     elif scope == 'full':
+        from docker import version as docker_py_version
+        import ssl
         return versioninfo + '\n' \
             + "docker-py version: %s\n" % docker_py_version \
             + "%s version: %s\n" % (platform.python_implementation(), platform.python_version()) \
@@ -1,12 +1,14 @@
 import logging
 import os
+import re
 import sys
-import yaml
 from collections import namedtuple
 
 import six
 
 from compose.cli.utils import find_candidates_in_parent_dirs
+from compose.const import SPREAD_POLICIES
+from compose.readiness import READY_CHECK_KEYS, READY_CHECK_TYPES
 
 
 DOCKER_CONFIG_KEYS = [
@@ -55,6 +57,9 @@ ALLOWED_KEYS = DOCKER_CONFIG_KEYS + [
     'expose',
     'external_links',
     'name',
+    'pin_cpus',
+    'ready_check',
+    'spread',
 ]
 
 DOCKER_CONFIG_HINTS = {
@@ -90,6 +95,7 @@ ConfigDetails = namedtuple('ConfigDetails', 'config working_dir filename')
 
 def find(base_dir, filename):
     if filename == '-':
+        import yaml
         return ConfigDetails(yaml.safe_load(sys.stdin), os.getcwd(), None)
 
     if filename:
@@ -260,6 +266,15 @@ def process_container_options(service_dict, working_dir=None):
     if 'labels' in service_dict:
         service_dict['labels'] = parse_labels(service_dict['labels'])
 
+    if 'ready_check' in service_dict:
+        validate_ready_check(service_dict['name'], service_dict['ready_check'])
+
+    if 'pin_cpus' in service_dict:
+        validate_pin_cpus(service_dict)
+
+    if 'spread' in service_dict:
+        validate_spread(service_dict['name'], service_dict['spread'])
+
     return service_dict
 
 
@@ -443,6 +458,76 @@ def validate_paths(service_dict):
             raise ConfigurationError("build path %s either does not exist or is not accessible." % build_path)
 
 
+def validate_ready_check(service_name, ready_check):
+    error_prefix = "Invalid 'ready_check' configuration for %s service:" % service_name
+
+    if not isinstance(ready_check, dict):
+        raise ConfigurationError("%s must be a dictionary" % error_prefix)
+
+    for k in ready_check:
+        if k not in READY_CHECK_KEYS:
+            raise ConfigurationError(
+                "%s unsupported option '%s'" % (error_prefix, k)
+            )
+
+    check_types = [k for k in READY_CHECK_TYPES if k in ready_check]
+    if len(check_types) != 1:
+        raise ConfigurationError(
+            "%s specify exactly one of %s" % (error_prefix, ", ".join(READY_CHECK_TYPES))
+        )
+
+    if 'port' in ready_check:
+        port = ready_check['port']
+        if (isinstance(port, bool)
+                or not isinstance(port, six.integer_types + six.string_types)
+                or not str(port).isdigit()
+                or not 0 < int(port) < 65536):
+            raise ConfigurationError("%s 'port' must be a port number" % error_prefix)
+
+    if 'log' in ready_check:
+        if not isinstance(ready_check['log'], six.string_types):
+            raise ConfigurationError("%s 'log' must be a string" % error_prefix)
+        try:
+            re.compile(ready_check['log'], re.MULTILINE)
+        except re.error as e:
+            raise ConfigurationError(
+                "%s 'log' is not a valid regular expression: %s" % (error_prefix, e))
+
+    if 'command' in ready_check:
+        command = ready_check['command']
+        if not (isinstance(command, six.string_types) or (
+                isinstance(command, list) and command
+                and all(isinstance(arg, six.string_types) for arg in command))):
+            raise ConfigurationError(
+                "%s 'command' must be a string or a list of strings" % error_prefix)
+
+    for k in ['timeout', 'interval']:
+        if k in ready_check and (
+                isinstance(ready_check[k], bool)
+                or not isinstance(ready_check[k], (int, float))
+                or ready_check[k] <= 0):
+            raise ConfigurationError("%s '%s' must be a positive number" % (error_prefix, k))
+
+
+def validate_pin_cpus(service_dict):
+    error_prefix = "Invalid 'pin_cpus' configuration for %s service:" % service_dict['name']
+    pin_cpus = service_dict['pin_cpus']
+
+    if isinstance(pin_cpus, bool) or not isinstance(pin_cpus, int) or pin_cpus < 1:
+        raise ConfigurationError("%s must be a positive integer" % error_prefix)
+
+    if 'cpuset' in service_dict:
+        raise ConfigurationError("%s it can't be used with 'cpuset'" % error_prefix)
+
+
+def validate_spread(service_name, spread):
+    if spread not in SPREAD_POLICIES:
+        raise ConfigurationError(
+            "Invalid 'spread' configuration for %s service: should be one of %s" % (
+                service_name, ", ".join(SPREAD_POLICIES))
+        )
+
+
 def merge_path_mappings(base, override):
     d = dict_from_path_mappings(base)
     d.update(dict_from_path_mappings(override))
@@ -530,6 +615,7 @@ def get_service_name_from_net(net_config):
 
 
 def load_yaml(filename):
+    import yaml
     try:
         with open(filename, 'r') as fh:
             return yaml.safe_load(fh)
@@ -6,3 +6,7 @@ LABEL_PROJECT = 'com.docker.compose.project'
 LABEL_SERVICE = 'com.docker.compose.service'
 LABEL_VERSION = 'com.docker.compose.version'
 LABEL_CONFIG_HASH = 'com.docker.compose.config-hash'
+
+# The values of a service's `spread` option: whether Swarm should prefer
+# to, or must, place its containers on different nodes
+SPREAD_POLICIES = ['soft', 'hard']
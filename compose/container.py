@@ -21,12 +21,24 @@ class Container(object):
     def from_ps(cls, client, dictionary, **kwargs):
         """
         Construct a container object from the output of GET /containers/json.
+        The labels, running state and ports are kept when the listing
+        includes them, so that reading them doesn't need an inspect.
         """
         new_dictionary = {
             'Id': dictionary['Id'],
             'Image': dictionary['Image'],
             'Name': '/' + get_container_name(dictionary),
         }
+        if 'Labels' in dictionary:
+            new_dictionary['Config'] = {'Labels': dictionary['Labels'] or {}}
+        if 'Status' in dictionary:
+            new_dictionary['State'] = {
+                'Running': (dictionary['Status'] or '').startswith('Up'),
+            }
+        if dictionary.get('Ports') is not None:
+            new_dictionary['NetworkSettings'] = {
+                'Ports': get_port_bindings(dictionary['Ports']),
+            }
         return cls(client, new_dictionary, **kwargs)
 
     @classmethod
@@ -35,8 +47,23 @@ class Container(object):
 
     @classmethod
     def create(cls, client, **options):
+        """
+        Create a container. The result is built from the create options
+        rather than inspected, so any other fields are only fetched from
+        the daemon if they're read.
+        """
         response = client.create_container(**options)
-        return cls.from_id(client, response['Id'])
+        if 'name' not in options:
+            return cls.from_id(client, response['Id'])
+
+        return cls(client, {
+            'Id': response['Id'],
+            'Image': options['image'],
+            'Name': '/' + options['name'],
+            'Config': {
+                'Labels': options.get('labels') or {},
+            },
+        })
 
     @property
     def id(self):
@@ -58,6 +85,13 @@ class Container(object):
     def name(self):
         return self.dictionary['Name'][1:]
 
+    @property
+    def is_renamed(self):
+        """Whether the container has the temporary name it's given while it's
+        being recreated.
+        """
+        return self.name.startswith('%s_' % self.short_id)
+
     @property
     def name_without_project(self):
         return '{0}_{1}'.format(self.labels.get(LABEL_SERVICE), self.number)
@@ -72,7 +106,6 @@ class Container(object):
 
     @property
     def ports(self):
-        self.inspect_if_not_inspected()
         return self.get('NetworkSettings.Ports') or {}
 
     @property
@@ -120,12 +153,19 @@ class Container(object):
 
         :param key: a string using dotted notation for nested dictionary
                     lookups
-        """
-        self.inspect_if_not_inspected()
 
+        The container is only inspected if it hasn't been already, and the
+        value isn't in the fields it was constructed with.
+        """
         def get_value(dictionary, key):
             return (dictionary or {}).get(key)
 
+        if not self.has_been_inspected:
+            value = reduce(get_value, key.split('.'), self.dictionary)
+            if value is not None:
+                return value
+            self.inspect()
+
         return reduce(get_value, key.split('.'), self.dictionary)
 
     def get_local_port(self, port, protocol='tcp'):
@@ -199,3 +239,21 @@ def get_container_name(container):
     # ps
     shortest_name = min(container['Names'], key=lambda n: len(n.split('/')))
     return shortest_name.split('/')[-1]
+
+
+def get_port_bindings(ps_ports):
+    """
+    Convert the ports of a container listing to the format of
+    NetworkSettings.Ports in an inspect, where unpublished ports map to None.
+    """
+    bindings = {}
+    for port in ps_ports:
+        key = '%s/%s' % (port['PrivatePort'], port.get('Type', 'tcp'))
+        if 'PublicPort' not in port:
+            bindings.setdefault(key, None)
+            continue
+        bindings[key] = (bindings.get(key) or []) + [{
+            'HostIp': port.get('IP', ''),
+            'HostPort': str(port['PublicPort']),
+        }]
+    return bindings
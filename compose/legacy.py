@@ -1,13 +1,19 @@
 import logging
+import os
 import re
+import weakref
 
 from .const import LABEL_VERSION
 from .container import get_container_name, Container
+from .utils import parallel_execute, ParallelExecutionError
 
 
 log = logging.getLogger(__name__)
 
 
+# Number of containers migrate_project_to_labels recreates at the same time
+DEFAULT_MIGRATION_LIMIT = 10
+
 # TODO: remove this section when migrate_project_to_labels is removed
 NAME_RE = re.compile(r'^([^_]+)_([^_]+)_(run_)?(\d+)$')
 
@@ -52,24 +58,37 @@ def check_for_legacy_containers(
     """Check if there are containers named using the old naming convention
     and warn the user that those containers may need to be migrated to
     using labels, so that compose can find them.
+
+    The check can be turned off by setting COMPOSE_SKIP_LEGACY_CHECK, once
+    a host is known to have been migrated.
     """
-    containers = get_legacy_containers(client, project, services, one_off=False)
+    if os.environ.get('COMPOSE_SKIP_LEGACY_CHECK', '') != '':
+        return
 
-    if containers:
-        one_off_containers = get_legacy_containers(client, project, services, one_off=True)
+    legacy_containers = get_project_legacy_containers(client, project)
+    containers = _select(legacy_containers, services, one_off=False)
+    one_off_containers = _select(legacy_containers, services, one_off=True)
 
+    if containers:
+        forget_legacy_containers(client, project)
         raise LegacyContainersError(
             [c.name for c in containers],
             [c.name for c in one_off_containers],
         )
 
-    if not allow_one_off:
-        one_off_containers = get_legacy_containers(client, project, services, one_off=True)
+    if not allow_one_off and one_off_containers:
+        forget_legacy_containers(client, project)
+        raise LegacyOneOffContainersError(
+            [c.name for c in one_off_containers],
+        )
+
 
-        if one_off_containers:
-            raise LegacyOneOffContainersError(
-                [c.name for c in one_off_containers],
-            )
+def _select(legacy_containers, services, one_off=False):
+    return [
+        container
+        for service in services
+        for container in legacy_containers.get((service, one_off), [])
+    ]
 
 
 class LegacyError(Exception):
@@ -111,7 +130,11 @@ def add_labels(project, container):
     service.recreate_container(container)
 
 
-def migrate_project_to_labels(project):
+def migrate_project_to_labels(project, limit=DEFAULT_MIGRATION_LIMIT):
+    """Recreate a project's legacy containers with labels, up to `limit` at
+    a time. A container is only recreated once all the containers of the
+    services it depends on have been.
+    """
     log.info("Running migration to labels for project %s", project.name)
 
     containers = get_legacy_containers(
@@ -121,8 +144,33 @@ def migrate_project_to_labels(project):
         one_off=False,
     )
 
+    containers_by_service = {}
     for container in containers:
-        add_labels(project, container)
+        _, service_name, _ = parse_name(container.name)
+        containers_by_service.setdefault(service_name, []).append(container)
+
+    def get_deps(container):
+        _, service_name, _ = parse_name(container.name)
+        service = project.get_service(service_name)
+        return [
+            dep
+            for name in service.get_dependency_names()
+            for dep in containers_by_service.get(name, [])
+        ]
+
+    _, errors = parallel_execute(
+        objects=containers,
+        obj_callable=lambda c: add_labels(project, c),
+        msg_index=lambda c: c.name,
+        msg="Migrating",
+        limit=limit,
+        get_deps=get_deps,
+    )
+    if errors:
+        # Keep the cached legacy containers, as some are still unmigrated
+        raise ParallelExecutionError("Migrating", errors)
+
+    forget_legacy_containers(project.client, project.name)
 
 
 def get_legacy_containers(
@@ -131,30 +179,63 @@ def get_legacy_containers(
         services,
         one_off=False):
 
-    return list(_get_legacy_containers_iter(
-        client,
-        project,
+    return _select(
+        index_legacy_containers(client, project),
         services,
         one_off=one_off,
-    ))
+    )
 
 
-def _get_legacy_containers_iter(
-        client,
-        project,
-        services,
-        one_off=False):
+# Legacy containers found on each client for each project, so that the
+# host's containers are only listed once per command. Each command starts
+# without them, and clients are held weakly, so a long-running process
+# neither keeps old clients alive nor stops looking for legacy containers.
+_legacy_containers_cache = weakref.WeakKeyDictionary()
+
+
+def get_project_legacy_containers(client, project):
+    projects = _legacy_containers_cache.setdefault(client, {})
+    if project not in projects:
+        projects[project] = index_legacy_containers(client, project)
+    return projects[project]
+
+
+def forget_legacy_containers(client=None, project=None):
+    """Forget the legacy containers found for `project` on `client`, or all
+    of them if no client is given.
+    """
+    if client is None:
+        _legacy_containers_cache.clear()
+    else:
+        _legacy_containers_cache.get(client, {}).pop(project, None)
+
+
+def index_legacy_containers(client, project):
+    """Return a project's unlabelled containers, keyed by
+    `(service name, one_off)`, from a single listing of the host's
+    containers. Daemons which support it only return containers whose name
+    contains the project name.
+    """
+    legacy_containers = {}
+
+    for container in client.containers(all=True, filters={'name': project}):
+        if LABEL_VERSION in (container.get('Labels') or {}):
+            continue
+
+        name = get_container_name(container)
+        match = NAME_RE.match(name) if name else None
+        if match is None:
+            continue
 
-    containers = client.containers(all=True)
+        container_project, service, run, _number = match.groups()
+        if container_project != project:
+            continue
 
-    for service in services:
-        for container in containers:
-            if LABEL_VERSION in (container.get('Labels') or {}):
-                continue
+        key = (service, run is not None)
+        legacy_containers.setdefault(key, []).append(
+            Container.from_ps(client, container))
 
-            name = get_container_name(container)
-            if has_container(project, service, name, one_off=one_off):
-                yield Container.from_ps(client, container)
+    return legacy_containers
 
 
 def has_container(project, service, name, one_off=False):
@@ -2,15 +2,27 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from functools import reduce
 import logging
+import math
+import threading
+import time
 
 from docker.errors import APIError
 
+from .autobuild import ContextWatcher
 from .config import get_service_name_from_net, ConfigurationError
 from .const import DEFAULT_TIMEOUT, LABEL_PROJECT, LABEL_SERVICE, LABEL_ONE_OFF
 from .container import Container
 from .legacy import check_for_legacy_containers
-from .service import Service
-from .utils import parallel_execute
+from .state import ProjectState
+from .service import (
+    ConvergencePlan,
+    Service,
+    get_duplicate_containers,
+    get_image_ids,
+    get_repo_tag,
+)
+from .utils import get_error_message, parallel_execute, ParallelExecutionError
+from .watch import ProjectWatcher
 
 log = logging.getLogger(__name__)
 
@@ -65,10 +77,14 @@ class Project(object):
         self.client = client
 
     def labels(self, one_off=False):
-        return [
-            '{0}={1}'.format(LABEL_PROJECT, self.name),
-            '{0}={1}'.format(LABEL_ONE_OFF, "True" if one_off else "False"),
-        ]
+        """Labels to filter the project's containers by. `one_off=None`
+        matches both one-off and service containers.
+        """
+        labels = ['{0}={1}'.format(LABEL_PROJECT, self.name)]
+        if one_off is not None:
+            labels.append(
+                '{0}={1}'.format(LABEL_ONE_OFF, "True" if one_off else "False"))
+        return labels
 
     @classmethod
     def from_dicts(cls, name, service_dicts, client):
@@ -140,6 +156,18 @@ class Project(object):
             [uniques.append(s) for s in services if s not in uniques]
             return uniques
 
+    def get_dependent_names(self, service_names):
+        """
+        Returns `service_names` and the names of the services which depend on
+        any of them, directly or through other services, in dependency order.
+        """
+        names = set(service_names)
+        # Services are sorted so that each comes after its dependencies
+        for service in self.services:
+            if names.intersection(service.get_dependency_names()):
+                names.add(service.name)
+        return [service.name for service in self.services if service.name in names]
+
     def get_links(self, service_dict):
         links = []
         if 'links' in service_dict:
@@ -163,11 +191,10 @@ class Project(object):
                     service = self.get_service(volume_name)
                     volumes_from.append(service)
                 except NoSuchService:
-                    try:
-                        container = Container.from_id(self.client, volume_name)
-                        volumes_from.append(container)
-                    except APIError:
-                        raise ConfigurationError('Service "%s" mounts volumes from "%s", which is not the name of a service or container.' % (service_dict['name'], volume_name))
+                    volumes_from.append(ExternalContainer(
+                        self.client,
+                        volume_name,
+                        'Service "%s" mounts volumes from "%s", which is not the name of a service or container.' % (service_dict['name'], volume_name)))
             del service_dict['volumes_from']
         return volumes_from
 
@@ -179,10 +206,10 @@ class Project(object):
                 try:
                     net = self.get_service(net_name)
                 except NoSuchService:
-                    try:
-                        net = Container.from_id(self.client, net_name)
-                    except APIError:
-                        raise ConfigurationError('Service "%s" is trying to use the network of "%s", which is not the name of a service or container.' % (service_dict['name'], net_name))
+                    net = ExternalContainer(
+                        self.client,
+                        net_name,
+                        'Service "%s" is trying to use the network of "%s", which is not the name of a service or container.' % (service_dict['name'], net_name))
             else:
                 net = service_dict['net']
 
@@ -194,82 +221,606 @@ class Project(object):
         return net
 
     def start(self, service_names=None, **options):
-        for service in self.get_services(service_names):
-            service.start(**options)
+        self._execute_in_dependency_order(
+            self.get_services(service_names),
+            lambda service: [
+                c for c in service.containers(stopped=True) if not c.is_running
+            ],
+            lambda c: c.start(**options),
+            "Starting",
+        )
+
+    def stop(self, service_names=None, ordered=False, deadline=None, **options):
+        """Stop the running containers of `service_names`, all at once.
+
+        If `ordered` is set, services are stopped in waves instead, each
+        after all of the services that depend on it. If the whole shutdown
+        takes longer than `deadline` seconds, the containers which haven't
+        stopped yet are killed.
+        """
+        if ordered or deadline is not None:
+            return self._stop_in_waves(
+                service_names, ordered=ordered, deadline=deadline, **options)
 
-    def stop(self, service_names=None, **options):
-        parallel_execute(
+        _, errors = parallel_execute(
             objects=self.containers(service_names),
             obj_callable=lambda c: c.stop(**options),
             msg_index=lambda c: c.name,
             msg="Stopping"
         )
+        if errors:
+            raise ParallelExecutionError("Stopping", errors)
+
+    def _stop_in_waves(self,
+                       service_names=None,
+                       ordered=False,
+                       deadline=None,
+                       timeout=DEFAULT_TIMEOUT):
+        end = time.time() + deadline if deadline is not None else None
+        containers = self.containers(service_names)
+        if ordered:
+            waves = [
+                [c for c in containers if c.labels.get(LABEL_SERVICE) in wave]
+                for wave in get_stop_waves(self.get_services(service_names))
+            ]
+        else:
+            waves = [containers]
+        failed = {}
+
+        for i, wave in enumerate(waves):
+            wave_timeout = timeout
+            if end is not None:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    to_kill = [c for later_wave in waves[i:] for c in later_wave]
+                    log.warn(
+                        'Shutdown took longer than %s seconds, killing %s remaining containers' %
+                        (deadline, len(to_kill)))
+                    _, errors = parallel_execute(
+                        objects=to_kill,
+                        obj_callable=lambda c: c.kill(),
+                        msg_index=lambda c: c.name,
+                        msg="Killing"
+                    )
+                    failed.update(errors)
+                    break
+                # Rounded up, as the timer of _stop_wave kills at the deadline
+                wave_timeout = min(timeout, int(math.ceil(remaining)))
+
+            # Later waves are still stopped if a container fails to stop
+            failed.update(self._stop_wave(wave, wave_timeout, end, deadline))
+
+        if failed:
+            raise ParallelExecutionError("Stopping", failed)
+
+    def _stop_wave(self, wave, timeout, end, deadline):
+        """Stop the containers of `wave` in parallel. If they haven't all
+        stopped by the time `end`, those still stopping are killed. Returns
+        the errors of those which failed to stop.
+        """
+        stopped = set()
+        lock = threading.Lock()
+
+        def stop(container):
+            container.stop(timeout=timeout)
+            with lock:
+                stopped.add(container.name)
+
+        def kill_remaining():
+            with lock:
+                to_kill = [c for c in wave if c.name not in stopped]
+            log.warn(
+                'Shutdown took longer than %s seconds, killing %s remaining containers' %
+                (deadline, len(to_kill)))
+            # The stops are still drawing their progress
+            parallel_execute(
+                objects=to_kill,
+                obj_callable=lambda c: c.kill(),
+                msg_index=lambda c: c.name,
+                msg="Killing",
+                quiet=True,
+            )
+
+        timer = None
+        if end is not None:
+            timer = threading.Timer(max(end - time.time(), 0), kill_remaining)
+            timer.daemon = True
+            timer.start()
+
+        try:
+            _, errors = parallel_execute(
+                objects=wave,
+                obj_callable=stop,
+                msg_index=lambda c: c.name,
+                msg="Stopping"
+            )
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        return errors
 
     def kill(self, service_names=None, **options):
-        parallel_execute(
+        _, errors = parallel_execute(
             objects=self.containers(service_names),
             obj_callable=lambda c: c.kill(**options),
             msg_index=lambda c: c.name,
             msg="Killing"
         )
+        if errors:
+            raise ParallelExecutionError("Killing", errors)
 
     def remove_stopped(self, service_names=None, **options):
         all_containers = self.containers(service_names, stopped=True)
         stopped_containers = [c for c in all_containers if not c.is_running]
-        parallel_execute(
+        _, errors = parallel_execute(
             objects=stopped_containers,
             obj_callable=lambda c: c.remove(**options),
             msg_index=lambda c: c.name,
             msg="Removing"
         )
+        if errors:
+            raise ParallelExecutionError("Removing", errors)
+
+    def down(self, service_names=None, timeout=DEFAULT_TIMEOUT, remove_volumes=False):
+        """
+        Stop and remove the containers of `service_names`, including one-off
+        containers, from a single container listing. Each container is
+        removed as soon as it has stopped, without waiting for the others.
+        """
+        if service_names:
+            self.validate_service_names(service_names)
+        else:
+            service_names = self.service_names
+
+        listed = [
+            container
+            for container in self.client.containers(
+                all=True,
+                filters={'label': '{0}={1}'.format(LABEL_PROJECT, self.name)})
+            if (container.get('Labels') or {}).get(LABEL_SERVICE) in service_names
+        ]
+        self._stop_and_remove(
+            listed,
+            "Stopping and removing",
+            timeout=timeout,
+            v=remove_volumes,
+        )
+
+    def _stop_and_remove(self, listed, msg, timeout=DEFAULT_TIMEOUT, **options):
+        """
+        Stop and remove containers from a container listing in parallel. A
+        container is only stopped if the listing shows it as running.
+        """
+        running = set(
+            container['Id']
+            for container in listed
+            if (container.get('Status') or '').startswith('Up')
+        )
+
+        def stop_and_remove(container):
+            if container.id in running:
+                container.stop(timeout=timeout)
+            container.remove(**options)
+
+        _, errors = parallel_execute(
+            objects=[Container.from_ps(self.client, c) for c in listed],
+            obj_callable=stop_and_remove,
+            msg_index=lambda c: c.name,
+            msg=msg
+        )
+        if errors:
+            raise ParallelExecutionError(msg, errors)
 
     def restart(self, service_names=None, **options):
-        for service in self.get_services(service_names):
-            service.restart(**options)
+        """Restart the containers of `service_names` in parallel. Like an
+        ordered stop, a container is only restarted once the containers of
+        the services which depend on it have been.
+        """
+        self._execute_in_dependency_order(
+            self.get_services(service_names),
+            lambda service: service.containers(),
+            lambda c: c.restart(**options),
+            "Restarting",
+            reverse=True,
+        )
+
+    def scale(self, service_nums, timeout=DEFAULT_TIMEOUT):
+        """Scale several services at once. `service_nums` maps service
+        names to the number of containers each should have.
+        """
+        services = sorted(
+            (self.get_service(name) for name in service_nums),
+            key=self.services.index)
+
+        self._run_in_dependency_order(
+            services,
+            # Services are scaled at the same time, so only this progress
+            # is drawn
+            lambda service: service.scale(
+                service_nums[service.name], timeout=timeout, quiet=True),
+            "Scaling",
+        )
+
+    def _execute_in_dependency_order(self, services, get_containers, func, msg, reverse=False):
+        """
+        Call `func` for the containers of each of `services` in parallel. A
+        container is only passed to `func` once it has returned for all of
+        the containers of the services its own service depends on, or with
+        `reverse`, of the services which depend on its own service.
+        """
+        containers = dict(
+            (service.name, get_containers(service))
+            for service in services
+        )
+
+        def get_dep_names(service):
+            if not reverse:
+                return service.get_dependency_names()
+            return [
+                other.name for other in services
+                if service.name in other.get_dependency_names()
+            ]
+
+        deps = dict(
+            (container.name, [
+                dep
+                for name in get_dep_names(service)
+                if name in containers
+                for dep in containers[name]
+            ])
+            for service in services
+            for container in containers[service.name]
+        )
+
+        results, errors = parallel_execute(
+            objects=[c for service in services for c in containers[service.name]],
+            obj_callable=func,
+            msg_index=lambda c: c.name,
+            msg=msg,
+            get_deps=lambda c: deps[c.name],
+        )
+        if errors:
+            raise ParallelExecutionError(msg, errors)
+        return results
 
     def build(self, service_names=None, no_cache=False):
-        for service in self.get_services(service_names):
+        services = self.get_services(service_names)
+        self._forget_state([s.name for s in services if s.can_be_built()])
+
+        for service in services:
             if service.can_be_built():
                 service.build(no_cache)
             else:
                 log.info('%s uses an image, skipping' % service.name)
 
+    def rebuild(self, service_names, limit=None, timeout=DEFAULT_TIMEOUT):
+        """
+        Build the images of `service_names`, at most `limit` at a time, and
+        then converge the services which built, along with the services
+        which depend on them. No other service is planned or touched. Each
+        service which fails to build is logged.
+        """
+        services = [s for s in self.get_services(service_names) if s.can_be_built()]
+        self._forget_state([s.name for s in services])
+
+        # Quiet, as the builds write their output as they go
+        built, errors = parallel_execute(
+            objects=services,
+            obj_callable=lambda service: service.build(),
+            msg_index=lambda service: service.name,
+            msg="Building",
+            limit=limit,
+            quiet=True,
+        )
+        for name, error in sorted(errors.items()):
+            log.error(get_error_message(error) or
+                      "Service '%s' failed to build: %s" % (name, error))
+        if not built:
+            return []
+
+        return self.up(
+            service_names=self.get_dependent_names(list(built)),
+            start_deps=False,
+            do_build=False,
+            timeout=timeout,
+        )
+
     def up(self,
            service_names=None,
            start_deps=True,
            allow_recreate=True,
            force_recreate=False,
            do_build=True,
-           timeout=DEFAULT_TIMEOUT):
+           timeout=DEFAULT_TIMEOUT,
+           batch_size=None,
+           start_first=False,
+           batch_delay=0):
 
         if force_recreate and not allow_recreate:
             raise ValueError("force_recreate and allow_recreate are in conflict")
 
         services = self.get_services(service_names, include_deps=start_deps)
 
-        for service in services:
-            service.remove_duplicate_containers()
+        state = ProjectState.load(self.name)
+
+        listed = self._remove_replaced_containers(
+            self._list_containers(services),
+            timeout=timeout,
+            state=state,
+        )
+        listed = self._remove_duplicate_containers(listed, timeout=timeout)
+
+        if allow_recreate and not force_recreate:
+            image_ids = self._get_image_ids(services, listed, state=state)
+        else:
+            image_ids = {}
 
         plans = self._get_convergence_plans(
             services,
             allow_recreate=allow_recreate,
             force_recreate=force_recreate,
+            listed=listed,
+            image_ids=image_ids,
+            unfinished=self._get_unfinished_recreates(services, listed, state=state),
         )
 
-        return [
-            container
-            for service in services
-            for container in service.execute_convergence_plan(
+        if state is not None and allow_recreate:
+            for service in services:
+                plan = plans[service.name]
+                state.plan_recreates(service.name, [
+                    c.number for c in plan.containers
+                    if plan.actions[c] == 'recreate'
+                ])
+            state.save()
+
+        # Images are built and pulled one at a time, so their output
+        # doesn't interleave
+        for service in services:
+            if plans[service.name].action in ('create', 'recreate'):
+                service.ensure_image_exists(do_build=do_build)
+
+        # Without readiness checks, nothing has to wait for a service, so
+        # services are converged one after the other. Otherwise each is
+        # converged once its dependencies are ready, several at once, so
+        # they log their progress instead of drawing it.
+        concurrent = any('ready_check' in service.options for service in services)
+
+        def converge(service):
+            containers = service.execute_convergence_plan(
                 plans[service.name],
                 do_build=do_build,
-                timeout=timeout
+                timeout=timeout,
+                batch_size=batch_size,
+                start_first=start_first,
+                batch_delay=batch_delay,
+                journal=state,
+                quiet=concurrent,
             )
+            return service.wait_until_ready(containers)
+
+        if concurrent:
+            results = self._run_in_dependency_order(
+                services, converge, "Converging", quiet=True)
+        else:
+            results = dict((service.name, converge(service)) for service in services)
+
+        if state is not None:
+            for service in services:
+                state.record(
+                    service.name,
+                    [c.id for c in results[service.name]],
+                    image_ids.get(service.name))
+            state.save()
+
+        return [
+            container
+            for service in services
+            for container in results[service.name]
+        ]
+
+    def watch(self, service_names=None, timeout=DEFAULT_TIMEOUT):
+        """
+        Keep the containers of the services converged as they die, are
+        removed or drift, until interrupted. See :class:`ProjectWatcher`.
+        """
+        services = self.get_services(service_names, include_deps=True)
+        ProjectWatcher(self, services, timeout=timeout).watch()
+
+    def autobuild(self, service_names=None, limit=1, interval=1, timeout=DEFAULT_TIMEOUT):
+        """
+        Rebuild and recreate services as the files in their build contexts
+        change, until interrupted. See :class:`ContextWatcher`.
+        """
+        services = self.get_services(service_names)
+        ContextWatcher(
+            self,
+            services,
+            interval=interval,
+            limit=limit,
+            timeout=timeout,
+        ).watch()
+
+    def _run_in_dependency_order(self, services, func, msg, quiet=False):
+        """
+        Call `func` for each of `services` in parallel, but only once it has
+        returned for each of the services that service depends on. Returns
+        the results keyed by service name. If any call fails, its dependents
+        are skipped and the first error, in dependency order, is raised.
+        """
+        by_name = dict((service.name, service) for service in services)
+        failures = {}
+
+        def call(service):
+            try:
+                return func(service)
+            except Exception as e:
+                failures[service.name] = e
+                raise
+
+        results, _ = parallel_execute(
+            objects=services,
+            obj_callable=call,
+            msg_index=lambda service: service.name,
+            msg=msg,
+            get_deps=lambda service: [
+                by_name[name]
+                for name in service.get_dependency_names()
+                if name in by_name
+            ],
+            quiet=quiet,
+        )
+
+        for service in services:
+            if service.name in failures:
+                raise failures[service.name]
+
+        return results
+
+    def _list_containers(self, services):
+        """
+        List the containers of `services`, except one-off containers, with a
+        single request. Returns the listing's data for each container.
+        """
+        service_names = [service.name for service in services]
+        return [
+            container
+            for container in self.client.containers(
+                all=True,
+                filters={'label': self.labels()})
+            if (container.get('Labels') or {}).get(LABEL_SERVICE) in service_names
+        ]
+
+    def _remove_duplicate_containers(self, listed, timeout=DEFAULT_TIMEOUT):
+        """
+        Remove the containers in a container listing which have the same
+        number as an older container, in parallel. Returns the rest of the
+        listing.
+        """
+        duplicates = get_duplicate_containers(self.client, listed)
+
+        self._stop_and_remove(
+            duplicates,
+            "Removing duplicate",
+            timeout=timeout,
+        )
+
+        return [container for container in listed if container not in duplicates]
+
+    def _remove_replaced_containers(self, listed, timeout=DEFAULT_TIMEOUT, state=None):
+        """
+        Remove the containers in a container listing which were renamed by a
+        recreate that didn't finish, if their replacement was created. The
+        replacement has its volumes already, so the recreate only has to
+        start it. Containers of recreates in the journal of `state` are
+        left, as another `up` may still be recreating them, like a
+        `start_first` recreate whose old container is still serving.
+        Returns the rest of the listing.
+        """
+        def key(container):
+            return (container.labels.get(LABEL_SERVICE), container.number)
+
+        journaled = set()
+        if state is not None:
+            for service_name in set(c['Labels'].get(LABEL_SERVICE) for c in listed):
+                for number in state.recreates(service_name):
+                    journaled.add((service_name, number))
+
+        containers = [Container.from_ps(self.client, c) for c in listed]
+        current = set(key(c) for c in containers if not c.is_renamed)
+        replaced = [
+            c for c, container in zip(listed, containers)
+            if container.is_renamed and key(container) in current
+            and key(container) not in journaled
         ]
 
+        self._stop_and_remove(replaced, "Removing replaced", timeout=timeout)
+
+        return [container for container in listed if container not in replaced]
+
+    def _get_unfinished_recreates(self, services, listed, state=None):
+        """
+        Return the numbers of the containers whose recreate didn't finish,
+        by service name: containers in the listing which still have the
+        temporary name of a recreate, and recreates in the journal of
+        `state` whose new container hasn't been created.
+        """
+        unfinished = dict((service.name, set()) for service in services)
+        current = {}
+
+        for container in [Container.from_ps(self.client, c) for c in listed]:
+            service_name = container.labels.get(LABEL_SERVICE)
+            if container.is_renamed:
+                unfinished[service_name].add(container.number)
+            else:
+                current[(service_name, container.number)] = container.id
+
+        if state is not None:
+            for service in services:
+                for number, entry in state.recreates(service.name).items():
+                    container_id = current.get((service.name, number))
+                    if container_id and container_id != entry.get('container'):
+                        unfinished[service.name].add(number)
+
+        return unfinished
+
+    def _get_image_ids(self, services, listed, state=None):
+        """
+        Return the id of each service's image, by service name. Ids are taken
+        from `state` for services whose containers in `listed` are the ones
+        it recorded, and otherwise from a single image listing. Services
+        whose image doesn't exist are left out.
+        """
+        image_ids = {}
+
+        if state is not None:
+            for service in services:
+                image_id = state.image_id(service.name, [
+                    c['Id'] for c in listed
+                    if c['Labels'].get(LABEL_SERVICE) == service.name
+                ])
+                if image_id:
+                    image_ids[service.name] = image_id
+
+        if len(image_ids) < len(services):
+            local_images = get_image_ids(self.client)
+            for service in services:
+                if service.name not in image_ids:
+                    image_id = local_images.get(get_repo_tag(service.image_name))
+                    if image_id:
+                        image_ids[service.name] = image_id
+
+        return image_ids
+
     def _get_convergence_plans(self,
                                services,
                                allow_recreate=True,
-                               force_recreate=False):
+                               force_recreate=False,
+                               listed=None,
+                               image_ids=None,
+                               unfinished=None):
+        """
+        Plan the convergence of `services`. Everything the plans depend on
+        is read up front: the containers of all the services from a single
+        listing, and image ids from a single image listing unless they're
+        given. Containers whose numbers are in `unfinished`, by service
+        name, are recreated to finish an earlier recreate. Services whose
+        dependencies will be recreated are recreated too.
+        """
+        if listed is None:
+            listed = self._list_containers(services)
+
+        containers = dict((service.name, []) for service in services)
+        for container in listed:
+            containers[container['Labels'][LABEL_SERVICE]].append(
+                Container.from_ps(self.client, container))
+
+        without_containers = [name for name in containers if not containers[name]]
+        if without_containers:
+            check_for_legacy_containers(self.client, self.name, without_containers)
+
+        if image_ids is None and allow_recreate and not force_recreate:
+            image_ids = self._get_image_ids(services, listed)
 
         plans = {}
 
@@ -286,24 +837,39 @@ class Project(object):
                     '%s has upstream changes (%s)',
                     service.name, ", ".join(updated_dependencies),
                 )
-                plan = service.convergence_plan(
-                    allow_recreate=allow_recreate,
-                    force_recreate=True,
-                )
+                service_force_recreate = True
             else:
-                plan = service.convergence_plan(
-                    allow_recreate=allow_recreate,
-                    force_recreate=force_recreate,
-                )
+                service_force_recreate = force_recreate
+
+            plan = service.convergence_plan(
+                allow_recreate=allow_recreate,
+                force_recreate=service_force_recreate,
+                containers=containers[service.name],
+                image_id=(image_ids or {}).get(service.name),
+            )
+
+            numbers = (unfinished or {}).get(service.name)
+            if numbers and allow_recreate:
+                plan = resume_recreates(plan, numbers)
 
             plans[service.name] = plan
 
         return plans
 
     def pull(self, service_names=None):
-        for service in self.get_services(service_names, include_deps=True):
+        services = self.get_services(service_names, include_deps=True)
+        self._forget_state([s.name for s in services])
+
+        for service in services:
             service.pull()
 
+    def _forget_state(self, service_names):
+        # The images of these services are about to change
+        state = ProjectState.load(self.name)
+        if state is not None:
+            state.forget(service_names)
+            state.save()
+
     def containers(self, service_names=None, stopped=False, one_off=False):
         if service_names:
             self.validate_service_names(service_names)
@@ -343,6 +909,68 @@ class Project(object):
         return acc + dep_services
 
 
+def resume_recreates(plan, numbers):
+    """
+    Return `plan` with the containers whose numbers are in `numbers`
+    recreated, to finish recreates which were interrupted.
+    """
+    actions = dict(plan.actions)
+    for container in plan.containers:
+        if container.number in numbers and actions[container] != 'recreate':
+            log.info("Resuming the recreate of %s" % container.name)
+            actions[container] = 'recreate'
+    return ConvergencePlan.from_actions(plan.containers, actions)
+
+
+def get_stop_waves(services):
+    """
+    Group `services`, which are in dependency order, into the waves in
+    which to stop them: each service comes in a later wave than all of the
+    services which depend on it. Returns a list of sets of service names.
+    """
+    wave_numbers = {}
+    for service in reversed(services):
+        wave_numbers[service.name] = max([0] + [
+            wave_numbers[other.name] + 1
+            for other in services
+            if service.name in other.get_dependency_names()
+        ])
+
+    return [
+        set(name for name, number in wave_numbers.items() if number == i)
+        for i in range(max(wave_numbers.values()) + 1 if wave_numbers else 0)
+    ]
+
+
+class ExternalContainer(object):
+    """
+    A container outside the project, referenced by name or id from
+    `volumes_from` or `net: container:...`. It is only looked up the first
+    time its id is needed, and the result is kept for the rest of the run.
+    """
+    def __init__(self, client, name, error_message):
+        self.client = client
+        self.name = name
+        self.error_message = error_message
+        self._container = None
+
+    @property
+    def container(self):
+        if self._container is None:
+            try:
+                self._container = Container.from_id(self.client, self.name)
+            except APIError:
+                raise ConfigurationError(self.error_message)
+        return self._container
+
+    @property
+    def id(self):
+        return self.container.id
+
+    def __repr__(self):
+        return '<ExternalContainer: %s>' % self.name
+
+
 class NoSuchService(Exception):
     def __init__(self, name):
         self.name = name
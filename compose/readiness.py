@@ -0,0 +1,93 @@
+"""
+Readiness checks, which `up` waits on before it starts the services that
+depend on a service.
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import logging
+import re
+import socket
+import time
+
+import six
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_READY_TIMEOUT = 60
+DEFAULT_READY_INTERVAL = 1
+
+READY_CHECK_TYPES = ['port', 'log', 'command']
+READY_CHECK_KEYS = READY_CHECK_TYPES + ['timeout', 'interval']
+
+
+class NotReadyError(Exception):
+    def __init__(self, container, reason):
+        self.container = container
+        self.reason = reason
+
+
+def wait_until_ready(container, ready_check, clock=time):
+    """Block until `container` passes `ready_check`, a validated
+    `ready_check` service option. Raises :class:`NotReadyError` if the
+    container stops, or doesn't pass before the check's timeout.
+    """
+    check = get_check(ready_check)
+    timeout = ready_check.get('timeout', DEFAULT_READY_TIMEOUT)
+    interval = ready_check.get('interval', DEFAULT_READY_INTERVAL)
+    deadline = clock.time() + timeout
+
+    log.info("Waiting for %s to be ready..." % container.name)
+
+    while True:
+        container.inspect()
+        if not container.is_running:
+            raise NotReadyError(container, "the container is not running")
+
+        if check(container):
+            return container
+
+        if clock.time() + interval > deadline:
+            raise NotReadyError(
+                container,
+                "no success after %s seconds" % timeout)
+
+        clock.sleep(interval)
+
+
+def get_check(ready_check):
+    if 'port' in ready_check:
+        return lambda c: check_port(c, ready_check['port'])
+    if 'log' in ready_check:
+        pattern = re.compile(ready_check['log'], re.MULTILINE)
+        return lambda c: check_log(c, pattern)
+    if 'command' in ready_check:
+        return lambda c: check_command(c, ready_check['command'])
+    raise ValueError("Invalid ready_check: %r" % (ready_check,))
+
+
+def check_port(container, port):
+    """Check that the container accepts TCP connections on `port`."""
+    host = container.get('NetworkSettings.IPAddress') or '127.0.0.1'
+    try:
+        conn = socket.create_connection((host, int(port)), timeout=1)
+    except socket.error:
+        return False
+    conn.close()
+    return True
+
+
+def check_log(container, pattern):
+    """Check that the container has logged a line matching `pattern`."""
+    output = container.logs(stdout=True, stderr=True, stream=False)
+    if isinstance(output, six.binary_type):
+        output = output.decode('utf-8', 'replace')
+    return pattern.search(output) is not None
+
+
+def check_command(container, command):
+    """Check that `command` exits with status 0 inside the container."""
+    exec_id = container.client.exec_create(container.id, command)
+    container.client.exec_start(exec_id)
+    return container.client.exec_inspect(exec_id).get('ExitCode') == 0
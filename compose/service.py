@@ -5,6 +5,9 @@ import logging
 import re
 import os
 import sys
+import threading
+import time
+import weakref
 from operator import attrgetter
 
 import six
@@ -25,7 +28,8 @@ from .const import (
 from .container import Container
 from .legacy import check_for_legacy_containers
 from .progress_stream import stream_output, StreamOutputError
-from .utils import json_hash, parallel_execute
+from .readiness import wait_until_ready
+from .utils import json_hash, parallel_execute, ParallelExecutionError
 
 log = logging.getLogger(__name__)
 
@@ -51,9 +55,17 @@ DOCKER_START_KEYS = [
 
 VALID_NAME_CHARS = '[a-zA-Z0-9\._\-]'
 
+# How many times to pick a new number when a container's name is taken
+NAME_CONFLICT_RETRIES = 5
+
+# The container numbers reserved by this process, by client
+_reserved_numbers = weakref.WeakKeyDictionary()
+_reserved_numbers_lock = threading.Lock()
+
 
 class BuildError(Exception):
     def __init__(self, service, reason):
+        super(BuildError, self).__init__(reason)
         self.service = service
         self.reason = reason
 
@@ -71,13 +83,41 @@ class NoSuchImageError(Exception):
     pass
 
 
+class RolloutError(Exception):
+    def __init__(self, service, failed, remaining):
+        self.service = service
+        self.failed = failed
+        self.remaining = remaining
+
+
 VolumeSpec = namedtuple('VolumeSpec', 'external internal mode')
 
 
 ServiceName = namedtuple('ServiceName', 'project service number')
 
 
-ConvergencePlan = namedtuple('ConvergencePlan', 'action containers')
+class ConvergencePlan(namedtuple('ConvergencePlan', 'action containers actions')):
+    """The steps needed to bring a service's containers up to date.
+
+    `actions` maps each container to 'recreate', 'start' or 'noop', so that
+    only the containers which need it are touched. `action` summarises the
+    plan as a whole: 'create' if there are no containers, otherwise the most
+    disruptive of the per-container actions.
+    """
+
+    def __new__(cls, action, containers, actions=None):
+        if actions is None:
+            actions = dict((c, action) for c in containers)
+        return super(ConvergencePlan, cls).__new__(cls, action, containers, actions)
+
+    @classmethod
+    def from_actions(cls, containers, actions):
+        for action in ('recreate', 'start'):
+            if action in actions.values():
+                break
+        else:
+            action = 'noop'
+        return cls(action, containers, actions)
 
 
 class Service(object):
@@ -99,6 +139,7 @@ class Service(object):
         self.volumes_from = volumes_from or []
         self.net = net or None
         self.options = options
+        self.host_cpus = None
 
     def containers(self, stopped=False, one_off=False):
         containers = [
@@ -148,7 +189,7 @@ class Service(object):
 
     # end TODO
 
-    def scale(self, desired_num, timeout=DEFAULT_TIMEOUT):
+    def scale(self, desired_num, timeout=DEFAULT_TIMEOUT, quiet=False):
         """
         Adjusts the number of containers to the specified number and ensures
         they are running.
@@ -157,6 +198,9 @@ class Service(object):
         - stops containers until there are at most `desired_num` running
         - starts containers until there are at least `desired_num` running
         - removes all stopped containers
+
+        With `quiet`, no progress is drawn, for when other services are
+        scaled at the same time.
         """
         if self.custom_container_name() and desired_num > 1:
             log.warn('The "%s" service is using the custom container name "%s". '
@@ -169,11 +213,6 @@ class Service(object):
                      'for this service are created on a single host, the port will clash.'
                      % self.name)
 
-        def create_and_start(service, number):
-            container = service.create_container(number=number, quiet=True)
-            container.start()
-            return container
-
         running_containers = self.containers(stopped=False)
         num_running = len(running_containers)
 
@@ -198,53 +237,78 @@ class Service(object):
                 else:
                     containers_to_start = stopped_containers
 
-                parallel_execute(
+                _, errors = parallel_execute(
                     objects=containers_to_start,
                     obj_callable=lambda c: c.start(),
                     msg_index=lambda c: c.name,
-                    msg="Starting"
+                    msg="Starting",
+                    quiet=quiet,
                 )
+                if errors:
+                    raise ParallelExecutionError("Starting", errors)
 
                 num_running += len(containers_to_start)
 
             num_to_create = desired_num - num_running
-            next_number = self._next_container_number()
-            container_numbers = [
-                number for number in range(
-                    next_number, next_number + num_to_create
-                )
-            ]
 
-            parallel_execute(
-                objects=container_numbers,
-                obj_callable=lambda n: create_and_start(service=self, number=n),
-                msg_index=lambda n: n,
-                msg="Creating and starting"
-            )
+            if num_to_create > 0:
+                self.ensure_image_exists()
+                next_number = self._next_container_number(count=num_to_create)
+                container_numbers = list(range(next_number, next_number + num_to_create))
+
+                def create_and_start(number):
+                    container = self._create_numbered_container(
+                        lambda n: self._create_container_from_template(template, n),
+                        number=number,
+                    )
+                    container.start()
+                    return container
+
+                try:
+                    # Everything but the name and number is the same for each
+                    # new container, so only work it out once
+                    template = self._get_container_create_options({}, next_number)
+                    _, errors = parallel_execute(
+                        objects=container_numbers,
+                        obj_callable=create_and_start,
+                        msg_index=lambda n: n,
+                        msg="Creating and starting",
+                        quiet=quiet,
+                    )
+                finally:
+                    self._release_container_numbers(container_numbers)
+                if errors:
+                    raise ParallelExecutionError("Creating and starting", errors)
 
         if desired_num < num_running:
             num_to_stop = num_running - desired_num
             sorted_running_containers = sorted(running_containers, key=attrgetter('number'))
             containers_to_stop = sorted_running_containers[-num_to_stop:]
 
-            parallel_execute(
+            _, errors = parallel_execute(
                 objects=containers_to_stop,
                 obj_callable=lambda c: c.stop(timeout=timeout),
                 msg_index=lambda c: c.name,
-                msg="Stopping"
+                msg="Stopping",
+                quiet=quiet,
             )
+            if errors:
+                raise ParallelExecutionError("Stopping", errors)
 
-        self.remove_stopped()
+        self.remove_stopped(quiet=quiet)
 
-    def remove_stopped(self, **options):
+    def remove_stopped(self, quiet=False, **options):
         containers = [c for c in self.containers(stopped=True) if not c.is_running]
 
-        parallel_execute(
+        _, errors = parallel_execute(
             objects=containers,
             obj_callable=lambda c: c.remove(**options),
             msg_index=lambda c: c.name,
-            msg="Removing"
+            msg="Removing",
+            quiet=quiet,
         )
+        if errors:
+            raise ParallelExecutionError("Removing", errors)
 
     def create_container(self,
                          one_off=False,
@@ -261,16 +325,74 @@ class Service(object):
             do_build=do_build,
         )
 
-        container_options = self._get_container_create_options(
-            override_options,
-            number or self._next_container_number(one_off=one_off),
+        def create(number):
+            container_options = self._get_container_create_options(
+                override_options,
+                number,
+                one_off=one_off,
+                previous_container=previous_container,
+            )
+
+            if 'name' in container_options and not quiet:
+                log.info("Creating %s..." % container_options['name'])
+
+            return Container.create(self.client, **container_options)
+
+        return self._create_numbered_container(
+            create,
+            number=number,
             one_off=one_off,
-            previous_container=previous_container,
+            renumber_on_conflict=number is None,
         )
 
-        if 'name' in container_options and not quiet:
-            log.info("Creating %s..." % container_options['name'])
+    def _create_numbered_container(self,
+                                   create,
+                                   number=None,
+                                   one_off=False,
+                                   renumber_on_conflict=True):
+        """Call `create` with a container number, reserving one if `number`
+        isn't given. If the container's name is already taken, for example
+        by another Compose process, and `renumber_on_conflict` is set, a new
+        number is reserved and `create` is called again.
+        """
+        reserved = number is None
+        if reserved:
+            number = self._next_container_number(one_off=one_off)
+
+        retries = 0
+        while True:
+            try:
+                return create(number)
+            except APIError as e:
+                if (not renumber_on_conflict
+                        or not is_name_conflict(e)
+                        or (self.custom_container_name() and not one_off)
+                        or retries >= NAME_CONFLICT_RETRIES):
+                    raise
+            finally:
+                if reserved:
+                    self._release_container_numbers([number], one_off=one_off)
 
+            log.debug(
+                'Name for %s number %s is taken, trying another number',
+                self.name, number)
+            retries += 1
+            reserved = True
+            # The listing may not show the container which has the name yet
+            number = self._next_container_number(one_off=one_off, after=number)
+
+    def _create_container_from_template(self, template, number):
+        """Create a container numbered `number` from the options returned by
+        `_get_container_create_options` for another number.
+        """
+        container_options = dict(template)
+        if not self.custom_container_name():
+            container_options['name'] = self.get_container_name(number)
+        container_options['labels'] = dict(
+            template['labels'],
+            **{LABEL_CONTAINER_NUMBER: str(number)})
+        if self.options.get('pin_cpus'):
+            container_options['cpuset'] = self._get_pinned_cpuset(number)
         return Container.create(self.client, **container_options)
 
     def ensure_image_exists(self,
@@ -308,42 +430,54 @@ class Service(object):
 
     def convergence_plan(self,
                          allow_recreate=True,
-                         force_recreate=False):
-
+                         force_recreate=False,
+                         containers=None,
+                         image_id=None):
+        """Work out what to do to bring this service's containers up to
+        date. `containers` and `image_id` can be given when they have
+        already been read, to save listing the containers and inspecting
+        the image.
+        """
         if force_recreate and not allow_recreate:
             raise ValueError("force_recreate and allow_recreate are in conflict")
 
-        containers = self.containers(stopped=True)
+        if containers is None:
+            containers = self.containers(stopped=True)
 
         if not containers:
             return ConvergencePlan('create', [])
 
         if not allow_recreate:
-            return ConvergencePlan('start', containers)
-
-        if force_recreate or self._containers_have_diverged(containers):
-            return ConvergencePlan('recreate', containers)
-
-        stopped = [c for c in containers if not c.is_running]
+            diverged = []
+        elif force_recreate:
+            diverged = containers
+        else:
+            diverged = self._diverged_containers(containers, image_id=image_id)
 
-        if stopped:
-            return ConvergencePlan('start', stopped)
+        actions = {}
+        for c in containers:
+            if c in diverged:
+                actions[c] = 'recreate'
+            elif not c.is_running or not allow_recreate:
+                actions[c] = 'start'
+            else:
+                actions[c] = 'noop'
 
-        return ConvergencePlan('noop', containers)
+        return ConvergencePlan.from_actions(containers, actions)
 
-    def _containers_have_diverged(self, containers):
+    def _diverged_containers(self, containers, image_id=None):
         config_hash = None
 
         try:
-            config_hash = self.config_hash()
+            config_hash = self.config_hash(image_id=image_id)
         except NoSuchImageError as e:
             log.debug(
                 'Service %s has diverged: %s',
                 self.name, six.text_type(e),
             )
-            return True
+            return containers
 
-        has_diverged = False
+        diverged = []
 
         for c in containers:
             container_config_hash = c.labels.get(LABEL_CONFIG_HASH, None)
@@ -352,15 +486,32 @@ class Service(object):
                     '%s has diverged: %s != %s',
                     c.name, container_config_hash, config_hash,
                 )
-                has_diverged = True
+                diverged.append(c)
 
-        return has_diverged
+        return diverged
 
     def execute_convergence_plan(self,
                                  plan,
                                  do_build=True,
-                                 timeout=DEFAULT_TIMEOUT):
-        (action, containers) = plan
+                                 timeout=DEFAULT_TIMEOUT,
+                                 batch_size=None,
+                                 start_first=False,
+                                 batch_delay=0,
+                                 journal=None,
+                                 quiet=False):
+        """Carry out a plan returned by `convergence_plan`.
+
+        By default stale containers are recreated one after the other. If
+        `batch_size` is given they are recreated as a rolling update instead:
+        `batch_size` containers at a time, waiting `batch_delay` seconds
+        between batches, and stopping at the first batch which fails. With
+        `start_first`, each new container is started before the one it
+        replaces is stopped. The steps of each recreate are recorded in
+        `journal`, a :class:`compose.state.ProjectState`, if it's given.
+        With `quiet`, a rolling update logs each recreate instead of drawing
+        its progress, for when other services are converged at the same time.
+        """
+        (action, containers, actions) = plan
 
         if action == 'create':
             container = self.create_container(
@@ -370,40 +521,164 @@ class Service(object):
 
             return [container]
 
-        elif action == 'recreate':
+        if start_first and self.specifies_host_port():
+            log.warn('The "%s" service specifies a port on the host, so its '
+                     'containers must be stopped before they are replaced.'
+                     % self.name)
+            start_first = False
+
+        if not batch_size:
             return [
-                self.recreate_container(
+                self._execute_container_action(
+                    actions[c],
                     c,
-                    timeout=timeout
+                    timeout=timeout,
+                    start_first=start_first,
+                    journal=journal,
                 )
                 for c in containers
             ]
 
-        elif action == 'start':
-            for c in containers:
-                self.start_container_if_stopped(c)
+        to_recreate = [c for c in containers if actions[c] == 'recreate']
+        converged = dict(
+            (c.name, self._execute_container_action(actions[c], c))
+            for c in containers
+            if actions[c] != 'recreate'
+        )
+        converged.update(self._rolling_recreate(
+            to_recreate,
+            timeout=timeout,
+            batch_size=batch_size,
+            start_first=start_first,
+            batch_delay=batch_delay,
+            journal=journal,
+            quiet=quiet,
+        ))
+
+        return [converged[c.name] for c in containers]
+
+    def _rolling_recreate(self,
+                          containers,
+                          timeout=DEFAULT_TIMEOUT,
+                          batch_size=1,
+                          start_first=False,
+                          batch_delay=0,
+                          journal=None,
+                          quiet=False):
+        recreated = {}
+        batches = [
+            containers[i:i + batch_size]
+            for i in range(0, len(containers), batch_size)
+        ]
 
-            return containers
+        for i, batch in enumerate(batches):
+            if i and batch_delay:
+                log.info("Waiting %ss before the next batch..." % batch_delay)
+                time.sleep(batch_delay)
 
-        elif action == 'noop':
-            for c in containers:
-                log.info("%s is up-to-date" % c.name)
+            results, errors = parallel_execute(
+                objects=batch,
+                obj_callable=lambda c: self.recreate_container(
+                    c,
+                    timeout=timeout,
+                    start_first=start_first,
+                    quiet=not quiet,
+                    journal=journal,
+                ),
+                msg_index=lambda c: c.name,
+                msg="Recreating",
+                quiet=quiet,
+            )
+            recreated.update(results)
 
-            return containers
+            if errors:
+                raise RolloutError(
+                    self,
+                    sorted(errors),
+                    [c.name for c in containers[(i + 1) * batch_size:]],
+                )
+
+        return recreated
+
+    def _execute_container_action(self,
+                                  action,
+                                  container,
+                                  timeout=DEFAULT_TIMEOUT,
+                                  start_first=False,
+                                  journal=None):
+        if action == 'recreate':
+            return self.recreate_container(
+                container,
+                timeout=timeout,
+                start_first=start_first,
+                journal=journal,
+            )
+
+        elif action == 'start':
+            return self.start_container_if_stopped(container)
+
+        elif action == 'noop':
+            log.info("%s is up-to-date" % container.name)
+            return container
 
         else:
             raise Exception("Invalid action: {}".format(action))
 
     def recreate_container(self,
                            container,
-                           timeout=DEFAULT_TIMEOUT):
+                           timeout=DEFAULT_TIMEOUT,
+                           start_first=False,
+                           quiet=False,
+                           journal=None):
         """Recreate a container.
 
         The original container is renamed to a temporary name so that data
         volumes can be copied to the new container, before the original
-        container is removed.
+        container is removed. If `start_first` is set, the original keeps
+        running until the new container has started. A container which
+        already has the temporary name is left over from a recreate which
+        didn't finish, and the recreate carries on from there.
+
+        Each step is recorded in `journal` as it completes, if it's given.
         """
-        log.info("Recreating %s..." % container.name)
+        if not quiet:
+            log.info("Recreating %s..." % container.name)
+
+        number = container.labels.get(LABEL_CONTAINER_NUMBER)
+
+        def step(name, container_id=None):
+            if journal is not None:
+                journal.step(self.name, number, name, container_id=container_id)
+
+        if not start_first:
+            self._stop_for_recreate(container, timeout=timeout)
+
+        if not container.is_renamed:
+            # Use a hopefully unique container name by prepending the short id
+            self.client.rename(
+                container.id,
+                '%s_%s' % (container.short_id, container.name))
+            step('rename')
+
+        new_container = self.create_container(
+            do_build=False,
+            previous_container=container,
+            number=number,
+            quiet=True,
+        )
+        step('create', container_id=new_container.id)
+
+        self.start_container(new_container)
+        step('start')
+
+        if start_first:
+            self._stop_for_recreate(container, timeout=timeout)
+
+        container.remove()
+        step('remove')
+        return new_container
+
+    def _stop_for_recreate(self, container, timeout=DEFAULT_TIMEOUT):
         try:
             container.stop(timeout=timeout)
         except APIError as e:
@@ -414,20 +689,17 @@ class Service(object):
             else:
                 raise
 
-        # Use a hopefully unique container name by prepending the short id
-        self.client.rename(
-            container.id,
-            '%s_%s' % (container.short_id, container.name))
+    def wait_until_ready(self, containers):
+        """Wait for each of `containers` to pass the service's `ready_check`,
+        if it has one.
+        """
+        if 'ready_check' not in self.options:
+            return containers
 
-        new_container = self.create_container(
-            do_build=False,
-            previous_container=container,
-            number=container.labels.get(LABEL_CONTAINER_NUMBER),
-            quiet=True,
-        )
-        self.start_container(new_container)
-        container.remove()
-        return new_container
+        for container in containers:
+            wait_until_ready(container, self.options['ready_check'])
+
+        return containers
 
     def start_container_if_stopped(self, container):
         if container.is_running:
@@ -447,26 +719,23 @@ class Service(object):
             c.remove()
 
     def duplicate_containers(self):
-        containers = sorted(
-            self.containers(stopped=True),
-            key=lambda c: c.get('Created'),
-        )
+        listed = self.client.containers(
+            all=True,
+            filters={'label': self.labels()})
 
-        numbers = set()
+        for c in get_duplicate_containers(self.client, listed):
+            yield Container.from_ps(self.client, c)
 
-        for c in containers:
-            if c.number in numbers:
-                yield c
-            else:
-                numbers.add(c.number)
+    def config_hash(self, image_id=None):
+        return json_hash(self.config_dict(image_id=image_id))
 
-    def config_hash(self):
-        return json_hash(self.config_dict())
-
-    def config_dict(self):
+    def config_dict(self, image_id=None):
+        # Changing how readiness is checked doesn't need new containers
+        options = dict(
+            (k, v) for k, v in self.options.items() if k != 'ready_check')
         return {
-            'options': self.options,
-            'image_id': self.image()['Id'],
+            'options': options,
+            'image_id': image_id or self.image()['Id'],
         }
 
     def get_dependency_names(self):
@@ -491,16 +760,38 @@ class Service(object):
         # TODO: Implement issue #652 here
         return build_container_name(self.project, self.name, number, one_off)
 
-    # TODO: this would benefit from github.com/docker/docker/pull/11943
-    # to remove the need to inspect every container
-    def _next_container_number(self, one_off=False):
-        numbers = [
-            Container.from_ps(self.client, container).number
-            for container in self.client.containers(
-                all=True,
-                filters={'label': self.labels(one_off=one_off)})
-        ]
-        return 1 if not numbers else max(numbers) + 1
+    def _next_container_number(self, one_off=False, count=1, after=0):
+        """Reserve `count` consecutive container numbers, higher than
+        `after`, and return the first. Numbers are read from the labels in a
+        single container listing, and aren't handed out again by the same
+        process until they're released with `_release_container_numbers`.
+        """
+        with _reserved_numbers_lock:
+            reservations = _reserved_numbers.setdefault(self.client, NumberReservations())
+
+        started = reservations.start_listing()
+        try:
+            numbers = [
+                get_container_number(self.client, container)
+                for container in self.client.containers(
+                    all=True,
+                    filters={'label': self.labels(one_off=one_off)})
+            ]
+        except Exception:
+            reservations.finish_listing(started)
+            raise
+
+        return reservations.reserve(
+            (self.project, self.name, one_off), started, numbers + [after], count)
+
+    def _release_container_numbers(self, numbers, one_off=False):
+        """Release numbers reserved by `_next_container_number`, once their
+        containers have been created or have failed to be.
+        """
+        with _reserved_numbers_lock:
+            reservations = _reserved_numbers.get(self.client)
+        if reservations is not None:
+            reservations.release((self.project, self.name, one_off), numbers)
 
     def _get_links(self, link_to_self):
         links = []
@@ -532,7 +823,7 @@ class Service(object):
                 else:
                     volumes_from.extend(map(attrgetter('id'), containers))
 
-            elif isinstance(volume_source, Container):
+            else:
                 volumes_from.append(volume_source.id)
 
         return volumes_from
@@ -549,10 +840,10 @@ class Service(object):
                 log.warning("Warning: Service %s is trying to use reuse the network stack "
                             "of another service that is not running." % (self.net.name))
                 net = None
-        elif isinstance(self.net, Container):
-            net = 'container:' + self.net.id
-        else:
+        elif isinstance(self.net, six.string_types):
             net = self.net
+        else:
+            net = 'container:' + self.net.id
 
         return net
 
@@ -575,10 +866,11 @@ class Service(object):
         else:
             container_options['name'] = self.get_container_name(number, one_off)
 
+        # Copy the labels, so that the service's own options aren't changed
+        container_options['labels'] = dict(container_options.get('labels') or {})
+
         if add_config_hash:
             config_hash = self.config_hash()
-            if 'labels' not in container_options:
-                container_options['labels'] = {}
             container_options['labels'][LABEL_CONFIG_HASH] = config_hash
             log.debug("Added config hash: %s" % config_hash)
 
@@ -623,6 +915,12 @@ class Service(object):
 
         if previous_container:
             container_options['environment']['affinity:container'] = ('=' + previous_container.id)
+        elif self.options.get('spread') and not one_off:
+            container_options['environment'].setdefault(
+                'affinity:container!', self._spread_affinity())
+
+        if self.options.get('pin_cpus') and not one_off:
+            container_options['cpuset'] = self._get_pinned_cpuset(number)
 
         container_options['image'] = self.image_name
 
@@ -748,6 +1046,23 @@ class Service(object):
     def custom_container_name(self):
         return self.options.get('container_name')
 
+    def _get_pinned_cpuset(self, number):
+        if self.host_cpus is None:
+            self.host_cpus = self.client.info().get('NCPU') or 1
+        # A recreate passes the number from the container's label
+        return build_pinned_cpuset(int(number), self.options['pin_cpus'], self.host_cpus)
+
+    def _spread_affinity(self):
+        """
+        The value of a Swarm anti-affinity against this service's other
+        containers, so that it places them on different nodes. A soft
+        affinity is ignored when every node already has one.
+        """
+        pattern = build_container_name(self.project, self.name, '*')
+        if self.options['spread'] == 'soft':
+            return '~' + pattern
+        return pattern
+
     def specifies_host_port(self):
         for port in self.options.get('ports', []):
             if ':' in str(port):
@@ -769,6 +1084,80 @@ class Service(object):
         stream_output(output, sys.stdout)
 
 
+# Numbers
+
+
+class NumberReservations(object):
+    """
+    The container numbers a process has handed out for one client, by
+    (project, service, one_off), so that concurrent callers don't pick
+    the same number before either container exists.
+
+    A number is held from when it's reserved until it's released, once its
+    container has been created. After that, only listings which started
+    before it was released still have to skip it, as they may not show the
+    container. Numbers whose containers were removed are then reused.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clock = 0
+        self.listings = []
+        self.numbers = {}
+
+    def start_listing(self):
+        """Record that a container listing is starting, and return the
+        time it started, to pass to `reserve`."""
+        with self.lock:
+            self.clock += 1
+            self.listings.append(self.clock)
+            return self.clock
+
+    def finish_listing(self, started):
+        with self.lock:
+            self._finish_listing(started)
+
+    def _finish_listing(self, started):
+        self.listings.remove(started)
+        self._forget_released()
+
+    def reserve(self, key, started, listed, count):
+        """Reserve `count` numbers after the highest of those `listed` by
+        a listing which started at `started`, and of those held for `key`,
+        and return the first. This finishes the listing."""
+        with self.lock:
+            held = self.numbers.setdefault(key, {})
+            taken = [
+                number for number, released in held.items()
+                if released is None or released > started
+            ]
+            first = max(listed + taken + [0]) + 1
+            for number in range(first, first + count):
+                held[number] = None
+            self._finish_listing(started)
+            return first
+
+    def release(self, key, numbers):
+        with self.lock:
+            self.clock += 1
+            held = self.numbers.get(key, {})
+            for number in numbers:
+                if held.get(number, 0) is None:
+                    held[number] = self.clock
+            self._forget_released()
+
+    def _forget_released(self):
+        # Numbers released before every listing in progress started are
+        # shown by those listings, if their containers exist
+        oldest = min(self.listings) if self.listings else self.clock + 1
+        for key, held in list(self.numbers.items()):
+            for number, released in list(held.items()):
+                if released is not None and released < oldest:
+                    del held[number]
+            if not held:
+                del self.numbers[key]
+
+
 # Names
 
 
@@ -779,6 +1168,25 @@ def build_container_name(project, service, number, one_off=False):
     return '_'.join(bits + [str(number)])
 
 
+# CPUs
+
+
+def build_pinned_cpuset(number, cpus, host_cpus):
+    """
+    Return the `cpuset` of the container numbered `number`, for a service
+    which pins each container to `cpus` CPUs of a host with `host_cpus`.
+    Containers are given consecutive CPUs in turn, wrapping round to the
+    first CPU once there aren't enough left, so a container always gets
+    the same CPUs.
+    """
+    slots = max(host_cpus // cpus, 1)
+    first = ((number - 1) % slots) * cpus
+    last = min(first + cpus, host_cpus) - 1
+    if first == last:
+        return str(first)
+    return '%d-%d' % (first, last)
+
+
 # Images
 
 
@@ -791,6 +1199,22 @@ def parse_repository_tag(s):
     return repo, tag
 
 
+def get_image_ids(client):
+    """Map the `repo:tag` of each local image to its id, using a single
+    image listing.
+    """
+    return dict(
+        (repo_tag, image['Id'])
+        for image in client.images()
+        for repo_tag in image.get('RepoTags') or []
+    )
+
+
+def get_repo_tag(image_name):
+    repo, tag = parse_repository_tag(image_name)
+    return '%s:%s' % (repo, tag or 'latest')
+
+
 # Volumes
 
 
@@ -894,6 +1318,40 @@ def split_port(port):
 # Labels
 
 
+def get_container_number(client, container):
+    """Return the number of a container from the container list, reading
+    it from the listed labels if the daemon includes them.
+    """
+    number = (container.get('Labels') or {}).get(LABEL_CONTAINER_NUMBER)
+    if number:
+        return int(number)
+    return Container.from_ps(client, container).number
+
+
+def get_duplicate_containers(client, listed):
+    """Return the containers from a container listing which have the same
+    service and number as an older container, using only the listed data.
+    """
+    seen = set()
+    duplicates = []
+
+    for container in sorted(listed, key=lambda c: c.get('Created')):
+        key = (
+            (container.get('Labels') or {}).get(LABEL_SERVICE),
+            get_container_number(client, container),
+        )
+        if key in seen:
+            duplicates.append(container)
+        else:
+            seen.add(key)
+
+    return duplicates
+
+
+def is_name_conflict(error):
+    return error.response is not None and error.response.status_code == 409
+
+
 def build_container_labels(label_options, service_labels, number, one_off=False):
     labels = label_options or {}
     labels.update(label.split('=', 1) for label in service_labels)
@@ -0,0 +1,156 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import logging
+import os
+import threading
+
+
+log = logging.getLogger(__name__)
+
+
+class ProjectState(object):
+    """
+    What Compose last saw of a project's services, kept in a file in
+    `COMPOSE_STATE_DIR` so that later commands can skip reading it from the
+    daemon again. For each service it records the ids of its containers and
+    the id of the image they were created from.
+
+    A service's record is only used while the ids of its containers, from
+    a container listing, are exactly the ones recorded. Images which are
+    rebuilt or pulled outside of Compose aren't noticed, which is why the
+    store is only used when `COMPOSE_STATE_DIR` is set.
+
+    It also keeps a journal of the recreates `up` has planned, with the
+    steps of each that have completed, so that an `up` which fails part of
+    the way through can be resumed.
+    """
+
+    def __init__(self, path, services=None, journal=None):
+        self.path = path
+        self.services = services or {}
+        self.journal = journal or {}
+        self.changed = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, project_name, state_dir=None):
+        """Load the state of a project, or return None if the state store
+        isn't enabled. A missing or unreadable file gives an empty state.
+        """
+        if state_dir is None:
+            state_dir = os.environ.get('COMPOSE_STATE_DIR')
+        if not state_dir:
+            return None
+
+        path = os.path.join(os.path.expanduser(state_dir), '%s.json' % project_name)
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            services, journal = data.get('services'), data.get('journal')
+        except (IOError, ValueError, AttributeError) as e:
+            log.debug('Not using project state from %s: %s', path, e)
+            services, journal = {}, {}
+
+        return cls(
+            path,
+            services if isinstance(services, dict) else {},
+            journal if isinstance(journal, dict) else {})
+
+    def image_id(self, service_name, container_ids):
+        """Return the recorded image id of a service, if `container_ids` are
+        the ids of the containers that were recorded with it.
+        """
+        record = self.services.get(service_name)
+        if not record or set(record.get('containers') or []) != set(container_ids):
+            return None
+        return record.get('image_id')
+
+    def record(self, service_name, container_ids, image_id):
+        if not image_id:
+            return self.forget([service_name])
+
+        record = {
+            'containers': sorted(container_ids),
+            'image_id': image_id,
+        }
+        if self.services.get(service_name) != record:
+            self.services[service_name] = record
+            self.changed = True
+
+    def forget(self, service_names):
+        for name in service_names:
+            if self.services.pop(name, None) is not None:
+                self.changed = True
+
+    def plan_recreates(self, service_name, numbers):
+        """Journal the numbers of the containers of a service which are to
+        be recreated, replacing what was journaled for it before. Steps
+        already journaled for those numbers are kept.
+        """
+        with self.lock:
+            previous = self.journal.get(service_name, {})
+            entries = dict(
+                (str(number), previous.get(str(number), {'steps': []}))
+                for number in numbers)
+            if entries != previous:
+                self.changed = True
+                if entries:
+                    self.journal[service_name] = entries
+                else:
+                    self.journal.pop(service_name, None)
+
+    def recreates(self, service_name):
+        """Return the journal entries of a service's unfinished recreates,
+        by container number. Each has the `steps` that have completed, and
+        once the new container has been created, its id as `container`.
+        """
+        return dict(
+            (int(number), entry)
+            for number, entry in self.journal.get(service_name, {}).items())
+
+    def step(self, service_name, number, step, container_id=None):
+        """Journal a completed step of a recreate, and save it straight
+        away. A recreate is finished once its 'remove' step completes.
+        """
+        with self.lock:
+            entries = self.journal.setdefault(service_name, {})
+            entry = entries.setdefault(str(number), {'steps': []})
+            entry['steps'].append(step)
+            if container_id:
+                entry['container'] = container_id
+            if step == 'remove':
+                del entries[str(number)]
+                if not entries:
+                    del self.journal[service_name]
+            self.changed = True
+        self.save()
+
+    def save(self):
+        """Write the state out if it has changed. Failing to write it isn't
+        an error, as the state is only used to save requests.
+        """
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        if not self.changed:
+            return
+
+        tmp_path = '%s.%s.tmp' % (self.path, os.getpid())
+        try:
+            state_dir = os.path.dirname(self.path)
+            if not os.path.isdir(state_dir):
+                os.makedirs(state_dir)
+            with open(tmp_path, 'w') as f:
+                json.dump(
+                    {'services': self.services, 'journal': self.journal},
+                    f,
+                    sort_keys=True)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            log.debug('Could not save project state to %s: %s', self.path, e)
+            return
+
+        self.changed = False
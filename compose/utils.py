@@ -2,65 +2,210 @@ import codecs
 import hashlib
 import json
 import logging
+import os
 import sys
 
-from docker.errors import APIError
 from Queue import Queue, Empty
 from threading import Thread
 
 
 log = logging.getLogger(__name__)
 
+STOP = object()
 
-def parallel_execute(objects, obj_callable, msg_index, msg):
+
+class ParallelExecutionError(Exception):
+    """
+    Raised by callers of `parallel_execute` when some of its calls failed.
+    `errors` is the dict of errors it returned.
+    """
+    def __init__(self, msg, errors):
+        self.msg = "%s failed for %s" % (
+            msg, ", ".join(sorted(str(index) for index in errors)))
+        self.errors = errors
+        super(ParallelExecutionError, self).__init__(self.msg)
+
+
+def get_error_message(e):
+    """
+    Return the message to log for an error raised by docker-py or the
+    project, or None if it isn't one we know how to report. Those modules
+    import this one, and are slow to import, so they are only loaded once
+    there's an error.
+    """
+    from docker.errors import APIError
+    from .project import NoSuchService
+    from .readiness import NotReadyError
+    from .service import BuildError, NeedsBuildError, RolloutError
+
+    if isinstance(e, (NoSuchService, ParallelExecutionError)):
+        return e.msg
+    if isinstance(e, APIError):
+        return e.explanation
+    if isinstance(e, BuildError):
+        return "Service '%s' failed to build: %s" % (e.service.name, e.reason)
+    if isinstance(e, NeedsBuildError):
+        return "Service '%s' needs to be built, but --no-build was passed." % e.service.name
+    if isinstance(e, NotReadyError):
+        return "%s did not become ready: %s" % (e.container.name, e.reason)
+    if isinstance(e, RolloutError):
+        return "Rolling update of service '%s' stopped because %s failed. Not recreated: %s" % (
+            e.service.name, ", ".join(e.failed), ", ".join(e.remaining) or "none")
+    return None
+
+
+def parallel_execute(objects, obj_callable, msg_index, msg, limit=None, get_deps=None,
+                     quiet=False):
     """
     For a given list of objects, call the callable passing in the first
     object we give it.
+
+    The calls run on a pool of at most `limit` threads, or of as many as
+    `COMPOSE_PARALLEL_LIMIT` if no limit is given, or of one per object if
+    that isn't set either. If `get_deps` is given, the callable is only
+    called for an object once it has returned for each of the objects in
+    `get_deps(obj)`. If any of those failed, the object is skipped and
+    reported as failed too. Objects are only handed to the pool once
+    they're ready, so a thread is never left waiting on another.
+
+    Progress is written to stdout, unless `quiet` is set. Calls made at
+    the same time as other parallel calls, or as logging, should be quiet,
+    as the progress lines are redrawn in place.
+
+    Returns a pair of dicts, keyed by `msg_index(obj)`: the return values
+    of the calls that succeeded, and the errors of those that didn't.
     """
+    # Imported here so that commands which don't talk to the daemon don't
+    # pay for importing docker-py
+    from docker.errors import APIError
+
     stream = codecs.getwriter('utf-8')(sys.stdout)
     lines = []
+    results = {}
     errors = {}
 
+    def progress(index, status="done"):
+        if not quiet:
+            write_out_msg(stream, lines, index, msg, status=status)
+
     for obj in objects:
-        write_out_msg(stream, lines, msg_index(obj), msg)
+        progress(msg_index(obj))
+
+    if not objects:
+        return results, errors
 
+    indexes = set(msg_index(obj) for obj in objects)
+    dep_indexes = {}
+    dependents = dict((index, []) for index in indexes)
+
+    for obj in objects:
+        deps = []
+        for dep in (get_deps(obj) if get_deps else []):
+            if msg_index(dep) in indexes and msg_index(dep) not in deps:
+                deps.append(msg_index(dep))
+        dep_indexes[msg_index(obj)] = deps
+        for dep_index in deps:
+            dependents[dep_index].append(obj)
+
+    waiting_on = dict((index, len(deps)) for index, deps in dep_indexes.items())
+    ready = Queue()
     q = Queue()
 
-    def inner_execute_function(an_callable, parameter, msg_index):
+    def call(an_callable, parameter, msg_index):
         try:
-            result = an_callable(parameter)
+            return an_callable(parameter)
         except APIError as e:
             errors[msg_index] = e.explanation
-            result = "error"
-        q.put((msg_index, result))
+        except Exception as e:
+            errors[msg_index] = e
+        return "error"
+
+    def worker():
+        while True:
+            an_object = ready.get()
+            if an_object is STOP:
+                return
+            index = msg_index(an_object)
+            q.put((index, call(obj_callable, an_object, index)))
+
+    def finished(index, result):
+        """Report an object as done, and hand those of its dependents
+        which are now ready to the pool, or skip them if any of their
+        dependencies failed. Returns the number of objects done, including
+        those skipped.
+        """
+        count = 1
+        if result == 'error':
+            progress(index, status='error')
+        else:
+            results[index] = result
+            progress(index)
+
+        for dependent in dependents[index]:
+            dependent_index = msg_index(dependent)
+            waiting_on[dependent_index] -= 1
+            if waiting_on[dependent_index]:
+                continue
+
+            failed_deps = [i for i in dep_indexes[dependent_index] if i in errors]
+            if failed_deps:
+                errors[dependent_index] = "not attempted, because {} failed".format(
+                    ", ".join(str(i) for i in failed_deps))
+                count += finished(dependent_index, "error")
+            else:
+                ready.put(dependent)
+
+        return count
 
     for an_object in objects:
-        t = Thread(
-            target=inner_execute_function,
-            args=(obj_callable, an_object, msg_index(an_object)),
-        )
+        if not waiting_on[msg_index(an_object)]:
+            ready.put(an_object)
+
+    limit = limit or get_parallel_limit() or len(objects)
+    workers = min(limit, len(objects))
+    for _ in range(workers):
+        t = Thread(target=worker)
         t.daemon = True
         t.start()
 
     done = 0
     total_to_execute = len(objects)
 
-    while done < total_to_execute:
-        try:
-            msg_index, result = q.get(timeout=1)
-            if result == 'error':
-                write_out_msg(stream, lines, msg_index, msg, status='error')
-            else:
-                write_out_msg(stream, lines, msg_index, msg)
-            done += 1
-        except Empty:
-            pass
-
-    if errors:
+    try:
+        while done < total_to_execute:
+            try:
+                index, result = q.get(timeout=1)
+                done += finished(index, result)
+            except Empty:
+                pass
+    finally:
+        for _ in range(workers):
+            ready.put(STOP)
+
+    if errors and not quiet:
         stream.write("\n")
         for error in errors:
             stream.write("ERROR: for {}  {} \n".format(error, errors[error]))
 
+    return results, errors
+
+
+def get_parallel_limit():
+    """The number of threads to run parallel calls on when no limit is
+    given, from `COMPOSE_PARALLEL_LIMIT`, or None if it isn't set.
+    """
+    value = os.environ.get('COMPOSE_PARALLEL_LIMIT')
+    if not value:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        log.warn("Ignoring COMPOSE_PARALLEL_LIMIT=%s, which isn't a positive number", value)
+        return None
+    return limit
+
 
 def write_out_msg(stream, lines, msg_index, msg, status="done"):
     """
@@ -0,0 +1,314 @@
+"""
+Keep a project's containers in the state `up` leaves them in, by following
+the Docker events stream.
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import logging
+import threading
+import time
+
+from docker.errors import APIError
+from requests.packages.urllib3.exceptions import ReadTimeoutError
+
+from .const import DEFAULT_TIMEOUT, LABEL_ONE_OFF, LABEL_PROJECT, LABEL_SERVICE
+from .const import LABEL_CONFIG_HASH
+from .container import Container
+from .legacy import forget_legacy_containers
+from .service import get_image_ids, get_repo_tag
+from .utils import get_error_message
+
+
+log = logging.getLogger(__name__)
+
+
+RUNNING_EVENTS = ['start', 'restart', 'unpause']
+STOPPED_EVENTS = ['die']
+
+# Seconds to wait before converging a service again after it was converged,
+# doubled each time it has to be converged again, up to the maximum. A
+# service which stays converged for the maximum starts over without a wait.
+RETRY_BACKOFF = 1
+MAX_RETRY_BACKOFF = 60
+
+
+class ProjectWatcher(object):
+    """
+    Watches the containers of `services` and converges any service whose
+    containers die, are removed, or have a config hash which doesn't match
+    the service.
+
+    The containers are read from a single listing when watching starts, and
+    from then on an index of them is kept up to date from the events stream.
+    Deciding whether a service needs converging doesn't make any requests,
+    so nothing but the events stream is read while everything is up.
+
+    Each service is kept at the number of containers it had when watching
+    started, or as many as it has had since. Images are only read when
+    watching starts, so a service isn't recreated for a newer image.
+
+    A service which has to be converged again soon after it was converged,
+    like one whose containers crash on start, is converged with a growing
+    delay (see `RETRY_BACKOFF`) rather than as soon as its events come in.
+    """
+
+    def __init__(self, project, services, timeout=DEFAULT_TIMEOUT):
+        self.project = project
+        self.client = project.client
+        self.services = dict((service.name, service) for service in services)
+        self.timeout = timeout
+        self.containers = {}
+        self.scale = {}
+        self.image_ids = {}
+        self.converged_at = {}
+        self.backoff = {}
+        self.retries = {}
+        # Held while handling an event or a retry, which run on different
+        # threads and both update the index
+        self.lock = threading.RLock()
+
+    def watch(self):
+        """Converge services as events come in, until the events stream ends
+        or the watch is interrupted.
+        """
+        # Events from before the listing are replayed, so that none are
+        # missed between reading the listing and subscribing
+        since = int(time.time())
+        self.load()
+
+        log.info("Watching %s..." % ", ".join(sorted(self.services)))
+
+        def handle(event):
+            with self.lock:
+                try:
+                    service_names = self.handle_event(event)
+                except Exception as e:
+                    log.exception("Failed to handle %s event of %s: %s" % (
+                        event.get('status'), event.get('id'), e))
+                    return
+                if service_names:
+                    self.reconcile(service_names)
+
+        follow_events(self.client, self.project.labels(), handle, since=since)
+
+    def load(self):
+        """Build the index of containers from a single listing."""
+        listed = self.client.containers(
+            all=True,
+            filters={'label': self.project.labels()})
+
+        local_images = get_image_ids(self.client)
+        for service in self.services.values():
+            self.scale[service.name] = 0
+            self.image_ids[service.name] = local_images.get(
+                get_repo_tag(service.image_name))
+
+        for container in listed:
+            self.add(Container.from_ps(self.client, container))
+
+    def add(self, container):
+        service_name = container.labels.get(LABEL_SERVICE)
+        if service_name not in self.services:
+            return
+
+        self.containers[container.id] = container
+        self.scale[service_name] = max(
+            self.scale.get(service_name, 0),
+            len(self.service_containers(service_name)))
+
+    def service_containers(self, service_name):
+        return [
+            container
+            for container in self.containers.values()
+            if container.labels.get(LABEL_SERVICE) == service_name
+            and not container.is_renamed
+        ]
+
+    def handle_event(self, event):
+        """Update the index from an event, and return the names of the
+        services which have to be converged because of it.
+        """
+        if event.get('Type', 'container') != 'container':
+            return set()
+
+        status = event.get('status')
+        container_id = event.get('id')
+        container = self.containers.get(container_id)
+
+        if status == 'create' and container is None:
+            container = self.inspect(container_id)
+            if container is not None:
+                self.add(container)
+            return self.unconverged(container)
+
+        if container is None:
+            return set()
+
+        if status in RUNNING_EVENTS:
+            set_running(container, True)
+        elif status in STOPPED_EVENTS:
+            set_running(container, False)
+        elif status == 'destroy':
+            del self.containers[container_id]
+
+        return self.unconverged(container)
+
+    def inspect(self, container_id):
+        try:
+            container = Container.from_id(self.client, container_id)
+        except APIError as e:
+            log.debug("Could not inspect %s: %s", container_id, e)
+            return None
+
+        labels = container.labels
+        if (labels.get(LABEL_PROJECT) != self.project.name or
+                labels.get(LABEL_ONE_OFF) == "True"):
+            return None
+        return container
+
+    def unconverged(self, container):
+        """Return the name of the service of `container`, if the index shows
+        that the service isn't converged.
+        """
+        if container is None:
+            return set()
+
+        service_name = container.labels.get(LABEL_SERVICE)
+        if service_name not in self.services:
+            return set()
+
+        if self.is_converged(service_name):
+            return set()
+        return set([service_name])
+
+    def is_converged(self, service_name):
+        service = self.services[service_name]
+        containers = self.service_containers(service_name)
+
+        if len(containers) < self.scale[service_name]:
+            return False
+
+        # Docker restarts the containers of services with a restart policy
+        if (not service.options.get('restart') and
+                not all(c.is_running for c in containers)):
+            return False
+
+        image_id = self.image_ids[service_name]
+        if image_id:
+            config_hash = service.config_hash(image_id=image_id)
+            if any(c.labels.get(LABEL_CONFIG_HASH) != config_hash for c in containers):
+                return False
+
+        return True
+
+    def reconcile(self, service_names):
+        """Converge each of `service_names`, in dependency order. A service
+        which was converged too recently is retried once its backoff has
+        passed. A service which fails to converge is logged, and converged
+        again on its next event or retry.
+        """
+        # Look for legacy containers again, as a watch runs for a long time
+        forget_legacy_containers(self.client, self.project.name)
+
+        for service in self.project.get_services(list(service_names)):
+            if service.name not in self.services:
+                continue
+
+            delay = self.retry_delay(service.name)
+            if delay > 0:
+                self.schedule_retry(service.name, delay)
+                continue
+
+            try:
+                self.converge(service)
+            except Exception as e:
+                # A watch keeps going whatever goes wrong with a service, so
+                # errors which aren't reported with a message get a traceback
+                message = get_error_message(e)
+                if message is None:
+                    log.exception("Failed to converge %s: %s" % (service.name, e))
+                else:
+                    log.error("Failed to converge %s: %s" % (service.name, message))
+
+    def retry_delay(self, service_name):
+        """Return how many seconds are left before `service_name` can be
+        converged again, and start its next backoff if it can be converged
+        now.
+        """
+        now = time.time()
+        converged_at = self.converged_at.get(service_name)
+        backoff = self.backoff.get(service_name, 0)
+
+        if converged_at is None or now - converged_at >= MAX_RETRY_BACKOFF:
+            backoff = 0
+        elif now - converged_at < backoff:
+            return converged_at + backoff - now
+
+        self.converged_at[service_name] = now
+        self.backoff[service_name] = min(
+            max(backoff * 2, RETRY_BACKOFF),
+            MAX_RETRY_BACKOFF)
+        return 0
+
+    def schedule_retry(self, service_name, delay):
+        if service_name in self.retries:
+            return
+
+        log.info("Converging %s again in %.1f seconds" % (service_name, delay))
+        timer = threading.Timer(delay, self.retry, args=[service_name])
+        timer.daemon = True
+        self.retries[service_name] = timer
+        timer.start()
+
+    def retry(self, service_name):
+        with self.lock:
+            del self.retries[service_name]
+            if not self.is_converged(service_name):
+                self.reconcile([service_name])
+
+    def converge(self, service):
+        plan = service.convergence_plan(
+            containers=self.service_containers(service.name),
+            image_id=self.image_ids[service.name])
+
+        converged = service.execute_convergence_plan(
+            plan,
+            do_build=False,
+            timeout=self.timeout)
+
+        for container in plan.containers:
+            if plan.actions[container] == 'recreate':
+                self.containers.pop(container.id, None)
+
+        for container in converged:
+            self.add(container)
+            set_running(container, True)
+
+        for _ in range(self.scale[service.name] - len(self.service_containers(service.name))):
+            container = service.create_container(do_build=False)
+            service.start_container(container)
+            self.add(container)
+            set_running(container, True)
+
+
+def follow_events(client, labels, handle, since=None):
+    """Call `handle` with each event of the containers with `labels`, from
+    `since`, until the events stream ends. The stream is read with the
+    client's timeout, so it's subscribed to again, from the time of the last
+    event, whenever it's idle for longer than that.
+    """
+    while True:
+        try:
+            for event in client.events(
+                    since=since,
+                    filters={'label': labels},
+                    decode=True):
+                since = event.get('time', since)
+                handle(event)
+            return
+        except ReadTimeoutError:
+            log.debug("Resubscribing to events since %s", since)
+
+
+def set_running(container, running):
+    container.dictionary.setdefault('State', {})['Running'] = running
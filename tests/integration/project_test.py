@@ -89,7 +89,7 @@ class ProjectTest(DockerClientTestCase):
             client=self.client,
         )
         db = project.get_service('db')
-        self.assertEqual(db.volumes_from, [data_container])
+        self.assertEqual([v.id for v in db.volumes_from], [data_container.id])
 
     def test_net_from_service(self):
         project = Project.from_dicts(
@@ -177,7 +177,7 @@ class ServiceStateTest(DockerClientTestCase):
 
     def test_trigger_create(self):
         web = self.create_service('web')
-        self.assertEqual(('create', []), web.convergence_plan())
+        self.assertEqual(('create', []), web.convergence_plan()[:2])
 
     def test_trigger_noop(self):
         web = self.create_service('web')
@@ -185,7 +185,7 @@ class ServiceStateTest(DockerClientTestCase):
         web.start()
 
         web = self.create_service('web')
-        self.assertEqual(('noop', [container]), web.convergence_plan())
+        self.assertEqual(('noop', [container]), web.convergence_plan()[:2])
 
     def test_trigger_start(self):
         options = dict(command=["top"])
@@ -200,9 +200,11 @@ class ServiceStateTest(DockerClientTestCase):
         self.assertEqual([c.is_running for c in containers], [False, True])
 
         web = self.create_service('web', **options)
+        plan = web.convergence_plan()
+        self.assertEqual(plan.action, 'start')
         self.assertEqual(
-            ('start', containers[0:1]),
-            web.convergence_plan(),
+            plan.actions,
+            {containers[0]: 'start', containers[1]: 'noop'},
         )
 
     def test_trigger_recreate_with_config_change(self):
@@ -210,14 +212,14 @@ class ServiceStateTest(DockerClientTestCase):
         container = web.create_container()
 
         web = self.create_service('web', command=["top", "-d", "1"])
-        self.assertEqual(('recreate', [container]), web.convergence_plan())
+        self.assertEqual(('recreate', [container]), web.convergence_plan()[:2])
 
     def test_trigger_recreate_with_nonexistent_image_tag(self):
         web = self.create_service('web', image="busybox:latest")
         container = web.create_container()
 
         web = self.create_service('web', image="nonexistent-image")
-        self.assertEqual(('recreate', [container]), web.convergence_plan())
+        self.assertEqual(('recreate', [container]), web.convergence_plan()[:2])
 
     def test_trigger_recreate_with_image_change(self):
         repo = 'composetest_myimage'
@@ -237,7 +239,7 @@ class ServiceStateTest(DockerClientTestCase):
             self.client.remove_container(c)
 
             web = self.create_service('web', image=image)
-            self.assertEqual(('recreate', [container]), web.convergence_plan())
+            self.assertEqual(('recreate', [container]), web.convergence_plan()[:2])
 
         finally:
             self.client.remove_image(image)
@@ -260,7 +262,7 @@ class ServiceStateTest(DockerClientTestCase):
             web.build()
 
             web = self.create_service('web', build=context)
-            self.assertEqual(('recreate', [container]), web.convergence_plan())
+            self.assertEqual(('recreate', [container]), web.convergence_plan()[:2])
         finally:
             shutil.rmtree(context)
 
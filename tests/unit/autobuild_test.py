@@ -0,0 +1,132 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+
+import docker
+import mock
+from docker.errors import APIError
+
+from .. import unittest
+from compose.autobuild import ContextWatcher, get_excludes, is_excluded, snapshot_context
+from compose.project import Project
+
+
+def write(path, content=''):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class SnapshotContextTest(unittest.TestCase):
+    def setUp(self):
+        self.context = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.context)
+
+    def test_dockerignore(self):
+        write(os.path.join(self.context, '.dockerignore'),
+              '*.pyc\n\nnode_modules/\n./build \n  \n')
+        self.assertEqual(get_excludes(self.context), ['*.pyc', 'node_modules', 'build'])
+
+    def test_is_excluded(self):
+        self.assertTrue(is_excluded('app.pyc', ['*.pyc']))
+        self.assertFalse(is_excluded(os.path.join('lib', 'x.pyc'), ['*.pyc']))
+        self.assertTrue(is_excluded(os.path.join('lib', 'x.pyc'), ['*/*.pyc']))
+        self.assertTrue(is_excluded(os.path.join('node_modules', 'a', 'b.js'), ['node_modules']))
+        self.assertTrue(is_excluded(os.path.join('src', 'tmp', 'a'), ['src/t?p']))
+        self.assertFalse(is_excluded('node_modules_old', ['node_modules']))
+
+    def test_missing_dockerignore(self):
+        self.assertEqual(get_excludes(self.context), [])
+
+    def test_excluded_files_are_not_read(self):
+        write(os.path.join(self.context, '.dockerignore'), '*.pyc\nnode_modules\n')
+        write(os.path.join(self.context, 'Dockerfile'), 'FROM busybox')
+        write(os.path.join(self.context, 'app.py'))
+        write(os.path.join(self.context, 'app.pyc'))
+        write(os.path.join(self.context, 'node_modules', 'lib.js'))
+        write(os.path.join(self.context, 'lib', 'util.py'))
+
+        with mock.patch('os.lstat', wraps=os.lstat) as mock_lstat:
+            snapshot = snapshot_context(self.context)
+
+        self.assertEqual(
+            sorted(snapshot),
+            ['.dockerignore', 'Dockerfile', 'app.py', os.path.join('lib', 'util.py')])
+        statted = [args[0] for args, _ in mock_lstat.call_args_list]
+        self.assertNotIn(os.path.join(self.context, 'app.pyc'), statted)
+        self.assertFalse(any('node_modules' in path for path in statted))
+
+    def test_dockerfiles_are_always_read(self):
+        write(os.path.join(self.context, '.dockerignore'), '.dockerignore\ndocker/\n')
+        write(os.path.join(self.context, 'docker', 'Dockerfile.dev'), 'FROM busybox')
+        write(os.path.join(self.context, 'docker', 'notes.txt'))
+
+        snapshot = snapshot_context(self.context, ['./docker/Dockerfile.dev'])
+
+        self.assertEqual(
+            sorted(snapshot),
+            ['.dockerignore', os.path.join('docker', 'Dockerfile.dev')])
+
+
+class ContextWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.project = Project.from_dicts('composetest', [
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'web', 'build': '/web'},
+            {'name': 'worker', 'build': '/web', 'dockerfile': 'Dockerfile.worker'},
+            {'name': 'api', 'build': '/api'},
+        ], self.mock_client)
+        self.project.rebuild = mock.Mock()
+        self.watcher = ContextWatcher(self.project, self.project.services, limit=2, timeout=5)
+
+    def test_contexts(self):
+        self.assertEqual(self.watcher.contexts, {
+            '/web': ['web', 'worker'],
+            '/api': ['api'],
+        })
+        self.assertEqual(self.watcher.dockerfiles, {
+            '/web': set(['Dockerfile', 'Dockerfile.worker']),
+            '/api': set(['Dockerfile']),
+        })
+
+    def watch(self, snapshots):
+        """Run the watcher over a sequence of snapshots of each context,
+        stopping when they run out.
+        """
+        snapshots = iter(snapshots)
+
+        def snapshot_context(path, dockerfiles):
+            return next(snapshots)[path]
+
+        with mock.patch('compose.autobuild.snapshot_context', side_effect=snapshot_context), \
+                mock.patch('compose.autobuild.time.sleep'):
+            self.assertRaises(StopIteration, self.watcher.watch)
+
+    def test_burst_of_changes_is_built_once(self):
+        unchanged = {'/web': {'app.py': (1, 1)}, '/api': {'main.go': (1, 1)}}
+        saved = {'/web': {'app.py': (2, 1)}, '/api': {'main.go': (1, 1)}}
+        saved_again = {'/web': {'app.py': (3, 1)}, '/api': {'main.go': (1, 1)}}
+
+        # Two snapshots per poll, one for each context, in dict order
+        self.watch([
+            unchanged, unchanged,
+            saved, saved,
+            saved_again, saved_again,
+            saved_again, saved_again,
+            saved_again, saved_again,
+        ])
+
+        self.project.rebuild.assert_called_once_with(
+            ['web', 'worker'], limit=2, timeout=5)
+
+    def test_errors_are_logged(self):
+        self.project.rebuild.side_effect = APIError(None, None, "boom")
+
+        with mock.patch('compose.autobuild.log') as mock_log:
+            self.watcher.rebuild(set(['api']))
+
+        mock_log.error.assert_called_once_with("Failed to recreate api: boom")
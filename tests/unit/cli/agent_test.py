@@ -0,0 +1,314 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+import docker
+import mock
+import six
+
+from compose.cli.agent import (
+    Agent,
+    CachedClient,
+    ContainerCache,
+    forward,
+    get_request,
+    get_server,
+    matches_labels,
+)
+from compose.cli.main import TopLevelCommand
+from tests import unittest
+from tests.unit.helpers import container_listing
+
+
+FIXTURE_DIR = os.path.abspath('tests/fixtures/simple-composefile')
+PROJECT_LABELS = ['com.docker.compose.project=simplecomposefile']
+
+
+def ps(service, status='Up 1 second', one_off=False):
+    return container_listing(
+        service, project='simplecomposefile', id='%s_id' % service,
+        status=status, one_off=one_off, Ports=[])
+
+
+def inspect(container_id):
+    return {
+        'Id': container_id,
+        'Name': '/simplecomposefile_%s_1' % container_id[:-3],
+        'Config': {'Cmd': ['top'], 'Entrypoint': None, 'Labels': {}},
+        'State': {'Running': True, 'Paused': False, 'ExitCode': 0},
+        'NetworkSettings': {'Ports': {}},
+    }
+
+
+class MatchesLabelsTest(unittest.TestCase):
+
+    def test_matches_labels(self):
+        labels = {'a': '1', 'b': ''}
+        self.assertTrue(matches_labels(labels, ['a=1', 'b']))
+        self.assertTrue(matches_labels(labels, ['b=']))
+        self.assertFalse(matches_labels(labels, ['a=2']))
+        self.assertFalse(matches_labels(labels, ['c']))
+
+
+class CachedClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.containers.return_value = [
+            ps('simple'),
+            ps('another', status='Exited (0) 1 second ago'),
+            ps('run', one_off=True),
+        ]
+        self.mock_client.inspect_container.side_effect = inspect
+        self.cache = ContainerCache(self.mock_client, PROJECT_LABELS)
+        self.cache.enabled = True
+        self.cache.refresh()
+        self.mock_client.reset_mock()
+        self.client = CachedClient(self.mock_client, self.cache)
+        self.client.use_cache()
+
+    def listed_ids(self, **kwargs):
+        return [c['Id'] for c in self.client.containers(**kwargs)]
+
+    def test_project_listings_are_cached(self):
+        labels = PROJECT_LABELS + ['com.docker.compose.oneoff=False']
+        self.assertEqual(
+            self.listed_ids(all=True, filters={'label': labels}),
+            ['simple_id', 'another_id'])
+        self.assertEqual(
+            self.listed_ids(filters={'label': labels}),
+            ['simple_id'])
+        self.assertEqual(self.mock_client.method_calls, [])
+
+    def test_refresh_only_lists(self):
+        self.cache.invalidate()
+        self.cache.refresh()
+        self.assertEqual(self.mock_client.method_calls, [
+            mock.call.containers(all=True, filters={'label': PROJECT_LABELS}),
+        ])
+
+    def test_inspects_are_read_once(self):
+        for _ in range(2):
+            self.assertEqual(
+                self.client.inspect_container('simple_id'),
+                inspect('simple_id'))
+        self.mock_client.inspect_container.assert_called_once_with('simple_id')
+
+    def test_inspects_are_not_kept_if_the_container_changes(self):
+        def inspect_during_an_event(container_id):
+            self.cache.handle_event({'status': 'die', 'id': container_id})
+            return inspect(container_id)
+
+        self.mock_client.inspect_container.side_effect = inspect_during_an_event
+        self.client.inspect_container('simple_id')
+
+        self.assertEqual(self.cache.inspected, {})
+
+    def test_other_listings_are_not_cached(self):
+        self.client.containers(all=True)
+        self.client.containers(filters={'label': ['other=1']})
+        self.client.containers(filters={'label': PROJECT_LABELS}, quiet=True)
+        self.assertEqual(self.mock_client.containers.call_count, 3)
+
+    def test_cache_is_not_used_after_a_change(self):
+        self.client.stop('simple_id')
+        self.client.containers(all=True, filters={'label': PROJECT_LABELS})
+        self.client.inspect_container('simple_id')
+
+        self.mock_client.stop.assert_called_once_with('simple_id')
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+        self.assertEqual(self.mock_client.inspect_container.call_count, 1)
+
+    def test_events_invalidate_the_cache(self):
+        self.client.inspect_container('simple_id')
+        self.cache.handle_event({'status': 'exec_start: top', 'id': 'simple_id'})
+        self.cache.refresh()
+        self.client.inspect_container('simple_id')
+        self.assertEqual(self.mock_client.inspect_container.call_count, 1)
+        self.assertEqual(self.mock_client.containers.call_count, 0)
+
+        self.cache.handle_event({'status': 'die', 'id': 'simple_id'})
+        self.cache.refresh()
+        self.client.inspect_container('simple_id')
+
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+        self.assertEqual(self.mock_client.inspect_container.call_count, 2)
+
+    def test_cache_is_not_used_once_the_events_stream_ends(self):
+        self.mock_client.events.return_value = iter([])
+
+        with mock.patch('compose.cli.agent.log'):
+            self.cache.follow()
+        self.cache.refresh()
+        self.client.use_cache()
+        self.client.containers(all=True, filters={'label': PROJECT_LABELS})
+
+        self.assertFalse(self.cache.enabled)
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+
+
+class AgentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.containers.return_value = [ps('simple'), ps('another')]
+        self.mock_client.inspect_container.side_effect = inspect
+
+        command = TopLevelCommand()
+        command.base_dir = FIXTURE_DIR
+        command.project_options = dict(config_path=None, project_name=None, verbose=False)
+        command.get_client = lambda: self.mock_client
+        self.agent = Agent(command, fork=False)
+        # As if the events stream was followed
+        self.agent.cache.enabled = True
+
+    def request(self, *argv, **kwargs):
+        request = get_request(list(argv))
+        request['cwd'] = kwargs.get('cwd', FIXTURE_DIR)
+        output = six.BytesIO()
+
+        self.agent.handle(six.BytesIO(json.dumps(request).encode('utf-8') + b'\n'), output)
+
+        return [
+            json.loads(line.decode('utf-8'))
+            for line in output.getvalue().splitlines()
+        ]
+
+    def test_ps_is_served_from_the_cache(self):
+        frames = self.request('ps')
+        self.assertEqual(frames[-1], {'exit': 0})
+        output = ''.join(frame.get('out', '') for frame in frames)
+        self.assertIn('simplecomposefile_simple_1', output)
+        self.assertIn('simplecomposefile_another_1', output)
+
+        self.mock_client.reset_mock()
+        self.assertEqual(self.request('ps', '-q')[-1], {'exit': 0})
+        self.assertEqual(self.mock_client.method_calls, [])
+
+    def test_errors_are_sent_with_the_exit_status(self):
+        frames = self.request('port', '--index=2', 'simple', '80')
+        self.assertEqual(frames[-1], {'exit': 1})
+        self.assertIn(
+            'No container found for simple_2',
+            ''.join(frame.get('err', '') for frame in frames))
+
+    def test_changes_invalidate_the_cache(self):
+        self.request('ps')
+        self.request('kill')
+        self.mock_client.reset_mock()
+
+        self.request('ps')
+
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+
+    def test_containers_created_after_the_events_stream_ends_are_listed(self):
+        self.mock_client.containers.return_value = [ps('simple')]
+        self.request('ps')
+
+        self.mock_client.events.return_value = iter([])
+        with mock.patch('compose.cli.agent.log'):
+            self.agent.cache.follow()
+        self.mock_client.containers.return_value = [ps('simple'), ps('another')]
+
+        output = ''.join(frame.get('out', '') for frame in self.request('ps'))
+        self.assertIn('simplecomposefile_another_1', output)
+
+    @mock.patch('compose.cli.agent.time', autospec=True)
+    def test_events_stream_is_subscribed_to_again_with_a_backoff(self, mock_time):
+        class Stop(Exception):
+            pass
+
+        # The stream ends at once twice, and then after a long while
+        mock_time.time.side_effect = [0, 0, 10, 10, 20, 100]
+        mock_time.sleep.side_effect = [None, None, Stop()]
+        self.agent.cache = mock.Mock()
+
+        with mock.patch('compose.cli.agent.log'):
+            self.assertRaises(Stop, self.agent.follow_events)
+
+        self.assertEqual(self.agent.cache.follow.call_count, 3)
+        self.assertEqual(
+            mock_time.sleep.call_args_list,
+            [mock.call(1), mock.call(2), mock.call(1)])
+
+    @mock.patch('compose.cli.agent.os.fork', autospec=True)
+    def test_forks_with_the_cache_lock_held(self, mock_fork):
+        lock = self.agent.cache.lock
+        mock_fork.side_effect = lambda: self.assertFalse(lock.acquire(False)) or 1
+
+        self.assertEqual(self.agent.fork_child(), 1)
+        self.assertTrue(lock.acquire(False))
+
+    def test_fallbacks(self):
+        for argv in [['run', 'simple'], ['up'], ['rm'], ['--verbose', 'ps'],
+                     ['-p', 'other', 'ps'], ['ps', '--help'], ['nope']]:
+            frames = self.request(*argv)
+            self.assertEqual(list(frames[0]), ['fallback'], argv)
+
+        self.assertEqual(
+            list(self.request('ps', cwd=os.path.dirname(FIXTURE_DIR))[0]),
+            ['fallback'])
+
+        with mock.patch.dict(os.environ, {'DOCKER_HOST': 'tcp://elsewhere:2375'}):
+            self.assertEqual(list(self.request('ps')[0]), ['fallback'])
+
+
+class ForwardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, 'agent.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def serve(self, frames):
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen(1)
+        requests = []
+
+        def respond():
+            conn, _ = server.accept()
+            requests.append(json.loads(conn.makefile('rb').readline().decode('utf-8')))
+            for frame in frames:
+                conn.sendall(json.dumps(frame).encode('utf-8') + b'\n')
+            conn.close()
+            server.close()
+
+        thread = threading.Thread(target=respond)
+        thread.start()
+        return thread, requests
+
+    def test_no_agent(self):
+        self.assertIsNone(forward(self.socket_path, ['ps']))
+
+    def test_output_and_exit_status(self):
+        thread, requests = self.serve([{'out': 'hello\n'}, {'err': 'oops\n'}, {'exit': 3}])
+
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout, \
+                mock.patch('sys.stderr', new_callable=six.StringIO) as stderr:
+            self.assertEqual(forward(self.socket_path, ['ps']), 3)
+        thread.join()
+
+        self.assertEqual(stdout.getvalue(), 'hello\n')
+        self.assertEqual(stderr.getvalue(), 'oops\n')
+        self.assertEqual(requests[0]['argv'], ['ps'])
+        self.assertEqual(requests[0]['cwd'], os.getcwd())
+
+    def test_fallback(self):
+        thread, _ = self.serve([{'fallback': 'run isn\'t served'}])
+        self.assertIsNone(forward(self.socket_path, ['run', 'web']))
+        thread.join()
+
+    def test_socket_is_only_accessible_to_its_user(self):
+        server = get_server(mock.Mock(), self.socket_path)
+        try:
+            self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+        finally:
+            server.server_close()
@@ -0,0 +1,17 @@
+from __future__ import absolute_import
+from inspect import getdoc
+
+from compose.cli.docopt_command import docopt_full_help
+from compose.cli.main import TopLevelCommand
+from tests import unittest
+
+
+class DocoptFullHelpTestCase(unittest.TestCase):
+
+    def test_invalid_arguments_show_full_help(self):
+        docstring = getdoc(TopLevelCommand.port)
+
+        with self.assertRaises(SystemExit) as ctx:
+            docopt_full_help(docstring, ['--nope'], options_first=True)
+
+        self.assertEqual(ctx.exception.code, docstring)
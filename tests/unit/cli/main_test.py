@@ -0,0 +1,117 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+
+from tests import unittest
+
+
+STARTUP_SCRIPT = """
+import json
+import sys
+import time
+
+start = time.time()
+from compose.cli.main import TopLevelCommand, main
+try:
+    if sys.argv[1:2] == ['--main']:
+        sys.argv.pop(1)
+        main()
+    else:
+        TopLevelCommand().dispatch(sys.argv[1:], None)
+except SystemExit:
+    pass
+elapsed = time.time() - start
+
+sys.stdout.write(json.dumps({
+    'elapsed': elapsed,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+DAEMON_MODULES = [
+    'compose.project',
+    'compose.service',
+    'docker',
+    'dockerpty',
+    'requests',
+    'websocket',
+]
+
+HEAVY_MODULES = DAEMON_MODULES + [
+    'texttable',
+    'yaml',
+]
+
+# Seconds to import the CLI and dispatch a command, excluding interpreter
+# startup. Wall-clock time varies too much on a loaded machine to check it by
+# default, so it's only checked when this is set, on a quiet machine.
+STARTUP_BUDGET = float(os.environ.get('COMPOSE_TEST_STARTUP_BUDGET') or 0)
+
+
+def run_startup(*argv, **kwargs):
+    output = subprocess.check_output(
+        [sys.executable, '-c', STARTUP_SCRIPT] + list(argv),
+        env=kwargs.get('env'))
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def check_startup(self, *argv, **kwargs):
+        results = [run_startup(*argv, **kwargs) for _ in range(3 if STARTUP_BUDGET else 1)]
+
+        imported = set(HEAVY_MODULES) & set(results[0]['modules'])
+        self.assertEqual(imported, set())
+        if STARTUP_BUDGET:
+            self.assertLess(min(r['elapsed'] for r in results), STARTUP_BUDGET)
+
+    def test_version_is_fast(self):
+        self.check_startup('version', '--short')
+
+    def test_help_is_fast(self):
+        self.check_startup('help', 'up')
+
+    def test_top_level_help_is_fast(self):
+        self.check_startup('-h')
+
+    def test_services_does_not_load_daemon_modules(self):
+        result = run_startup(
+            '--file', 'tests/fixtures/simple-composefile/docker-compose.yml',
+            'services')
+
+        imported = set(DAEMON_MODULES) & set(result['modules'])
+        self.assertEqual(imported, set())
+
+    def test_forwarding_to_the_agent_is_fast(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        socket_path = os.path.join(tmpdir, 'agent.sock')
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(1)
+
+        def respond():
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except socket.error:
+                    return
+                conn.makefile('rb').readline()
+                conn.sendall(b'{"out": "web\\n"}\n{"exit": 0}\n')
+                conn.close()
+
+        thread = threading.Thread(target=respond)
+        thread.daemon = True
+        thread.start()
+
+        env = dict(os.environ, COMPOSE_AGENT_SOCKET=socket_path)
+        self.check_startup('--main', 'ps', env=env)
+        server.close()
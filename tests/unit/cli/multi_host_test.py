@@ -0,0 +1,331 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import threading
+
+import docker
+import mock
+import six
+from docker.errors import APIError
+from requests.packages.urllib3.exceptions import ReadTimeoutError
+
+from compose.cli import docker_client
+from compose.cli.errors import UserError
+from compose.cli.main import TopLevelCommand
+from compose.cli.multi_host import MultiHostClient, binpack
+from compose.project import Project
+from tests import unittest
+
+
+class FakeDaemon(object):
+    """Enough of a Docker daemon, behind a mock client, for a project to
+    create, list, start and remove containers on it.
+    """
+
+    def __init__(self, base_url, ncpu=4, images=('busybox:latest',)):
+        self.containers = {}
+        self.images = list(images)
+        self.client = mock.create_autospec(docker.Client)
+        self.client.base_url = base_url
+        self.client.containers.side_effect = self.list
+        self.client.create_container.side_effect = self.create
+        self.client.inspect_container.side_effect = self.inspect
+        self.client.remove_container.side_effect = self.remove
+        self.client.start.side_effect = lambda container_id: self.set_running(container_id, True)
+        self.client.stop.side_effect = lambda container_id, **kwargs: self.set_running(container_id, False)
+        self.client.inspect_image.side_effect = self.inspect_image
+        self.client.images.return_value = [
+            {'Id': '%s-id' % image, 'RepoTags': [image]} for image in images
+        ]
+        self.client.info.return_value = {'NCPU': ncpu}
+
+    def names(self):
+        return sorted(c['Name'].lstrip('/') for c in self.containers.values())
+
+    def list(self, filters=None, **kwargs):
+        labels = (filters or {}).get('label') or []
+        return [
+            {
+                'Id': container['Id'],
+                'Image': container['Image'],
+                'Names': [container['Name']],
+                'Status': 'Up 1 second' if container['State']['Running'] else 'Exited (0)',
+                'Labels': container['Config']['Labels'],
+            }
+            for container in self.containers.values()
+            if (kwargs.get('all') or container['State']['Running'])
+            and set(labels) <= set(
+                '%s=%s' % item for item in container['Config']['Labels'].items())
+        ]
+
+    def set_running(self, container_id, running):
+        self.inspect(container_id)['State']['Running'] = running
+
+    def create(self, **options):
+        container_id = '%s-%s' % (self.client.base_url, options['name'])
+        self.containers[container_id] = {
+            'Id': container_id,
+            'Image': options['image'],
+            'Name': '/' + options['name'],
+            'Config': {'Labels': options.get('labels') or {}},
+            'State': {'Running': False},
+        }
+        return {'Id': container_id}
+
+    def inspect(self, container_id):
+        for container in self.containers.values():
+            if container_id in (container['Id'], container['Name'].lstrip('/')):
+                return container
+        raise APIError('Not found', mock.Mock(status_code=404))
+
+    def remove(self, container_id, **kwargs):
+        del self.containers[self.inspect(container_id)['Id']]
+
+    def inspect_image(self, image):
+        if image not in self.images:
+            raise APIError('Not found', mock.Mock(status_code=404))
+        return {'Id': '%s-id' % image}
+
+
+class MultiHostClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.daemons = [FakeDaemon('tcp://a:2375'), FakeDaemon('tcp://b:2375')]
+        self.client = MultiHostClient([daemon.client for daemon in self.daemons])
+
+    def get_project(self, *service_dicts):
+        return Project.from_dicts('composetest', list(service_dicts), self.client)
+
+    def scale(self, project, service_name, num):
+        with mock.patch('sys.stdout', new_callable=six.StringIO):
+            project.get_service(service_name).scale(num)
+
+    def test_replicas_are_spread(self):
+        project = self.get_project({'name': 'web', 'image': 'busybox:latest'})
+
+        self.scale(project, 'web', 4)
+
+        # Replicas are created at the same time, so which host each is on varies
+        self.assertEqual(len(self.daemons[0].containers), 2)
+        self.assertEqual(len(self.daemons[1].containers), 2)
+        for daemon in self.daemons:
+            self.assertEqual(
+                sorted(call[0][0] for call in daemon.client.start.call_args_list),
+                sorted(daemon.containers))
+
+    def test_listings_are_merged(self):
+        project = self.get_project({'name': 'web', 'image': 'busybox:latest'})
+        self.scale(project, 'web', 3)
+
+        self.assertEqual(
+            sorted(c.name for c in project.containers()),
+            ['composetest_web_1', 'composetest_web_2', 'composetest_web_3'])
+
+    def test_scale_down_removes_from_each_host(self):
+        project = self.get_project({'name': 'web', 'image': 'busybox:latest'})
+        self.scale(project, 'web', 4)
+
+        self.scale(project, 'web', 0)
+
+        self.assertEqual(self.daemons[0].names(), [])
+        self.assertEqual(self.daemons[1].names(), [])
+
+    def test_binpack_fills_hosts_in_turn(self):
+        self.daemons = [FakeDaemon('tcp://a:2375', ncpu=2), FakeDaemon('tcp://b:2375', ncpu=2)]
+        self.client = MultiHostClient(
+            [daemon.client for daemon in self.daemons],
+            strategy=binpack)
+        project = self.get_project({'name': 'web', 'image': 'busybox:latest'})
+
+        self.scale(project, 'web', 3)
+
+        self.assertEqual(len(self.daemons[0].containers), 2)
+        self.assertEqual(len(self.daemons[1].containers), 1)
+
+    def test_pinned_by_label(self):
+        project = self.get_project({
+            'name': 'web',
+            'image': 'busybox:latest',
+            'labels': {'com.docker.compose.host': 'b'},
+        })
+
+        self.scale(project, 'web', 2)
+
+        self.assertEqual(self.daemons[0].names(), [])
+        self.assertEqual(len(self.daemons[1].containers), 2)
+
+    def test_pinned_to_unknown_host(self):
+        project = self.get_project({
+            'name': 'web',
+            'image': 'busybox:latest',
+            'labels': {'com.docker.compose.host': 'c'},
+        })
+
+        with self.assertRaises(UserError):
+            project.get_service('web').create_container()
+
+    def test_linked_containers_are_on_the_same_host(self):
+        project = self.get_project(
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'web', 'image': 'busybox:latest', 'links': ['db']},
+        )
+        db = self.daemons[1].create(
+            name='composetest_db_1',
+            image='busybox:latest',
+            labels={
+                'com.docker.compose.project': 'composetest',
+                'com.docker.compose.service': 'db',
+                'com.docker.compose.oneoff': 'False',
+                'com.docker.compose.container-number': '1',
+            })
+        self.daemons[1].set_running(db['Id'], True)
+
+        self.scale(project, 'web', 2)
+
+        self.assertEqual(self.daemons[0].names(), [])
+        self.assertEqual(
+            self.daemons[1].names(),
+            ['composetest_db_1', 'composetest_web_1', 'composetest_web_2'])
+
+    def test_calls_for_unlisted_containers_find_the_host(self):
+        self.daemons[1].create(name='other', image='busybox:latest')
+
+        self.client.stop('other', timeout=1)
+        self.client.start('other')
+
+        self.daemons[1].client.stop.assert_called_once_with('other', timeout=1)
+        self.assertFalse(self.daemons[0].client.stop.called)
+
+    @mock.patch('dockerpty.start', autospec=True)
+    def test_run_with_a_tty(self, mock_dockerpty_start):
+        from dockerpty.pty import PseudoTerminal
+
+        def start(client, container, interactive=True):
+            # Make the calls dockerpty makes to the client, short of
+            # attaching a terminal
+            pty = PseudoTerminal(client, container, interactive=interactive)
+            pty.container_info()
+            with mock.patch.object(pty, 'israw', return_value=True):
+                pty.resize(size=(24, 80))
+            client.start(container)
+
+        mock_dockerpty_start.side_effect = start
+        for daemon in self.daemons:
+            daemon.client.wait.return_value = 0
+        project = self.get_project({'name': 'web', 'image': 'busybox:latest'})
+
+        with mock.patch('sys.stdin') as mock_stdin, \
+                self.assertRaises(SystemExit) as exit:
+            mock_stdin.isatty.return_value = True
+            TopLevelCommand().run(project, {
+                'SERVICE': 'web',
+                'COMMAND': 'sh',
+                'ARGS': [],
+                '-e': None,
+                '--user': None,
+                '--no-deps': True,
+                '--allow-insecure-ssl': None,
+                '-d': None,
+                '-T': None,
+                '--entrypoint': None,
+                '--service-ports': None,
+                '--rm': None,
+            })
+
+        self.assertEqual(exit.exception.code, 0)
+        daemon = next(daemon for daemon in self.daemons if daemon.containers)
+        container_id, = daemon.containers
+        daemon.client.resize.assert_called_once_with(container_id, height=24, width=80)
+        daemon.client.wait.assert_called_once_with(container_id)
+
+    def test_images_on_every_host(self):
+        self.daemons[0] = FakeDaemon('tcp://a:2375', images=['busybox:latest', 'redis:latest'])
+        self.client = MultiHostClient([daemon.client for daemon in self.daemons])
+
+        self.assertEqual(
+            [image['RepoTags'] for image in self.client.images()],
+            [['busybox:latest'], []])
+        self.assertEqual(self.client.inspect_image('busybox:latest'), {'Id': 'busybox:latest-id'})
+        self.assertRaises(APIError, self.client.inspect_image, 'redis:latest')
+
+    def test_pull_on_each_host(self):
+        for daemon in self.daemons:
+            daemon.client.pull.return_value = iter([daemon.client.base_url])
+
+        output = list(self.client.pull('busybox', tag='latest', stream=True))
+
+        self.assertEqual(output, ['tcp://a:2375', 'tcp://b:2375'])
+
+    def test_events_from_every_host(self):
+        for daemon in self.daemons:
+            daemon.client.events.return_value = iter([{'from': daemon.client.base_url}])
+
+        self.assertEqual(
+            sorted(event['from'] for event in self.client.events(decode=True)),
+            ['tcp://a:2375', 'tcp://b:2375'])
+
+    def test_events_resubscribe_only_the_host_which_timed_out(self):
+        def idle(since=None, **kwargs):
+            if self.daemons[0].client.events.call_count == 1:
+                yield {'from': 'a', 'time': 100}
+                raise ReadTimeoutError(None, None, 'Read timed out.')
+            yield {'from': 'a', 'time': 101}
+
+        self.daemons[0].client.events.side_effect = idle
+        self.daemons[1].client.events.return_value = iter([{'from': 'b', 'time': 100}])
+
+        self.assertEqual(
+            sorted(event['time'] for event in self.client.events(since=90, decode=True)),
+            [100, 100, 101])
+        self.assertEqual(self.daemons[0].client.events.call_args_list, [
+            mock.call(since=90, decode=True),
+            mock.call(since=100, decode=True),
+        ])
+        self.daemons[1].client.events.assert_called_once_with(since=90, decode=True)
+
+    def test_events_stop_being_read_once_closed(self):
+        timed_out = threading.Event()
+
+        def idle(since=None, **kwargs):
+            yield {'from': 'a', 'time': 100}
+            timed_out.wait()
+            raise ReadTimeoutError(None, None, 'Read timed out.')
+
+        self.daemons[0].client.events.side_effect = idle
+        self.daemons[1].client.events.return_value = iter([])
+        threads = set(threading.enumerate())
+
+        events = self.client.events(decode=True)
+        self.assertEqual(next(events), {'from': 'a', 'time': 100})
+        events.close()
+        timed_out.set()
+
+        for thread in set(threading.enumerate()) - threads:
+            thread.join(1)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(self.daemons[0].client.events.call_count, 1)
+
+
+class DockerClientTest(unittest.TestCase):
+
+    def test_several_hosts(self):
+        with mock.patch.dict(os.environ, {
+                'COMPOSE_HOSTS': 'tcp://a:2375, tcp://b:2375',
+                'COMPOSE_PLACEMENT': 'binpack'}):
+            client = docker_client.docker_client()
+
+        self.assertIsInstance(client, MultiHostClient)
+        self.assertEqual(client.base_url, 'http://a:2375, http://b:2375')
+        self.assertEqual(client.strategy, binpack)
+
+    def test_one_host(self):
+        with mock.patch.dict(os.environ, {'COMPOSE_HOSTS': 'tcp://a:2375'}):
+            client = docker_client.docker_client()
+
+        self.assertIsInstance(client, docker.Client)
+
+    def test_unknown_strategy(self):
+        with mock.patch.dict(os.environ, {
+                'COMPOSE_HOSTS': 'tcp://a:2375,tcp://b:2375',
+                'COMPOSE_PLACEMENT': 'random'}):
+            self.assertRaises(UserError, docker_client.docker_client)
@@ -6,9 +6,12 @@ from .. import unittest
 import docker
 import mock
 
+from compose.cli.command import ProjectConfig
 from compose.cli.docopt_command import NoSuchCommand
-from compose.cli.main import TopLevelCommand
+from compose.cli.errors import UserError
+from compose.cli.main import TopLevelCommand, dispatch, get_rollout_options
 from compose.service import Service
+from compose.utils import ParallelExecutionError
 
 
 class CLITestCase(unittest.TestCase):
@@ -86,7 +89,101 @@ class CLITestCase(unittest.TestCase):
         with self.assertRaises(NoSuchCommand):
             TopLevelCommand().dispatch(['help', 'nonexistent'], None)
 
-    @mock.patch('compose.cli.main.dockerpty', autospec=True)
+    @mock.patch('compose.cli.main.log')
+    def test_failed_containers_exit_with_an_error(self, mock_log):
+        command = mock.Mock()
+        command.dispatch.side_effect = ParallelExecutionError(
+            "Stopping", {'composetest_web_1': 'boom'})
+
+        with self.assertRaises(SystemExit) as ctx:
+            dispatch(command, ['stop'])
+
+        self.assertEqual(ctx.exception.code, 1)
+        mock_log.error.assert_called_once_with('Stopping failed for composetest_web_1')
+
+    @mock.patch('compose.cli.main.legacy.forget_legacy_containers', autospec=True)
+    def test_each_command_looks_for_legacy_containers_again(self, mock_forget):
+        command = mock.Mock()
+        dispatch(command, ['ps'])
+        dispatch(command, ['ps'])
+        self.assertEqual(mock_forget.call_count, 2)
+
+    def test_get_project_config(self):
+        command = TopLevelCommand()
+        command.base_dir = 'tests/fixtures/longer-filename-composefile'
+        with mock.patch.object(command, 'get_client') as mock_get_client:
+            project_config = command.get_project_config()
+        self.assertEqual(project_config.name, 'longerfilenamecomposefile')
+        self.assertEqual([s['name'] for s in project_config.service_dicts], ['definedinyamlnotyml'])
+        self.assertFalse(mock_get_client.called)
+
+    @mock.patch('compose.cli.main.print', create=True)
+    def test_services(self, mock_print):
+        self.run_services(mock_print, None)
+        self.assertEqual(self.printed(mock_print), ['db', 'web', 'worker'])
+
+    @mock.patch('compose.cli.main.print', create=True)
+    def test_services_filter_build(self, mock_print):
+        self.run_services(mock_print, 'build')
+        self.assertEqual(self.printed(mock_print), ['web'])
+
+    @mock.patch('compose.cli.main.print', create=True)
+    def test_services_filter_image(self, mock_print):
+        self.run_services(mock_print, 'image')
+        self.assertEqual(self.printed(mock_print), ['db', 'worker'])
+
+    @mock.patch('compose.cli.main.print', create=True)
+    def test_services_filter_running(self, mock_print):
+        mock_client = self.run_services(mock_print, 'running')
+        self.assertEqual(self.printed(mock_print), ['web'])
+        self.assertEqual(mock_client.containers.call_count, 1)
+        self.assertFalse(mock_client.inspect_container.called)
+
+    @mock.patch('compose.cli.main.print', create=True)
+    def test_services_filter_stopped(self, mock_print):
+        self.run_services(mock_print, 'stopped')
+        self.assertEqual(self.printed(mock_print), ['db'])
+
+    def test_services_invalid_filter(self):
+        with self.assertRaises(UserError):
+            self.run_services(None, 'bogus')
+
+    def test_rollout_options(self):
+        self.assertEqual(
+            get_rollout_options({'--batch-size': '2', '--batch-delay': '0.5'}),
+            (2, 0.5))
+        self.assertEqual(
+            get_rollout_options({'--batch-size': None, '--batch-delay': None}),
+            (None, 0))
+        for size, delay in [('-1', None), ('2', '-1'), ('two', None), ('2', 'soon')]:
+            with self.assertRaises(UserError):
+                get_rollout_options({'--batch-size': size, '--batch-delay': delay})
+
+    def run_services(self, mock_print, service_filter):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.containers.side_effect = lambda all=False, filters=None: [
+            c for c in [
+                {'Labels': {'com.docker.compose.service': 'web'}, 'Status': 'Up 3 seconds'},
+                {'Labels': {'com.docker.compose.service': 'db'}, 'Status': 'Exited (0) 1 minute ago'},
+                {'Labels': {'com.docker.compose.service': 'gone'}, 'Status': 'Up 1 minute'},
+            ]
+            if all or c['Status'].startswith('Up')
+        ]
+        project_config = ProjectConfig(
+            'composetest',
+            [
+                {'name': 'web', 'build': '.'},
+                {'name': 'worker', 'image': 'busybox'},
+                {'name': 'db', 'image': 'busybox'},
+            ],
+            lambda: mock_client)
+        TopLevelCommand().services(project_config, {'--filter': service_filter})
+        return mock_client
+
+    def printed(self, mock_print):
+        return [args[0] for args, _ in mock_print.call_args_list]
+
+    @mock.patch('dockerpty.start', autospec=True)
     def test_run_with_environment_merged_with_options_list(self, mock_dockerpty):
         command = TopLevelCommand()
         mock_client = mock.create_autospec(docker.Client)
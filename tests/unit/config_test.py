@@ -58,6 +58,66 @@ class ConfigTest(unittest.TestCase):
         )
         make_service_dict('foo', {'ports': ['8000']}, 'tests/')
 
+    def test_ready_check_validation(self):
+        for ready_check in [
+            'tcp:5432',
+            {},
+            {'port': 5432, 'log': 'ready'},
+            {'prot': 5432},
+            {'port': 5432, 'timeout': '10s'},
+            {'port': 5432, 'timeout': True},
+            {'port': 5432, 'interval': 0},
+            {'port': 'http'},
+            {'port': 70000},
+            {'port': True},
+            {'log': '(unclosed'},
+            {'log': 42},
+            {'command': ['pg_isready', 5]},
+        ]:
+            self.assertRaises(
+                config.ConfigurationError,
+                lambda: make_service_dict('foo', {'ready_check': ready_check}, 'tests/')
+            )
+
+        for ready_check in [
+            {'port': 5432},
+            {'port': '5432', 'interval': 0.5},
+            {'log': 'ready to accept connections$'},
+            {'command': ['pg_isready', '-q']},
+        ]:
+            make_service_dict('foo', {'ready_check': ready_check}, 'tests/')
+
+        service_dict = make_service_dict(
+            'foo', {'ready_check': {'command': 'pg_isready', 'timeout': 30}}, 'tests/')
+        self.assertEqual(
+            service_dict['ready_check'],
+            {'command': 'pg_isready', 'timeout': 30})
+
+    def test_pin_cpus_validation(self):
+        for options in [
+            {'pin_cpus': 0},
+            {'pin_cpus': '2'},
+            {'pin_cpus': True},
+            {'pin_cpus': 2, 'cpuset': '0-1'},
+        ]:
+            self.assertRaises(
+                config.ConfigurationError,
+                lambda: make_service_dict('foo', options, 'tests/')
+            )
+
+        service_dict = make_service_dict('foo', {'pin_cpus': 2}, 'tests/')
+        self.assertEqual(service_dict['pin_cpus'], 2)
+
+    def test_spread_validation(self):
+        for spread in [True, 'strict', {'policy': 'hard'}]:
+            self.assertRaises(
+                config.ConfigurationError,
+                lambda: make_service_dict('foo', {'spread': spread}, 'tests/')
+            )
+
+        service_dict = make_service_dict('foo', {'spread': 'soft'}, 'tests/')
+        self.assertEqual(service_dict['spread'], 'soft')
+
 
 class VolumePathTest(unittest.TestCase):
     @mock.patch.dict(os.environ)
@@ -6,6 +6,7 @@ import docker
 
 from compose.container import Container
 from compose.container import get_container_name
+from compose.const import LABEL_CONTAINER_NUMBER
 
 
 class ContainerTest(unittest.TestCase):
@@ -43,8 +44,37 @@ class ContainerTest(unittest.TestCase):
                 "Id": "abc",
                 "Image": "busybox:latest",
                 "Name": "/composetest_db_1",
+                "State": {"Running": True},
             })
 
+    def test_from_ps_keeps_labels(self):
+        self.container_dict['Labels'] = {"com.docker.compose.service": "web"}
+        self.container_dict['Status'] = "Exited (0) 3 seconds ago"
+        container = Container.from_ps(None, self.container_dict)
+
+        self.assertEqual(container.labels, {"com.docker.compose.service": "web"})
+        self.assertFalse(container.is_running)
+
+    def test_from_ps_keeps_ports(self):
+        self.container_dict['Ports'] = [
+            {'PrivatePort': 8000, 'PublicPort': 49153, 'Type': 'tcp', 'IP': '0.0.0.0'},
+            {'PrivatePort': 8000, 'PublicPort': 49154, 'Type': 'tcp', 'IP': '127.0.0.1'},
+            {'PrivatePort': 53, 'Type': 'udp'},
+        ]
+        mock_client = mock.create_autospec(docker.Client)
+        container = Container.from_ps(mock_client, self.container_dict)
+
+        self.assertEqual(container.ports, {
+            '8000/tcp': [
+                {'HostIp': '0.0.0.0', 'HostPort': '49153'},
+                {'HostIp': '127.0.0.1', 'HostPort': '49154'},
+            ],
+            '53/udp': None,
+        })
+        self.assertEqual(container.get_local_port(8000), '0.0.0.0:49153')
+        self.assertIsNone(container.get_local_port(53, protocol='udp'))
+        self.assertFalse(mock_client.inspect_container.called)
+
     def test_from_ps_prefixed(self):
         self.container_dict['Names'] = ['/swarm-host-1' + n for n in self.container_dict['Names']]
 
@@ -55,6 +85,7 @@ class ContainerTest(unittest.TestCase):
             "Id": "abc",
             "Image": "busybox:latest",
             "Name": "/composetest_db_1",
+            "State": {"Running": True},
         })
 
     def test_environment(self):
@@ -123,6 +154,34 @@ class ContainerTest(unittest.TestCase):
             container.get_local_port(45454, protocol='tcp'),
             '0.0.0.0:49197')
 
+    def test_create_does_not_inspect(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.create_container.return_value = {'Id': 'abc', 'Warnings': None}
+
+        container = Container.create(
+            mock_client,
+            image='busybox:latest',
+            name='composetest_db_1',
+            labels={LABEL_CONTAINER_NUMBER: '1'})
+
+        self.assertEqual(container.id, 'abc')
+        self.assertEqual(container.name, 'composetest_db_1')
+        self.assertEqual(container.number, 1)
+        self.assertFalse(mock_client.inspect_container.called)
+
+    def test_get_inspects_for_missing_fields(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.inspect_container.return_value = {
+            'Id': 'abc',
+            'State': {'Running': True},
+        }
+        container = Container(mock_client, {'Id': 'abc', 'Config': {'Labels': {}}})
+
+        self.assertEqual(container.get('Id'), 'abc')
+        self.assertFalse(mock_client.inspect_container.called)
+        self.assertTrue(container.is_running)
+        mock_client.inspect_container.assert_called_once_with('abc')
+
     def test_get(self):
         container = Container(None, {
             "Status": "Up 8 seconds",
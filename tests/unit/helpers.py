@@ -0,0 +1,34 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from compose.const import LABEL_CONFIG_HASH
+from compose.const import LABEL_CONTAINER_NUMBER
+from compose.const import LABEL_ONE_OFF
+from compose.const import LABEL_PROJECT
+from compose.const import LABEL_SERVICE
+
+
+def container_listing(service, number=1, project='composetest', id=None,
+                      name=None, status='Up 1 second', one_off=False,
+                      config_hash=None, **extra):
+    """A container of `service` as `docker.Client.containers` lists it, with
+    the labels Compose gives it. Any `extra` keys are added to the listing.
+    """
+    labels = {
+        LABEL_PROJECT: project,
+        LABEL_SERVICE: service,
+        LABEL_ONE_OFF: 'True' if one_off else 'False',
+        LABEL_CONTAINER_NUMBER: str(number),
+    }
+    if config_hash is not None:
+        labels[LABEL_CONFIG_HASH] = config_hash
+
+    listing = {
+        'Id': id or '%s%s' % (service, number),
+        'Image': 'busybox:latest',
+        'Names': ['/' + (name or '%s_%s_%s' % (project, service, number))],
+        'Status': status,
+        'Labels': labels,
+    }
+    listing.update(extra)
+    return listing
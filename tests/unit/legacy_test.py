@@ -0,0 +1,156 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import gc
+import os
+import weakref
+
+import docker
+import mock
+
+from .. import unittest
+from compose import legacy
+from compose.const import LABEL_VERSION
+from compose.project import Project
+from compose.service import Service
+from compose.utils import ParallelExecutionError
+
+
+def ps(name, labels=None):
+    return {
+        'Id': name + '_id',
+        'Image': 'busybox',
+        'Names': ['/' + name],
+        'Labels': labels,
+    }
+
+
+class LegacyCheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.containers.return_value = [
+            ps('composetest_web_1'),
+            ps('composetest_web_run_1'),
+            ps('composetest_db_1', labels={LABEL_VERSION: '1.4.0'}),
+            ps('otherproject_web_1'),
+            ps('composetest_nginx'),
+        ]
+
+    def tearDown(self):
+        legacy.forget_legacy_containers(self.mock_client, 'composetest')
+
+    def test_index_legacy_containers(self):
+        index = legacy.index_legacy_containers(self.mock_client, 'composetest')
+
+        self.assertEqual(sorted(index.keys()), [('web', False), ('web', True)])
+        self.assertEqual([c.name for c in index[('web', False)]], ['composetest_web_1'])
+        self.assertEqual([c.name for c in index[('web', True)]], ['composetest_web_run_1'])
+        self.mock_client.containers.assert_called_once_with(
+            all=True,
+            filters={'name': 'composetest'})
+
+    def test_check_raises_with_one_off_names(self):
+        with self.assertRaises(legacy.LegacyContainersError) as cm:
+            legacy.check_for_legacy_containers(self.mock_client, 'composetest', ['web', 'db'])
+
+        self.assertEqual(cm.exception.names, ['composetest_web_1'])
+        self.assertEqual(cm.exception.one_off_names, ['composetest_web_run_1'])
+
+    def test_check_one_off_not_allowed(self):
+        self.mock_client.containers.return_value = [ps('composetest_web_run_1')]
+
+        legacy.check_for_legacy_containers(self.mock_client, 'composetest', ['web'])
+
+        with self.assertRaises(legacy.LegacyOneOffContainersError):
+            legacy.check_for_legacy_containers(
+                self.mock_client, 'composetest', ['web'], allow_one_off=False)
+
+    def test_check_lists_containers_once(self):
+        for _ in range(3):
+            legacy.check_for_legacy_containers(self.mock_client, 'composetest', ['db'])
+
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+
+    def test_check_lists_containers_again_after_an_error(self):
+        with self.assertRaises(legacy.LegacyContainersError):
+            legacy.check_for_legacy_containers(self.mock_client, 'composetest', ['web'])
+
+        self.mock_client.containers.return_value = []
+        legacy.check_for_legacy_containers(self.mock_client, 'composetest', ['web'])
+        self.assertEqual(self.mock_client.containers.call_count, 2)
+
+    def test_check_lists_containers_again_once_forgotten(self):
+        legacy.check_for_legacy_containers(self.mock_client, 'composetest', ['db'])
+        legacy.forget_legacy_containers()
+        legacy.check_for_legacy_containers(self.mock_client, 'composetest', ['db'])
+
+        self.assertEqual(self.mock_client.containers.call_count, 2)
+
+    def test_cache_does_not_keep_clients(self):
+        client = mock.create_autospec(docker.Client)
+        client.containers.return_value = []
+        legacy.check_for_legacy_containers(client, 'composetest', ['db'])
+        self.assertIn(client, legacy._legacy_containers_cache)
+        client_ref = weakref.ref(client)
+
+        del client
+        gc.collect()
+
+        self.assertIsNone(client_ref())
+
+    def test_check_can_be_skipped(self):
+        with mock.patch.dict(os.environ):
+            os.environ['COMPOSE_SKIP_LEGACY_CHECK'] = '1'
+            legacy.check_for_legacy_containers(self.mock_client, 'composetest', ['web'])
+
+        self.assertFalse(self.mock_client.containers.called)
+
+
+class MigrateProjectToLabelsTest(unittest.TestCase):
+
+    def test_migrates_dependencies_first(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.containers.return_value = [
+            ps('composetest_web_1'),
+            ps('composetest_web_2'),
+            ps('composetest_db_1'),
+            ps('composetest_web_run_1'),
+        ]
+        db = Service('db', client=mock_client, project='composetest', image='busybox')
+        web = Service('web', client=mock_client, project='composetest', image='busybox',
+                      links=[(db, 'db')])
+        project = Project('composetest', [db, web], mock_client)
+
+        recreated = []
+
+        def recreate_container(container):
+            recreated.append(container.name)
+
+        with mock.patch.object(Service, 'recreate_container', side_effect=recreate_container):
+            legacy.migrate_project_to_labels(project, limit=2)
+
+        self.assertEqual(recreated[0], 'composetest_db_1')
+        self.assertEqual(
+            sorted(recreated[1:]),
+            ['composetest_web_1', 'composetest_web_2'])
+
+    def test_failed_migration_raises(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.containers.return_value = [
+            ps('composetest_web_1'),
+            ps('composetest_web_2'),
+        ]
+        web = Service('web', client=mock_client, project='composetest', image='busybox')
+        project = Project('composetest', [web], mock_client)
+
+        def recreate_container(container):
+            if container.name == 'composetest_web_2':
+                raise docker.errors.APIError('boom', mock.Mock(), 'boom')
+
+        with mock.patch.object(Service, 'recreate_container', side_effect=recreate_container), \
+                mock.patch.object(legacy, 'forget_legacy_containers') as mock_forget:
+            with self.assertRaises(ParallelExecutionError) as ctx:
+                legacy.migrate_project_to_labels(project)
+
+        self.assertEqual(list(ctx.exception.errors), ['composetest_web_2'])
+        self.assertFalse(mock_forget.called)
@@ -1,11 +1,23 @@
 from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import threading
+import time
+
 from .. import unittest
-from compose.service import Service
-from compose.project import Project
+from .helpers import container_listing
+from compose.service import BuildError, ConvergencePlan, Service
+from compose.project import Project, get_stop_waves
+from compose.config import ConfigurationError
 from compose.container import Container
+from compose.state import ProjectState
+from compose.utils import ParallelExecutionError
 
 import mock
 import docker
+from six import StringIO
+from docker.errors import APIError
 
 
 class ProjectTest(unittest.TestCase):
@@ -168,6 +180,46 @@ class ProjectTest(unittest.TestCase):
         ], self.mock_client)
         self.assertEqual(project.get_service('test')._get_volumes_from(), [container_id])
 
+    def test_external_containers_are_not_inspected_on_construction(self):
+        Project.from_dicts('test', [
+            {
+                'name': 'test',
+                'image': 'busybox:latest',
+                'volumes_from': ['aaa'],
+                'net': 'container:bbb',
+            }
+        ], self.mock_client)
+        self.assertFalse(self.mock_client.inspect_container.called)
+
+    def test_external_container_is_inspected_once(self):
+        container_id = 'aabbccddee'
+        self.mock_client.inspect_container.return_value = dict(Name='aaa', Id=container_id)
+        project = Project.from_dicts('test', [
+            {
+                'name': 'test',
+                'image': 'busybox:latest',
+                'volumes_from': ['aaa'],
+            }
+        ], self.mock_client)
+        service = project.get_service('test')
+        self.assertEqual(service._get_volumes_from(), [container_id])
+        self.assertEqual(service._get_volumes_from(), [container_id])
+        self.mock_client.inspect_container.assert_called_once_with('aaa')
+
+    def test_missing_external_container_raises_on_use(self):
+        self.mock_client.inspect_container.side_effect = APIError(
+            'No such container', mock.Mock(status_code=404))
+        project = Project.from_dicts('test', [
+            {
+                'name': 'test',
+                'image': 'busybox:latest',
+                'net': 'container:aaa',
+            }
+        ], self.mock_client)
+        service = project.get_service('test')
+        with self.assertRaises(ConfigurationError):
+            service._get_net()
+
     def test_use_volumes_from_service_no_container(self):
         container_name = 'test_vol_1'
         self.mock_client.containers.return_value = [
@@ -260,3 +312,600 @@ class ProjectTest(unittest.TestCase):
 
         service = project.get_service('test')
         self.assertEqual(service._get_net(), 'container:' + container_name)
+
+
+class ProjectUpTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.project = Project.from_dicts('composetest', [
+            {'name': 'db', 'image': 'busybox:latest', 'ready_check': {'port': 5432}},
+            {'name': 'cache', 'image': 'busybox:latest'},
+            {'name': 'web', 'image': 'busybox:latest', 'links': ['db', 'cache']},
+        ], self.mock_client)
+        self.mock_client.containers.return_value = []
+        self.events = []
+
+        for service in self.project.services:
+            service.convergence_plan = mock.Mock(return_value=ConvergencePlan('noop', []))
+            service.execute_convergence_plan = self.fake_execute(service)
+            service.wait_until_ready = self.fake_wait(service)
+
+    def fake_execute(self, service):
+        def execute(plan, **kwargs):
+            self.events.append(('converge', service.name))
+            return [service.name]
+        return execute
+
+    def fake_wait(self, service):
+        def wait(containers):
+            self.events.append(('ready', service.name))
+            return containers
+        return wait
+
+    def up(self):
+        with mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            result = self.project.up()
+        # Services are converged at the same time, so no progress is drawn
+        self.assertEqual(mock_stdout.getvalue(), '')
+        return result
+
+    def test_dependents_start_after_dependencies_are_ready(self):
+        self.assertEqual(
+            self.up(),
+            [service.name for service in self.project.services])
+
+        web_index = self.events.index(('converge', 'web'))
+        self.assertGreater(web_index, self.events.index(('ready', 'db')))
+        self.assertGreater(web_index, self.events.index(('ready', 'cache')))
+
+    def test_dependents_of_unready_service_are_skipped(self):
+        def not_ready(containers):
+            raise ValueError('db is not ready')
+        self.project.get_service('db').wait_until_ready = not_ready
+
+        with self.assertRaises(ValueError):
+            self.up()
+
+        self.assertNotIn(('converge', 'web'), self.events)
+        self.assertIn(('converge', 'cache'), self.events)
+
+    def test_services_without_ready_checks_converge_in_turn(self):
+        del self.project.get_service('db').options['ready_check']
+
+        with mock.patch.object(self.project, '_run_in_dependency_order') as mock_run:
+            self.assertEqual(self.up(), ['db', 'cache', 'web'])
+
+        self.assertFalse(mock_run.called)
+        self.assertEqual(self.events, [
+            ('converge', 'db'), ('ready', 'db'),
+            ('converge', 'cache'), ('ready', 'cache'),
+            ('converge', 'web'), ('ready', 'web'),
+        ])
+
+
+class ProjectParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.project = Project.from_dicts('composetest', [
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'web', 'image': 'busybox:latest', 'links': ['db']},
+        ], self.mock_client)
+        self.events = []
+
+    def mock_containers(self, service_name, count, running=True):
+        containers = []
+        for i in range(1, count + 1):
+            container = mock.create_autospec(Container)
+            container.name = 'composetest_%s_%s' % (service_name, i)
+            container.is_running = running
+            for method in ['start', 'restart']:
+                getattr(container, method).side_effect = self.record(method, container.name)
+            containers.append(container)
+
+        self.project.get_service(service_name).containers = lambda **kwargs: containers
+        return containers
+
+    def record(self, *event):
+        def record(*args, **kwargs):
+            self.events.append(event)
+        return record
+
+    def assert_dependencies_first(self, method):
+        db_names = ['composetest_db_1', 'composetest_db_2']
+        web_names = ['composetest_web_1', 'composetest_web_2', 'composetest_web_3']
+        first_web = min(self.events.index((method, name)) for name in web_names)
+        last_db = max(self.events.index((method, name)) for name in db_names)
+        self.assertGreater(first_web, last_db)
+
+    def test_start_in_dependency_order(self):
+        self.mock_containers('db', 2, running=False)
+        self.mock_containers('web', 3, running=False)
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            self.project.start()
+
+        self.assertEqual(len(self.events), 5)
+        self.assert_dependencies_first('start')
+
+    def test_start_skips_running_containers(self):
+        self.mock_containers('db', 2, running=True)
+        self.mock_containers('web', 1, running=False)
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            self.project.start()
+
+        self.assertEqual(self.events, [('start', 'composetest_web_1')])
+
+    def test_restart_dependents_first(self):
+        self.mock_containers('db', 2)
+        self.mock_containers('web', 3)
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            self.project.restart(timeout=1)
+
+        self.assertEqual(len(self.events), 5)
+        db_names = ['composetest_db_1', 'composetest_db_2']
+        web_names = ['composetest_web_1', 'composetest_web_2', 'composetest_web_3']
+        last_web = max(self.events.index(('restart', name)) for name in web_names)
+        first_db = min(self.events.index(('restart', name)) for name in db_names)
+        self.assertGreater(first_db, last_web)
+
+    def test_scale_several_services(self):
+        for service in self.project.services:
+            service.scale = mock.Mock(side_effect=self.record('scale', service.name))
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            self.project.scale({'web': 3, 'db': 2}, timeout=1)
+
+        self.assertEqual(self.events, [('scale', 'db'), ('scale', 'web')])
+        self.project.get_service('web').scale.assert_called_once_with(3, timeout=1, quiet=True)
+        self.project.get_service('db').scale.assert_called_once_with(2, timeout=1, quiet=True)
+
+
+class ProjectStopTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.project = Project.from_dicts('composetest', [
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'cache', 'image': 'busybox:latest'},
+            {'name': 'worker', 'image': 'busybox:latest', 'links': ['db']},
+            {'name': 'web', 'image': 'busybox:latest', 'links': ['db', 'cache', 'worker']},
+        ], self.mock_client)
+        self.events = []
+        self.containers = []
+
+        for service in self.project.services:
+            container = mock.create_autospec(Container)
+            container.name = 'composetest_%s_1' % service.name
+            container.labels = {'com.docker.compose.service': service.name}
+            container.stop.side_effect = self.record('stop', service.name)
+            container.kill.side_effect = self.record('kill', service.name)
+            self.containers.append(container)
+
+        self.project.containers = lambda service_names=None: self.containers
+
+    def record(self, action, name):
+        def record(*args, **kwargs):
+            self.events.append((action, name, kwargs.get('timeout')))
+        return record
+
+    def test_get_stop_waves(self):
+        self.assertEqual(
+            get_stop_waves(self.project.services),
+            [set(['web']), set(['worker', 'cache']), set(['db'])])
+
+    def test_stop_ordered(self):
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            self.project.stop(ordered=True, timeout=3)
+
+        self.assertEqual(self.events[0], ('stop', 'web', 3))
+        self.assertEqual(
+            sorted(self.events[1:3]),
+            [('stop', 'cache', 3), ('stop', 'worker', 3)])
+        self.assertEqual(self.events[3], ('stop', 'db', 3))
+
+    @mock.patch('compose.project.time')
+    def test_stop_kills_containers_left_at_deadline(self, mock_time):
+        # Each wave of stops takes 4 seconds. The time is read before each
+        # wave, and again to set the wave's deadline.
+        mock_time.time.side_effect = [100, 100, 100, 104, 104, 108]
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            self.project.stop(ordered=True, deadline=7, timeout=10)
+
+        self.assertEqual(self.events[0], ('stop', 'web', 7))
+        self.assertEqual(
+            sorted(self.events[1:3]),
+            [('stop', 'cache', 3), ('stop', 'worker', 3)])
+        self.assertEqual(self.events[3], ('kill', 'db', None))
+
+    def test_stop_kills_containers_at_deadline_within_a_wave(self):
+        killed = threading.Event()
+        self.containers[3].stop.side_effect = lambda **kwargs: killed.wait(5)
+        self.containers[3].kill.side_effect = lambda **kwargs: killed.set()
+
+        start = time.time()
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            self.project.stop(ordered=True, deadline=0.2, timeout=10)
+
+        self.assertTrue(killed.is_set())
+        self.assertLess(time.time() - start, 4)
+        # The later waves are out of time too
+        self.assertEqual(
+            sorted(event for event in self.events if event[0] == 'kill'),
+            [('kill', 'cache', None), ('kill', 'db', None), ('kill', 'worker', None)])
+
+    @mock.patch('compose.project.time')
+    def test_stop_rounds_the_time_left_up(self, mock_time):
+        mock_time.time.side_effect = [100, 100.5]
+
+        with mock.patch.object(self.project, '_stop_wave', return_value={}) as mock_stop_wave:
+            self.project.stop(deadline=1, timeout=10)
+
+        _, wave_timeout, end, _ = mock_stop_wave.call_args[0]
+        self.assertEqual(wave_timeout, 1)
+        self.assertEqual(end, 101)
+
+    def test_stop_with_deadline_is_not_ordered(self):
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            with mock.patch.object(self.project, '_stop_wave', return_value={}) as mock_stop_wave:
+                self.project.stop(deadline=30, timeout=10)
+
+        self.assertEqual(mock_stop_wave.call_count, 1)
+        self.assertEqual(len(mock_stop_wave.call_args[0][0]), 4)
+
+    def test_stop_ordered_raises_after_stopping_later_waves(self):
+        self.containers[3].stop.side_effect = APIError('boom', mock.Mock(), 'boom')
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            with self.assertRaises(ParallelExecutionError) as ctx:
+                self.project.stop(ordered=True, timeout=3)
+
+        self.assertEqual(list(ctx.exception.errors), ['composetest_web_1'])
+        self.assertEqual(
+            sorted(name for _, name, _ in self.events),
+            ['cache', 'db', 'worker'])
+
+    def test_kill_raises_for_failed_containers(self):
+        self.containers[1].kill.side_effect = APIError('boom', mock.Mock(), 'boom')
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            with self.assertRaises(ParallelExecutionError) as ctx:
+                self.project.kill()
+
+        self.assertEqual(ctx.exception.msg, 'Killing failed for composetest_cache_1')
+
+
+class ProjectDownTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.project = Project.from_dicts('composetest', [
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'web', 'image': 'busybox:latest'},
+        ], self.mock_client)
+        self.mock_client.containers.return_value = [
+            self.ps('composetest_web_1', 'web', 'Up 3 minutes'),
+            self.ps('composetest_db_1', 'db', 'Exited (0) 1 minute ago'),
+            self.ps('composetest_web_run_1', 'web', 'Up 1 second', one_off=True),
+        ]
+
+    def ps(self, name, service, status, one_off=False):
+        return container_listing(
+            service, id=name, name=name, status=status, one_off=one_off)
+
+    def down(self, **kwargs):
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            self.project.down(**kwargs)
+
+    def test_down_stops_and_removes_from_one_listing(self):
+        self.down(timeout=3)
+
+        self.mock_client.containers.assert_called_once_with(
+            all=True,
+            filters={'label': 'com.docker.compose.project=composetest'})
+        self.assertFalse(self.mock_client.inspect_container.called)
+        self.assertEqual(
+            sorted(self.mock_client.stop.call_args_list),
+            [
+                mock.call('composetest_web_1', timeout=3),
+                mock.call('composetest_web_run_1', timeout=3),
+            ])
+        self.assertEqual(
+            sorted(self.mock_client.remove_container.call_args_list),
+            [
+                mock.call('composetest_db_1', v=False),
+                mock.call('composetest_web_1', v=False),
+                mock.call('composetest_web_run_1', v=False),
+            ])
+
+    def test_down_selected_services_and_volumes(self):
+        self.down(service_names=['db'], remove_volumes=True)
+
+        self.assertFalse(self.mock_client.stop.called)
+        self.mock_client.remove_container.assert_called_once_with(
+            'composetest_db_1', v=True)
+
+
+class ProjectDuplicateContainersTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.project = Project.from_dicts('composetest', [
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'web', 'image': 'busybox:latest'},
+        ], self.mock_client)
+
+    def ps(self, id, service, number, created, status='Up 1 second'):
+        return container_listing(
+            service, number, id=id, name='composetest_%s_%s' % (service, id),
+            status=status, Created=created)
+
+    def test_remove_duplicates_from_listing(self):
+        self.mock_client.containers.return_value = [
+            self.ps('web1b', 'web', 1, created=200),
+            self.ps('web1a', 'web', 1, created=100),
+            self.ps('web1c', 'web', 1, created=300, status='Exited (0)'),
+            self.ps('web2', 'web', 2, created=150),
+            self.ps('db1', 'db', 1, created=50),
+            self.ps('db1b', 'db', 1, created=250),
+        ]
+        web = self.project.get_service('web')
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            remaining = self.project._remove_duplicate_containers(
+                self.project._list_containers([web]),
+                timeout=2)
+
+        self.mock_client.containers.assert_called_once_with(
+            all=True,
+            filters={'label': self.project.labels()})
+        self.assertEqual(
+            sorted(c['Id'] for c in remaining),
+            ['web1a', 'web2'])
+        self.assertFalse(self.mock_client.inspect_container.called)
+        self.mock_client.stop.assert_called_once_with('web1b', timeout=2)
+        self.assertEqual(
+            sorted(self.mock_client.remove_container.call_args_list),
+            [mock.call('web1b'), mock.call('web1c')])
+
+
+class ProjectRebuildTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.project = Project.from_dicts('composetest', [
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'api', 'build': '/api', 'links': ['db']},
+            {'name': 'worker', 'build': '/worker'},
+            {'name': 'web', 'build': '/web', 'links': ['api']},
+            {'name': 'proxy', 'image': 'busybox:latest', 'volumes_from': ['web']},
+        ], self.mock_client)
+        self.project.up = mock.Mock(return_value=[])
+
+    def test_get_dependent_names(self):
+        self.assertEqual(
+            self.project.get_dependent_names(['api']),
+            ['api', 'web', 'proxy'])
+        self.assertEqual(
+            self.project.get_dependent_names(['db', 'worker']),
+            ['db', 'api', 'worker', 'web', 'proxy'])
+
+    def rebuild(self, service_names, failing=()):
+        built = []
+
+        def build(service):
+            if service.name in failing:
+                raise BuildError(service, 'oops')
+            built.append(service.name)
+
+        with mock.patch.object(Service, 'build', autospec=True, side_effect=build), \
+                mock.patch('sys.stdout', new_callable=StringIO) as stdout:
+            self.project.rebuild(service_names, limit=2, timeout=5)
+        return sorted(built), stdout.getvalue()
+
+    def test_rebuild_converges_only_rebuilt_services_and_dependents(self):
+        built, _ = self.rebuild(['api'])
+
+        self.assertEqual(built, ['api'])
+        self.project.up.assert_called_once_with(
+            service_names=['api', 'web', 'proxy'],
+            start_deps=False,
+            do_build=False,
+            timeout=5)
+
+    def test_rebuild_skips_services_which_fail_to_build(self):
+        with mock.patch('compose.project.log') as mock_log:
+            built, output = self.rebuild(['api', 'worker'], failing=['api'])
+
+        self.assertEqual(built, ['worker'])
+        self.assertEqual(output, '')
+        mock_log.error.assert_called_once_with("Service 'api' failed to build: oops")
+        self.project.up.assert_called_once_with(
+            service_names=['worker'],
+            start_deps=False,
+            do_build=False,
+            timeout=5)
+
+    def test_rebuild_without_builds_does_nothing(self):
+        with mock.patch('compose.project.log'):
+            self.rebuild(['api'], failing=['api'])
+        self.assertFalse(self.project.up.called)
+
+
+class ProjectConvergencePlanTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.project = Project.from_dicts('composetest', [
+            {'name': 'db', 'image': 'busybox:latest'},
+            {'name': 'web', 'image': 'busybox', 'links': ['db']},
+        ], self.mock_client)
+        self.mock_client.images.return_value = [
+            {'Id': 'busybox-id', 'RepoTags': ['busybox:latest']},
+            {'Id': 'dangling', 'RepoTags': None},
+        ]
+
+    def ps(self, service, config_hash, status='Up 1 second'):
+        return container_listing(
+            service, id=service, status=status, config_hash=config_hash)
+
+    def config_hash(self, name):
+        return self.project.get_service(name).config_hash(image_id='busybox-id')
+
+    def test_plans_from_batched_reads(self):
+        self.mock_client.containers.return_value = [
+            self.ps('db', self.config_hash('db')),
+            self.ps('web', self.config_hash('web'), status='Exited (0)'),
+        ]
+
+        plans = self.project._get_convergence_plans(self.project.services)
+
+        self.assertEqual(plans['db'].action, 'noop')
+        self.assertEqual(plans['web'].action, 'start')
+        self.assertEqual(self.mock_client.containers.call_count, 1)
+        self.assertEqual(self.mock_client.images.call_count, 1)
+        self.assertFalse(self.mock_client.inspect_image.called)
+        self.assertFalse(self.mock_client.inspect_container.called)
+
+    def test_upstream_recreate_is_propagated(self):
+        self.mock_client.containers.return_value = [
+            self.ps('db', 'stale'),
+            self.ps('web', self.config_hash('web')),
+        ]
+
+        plans = self.project._get_convergence_plans(self.project.services)
+
+        self.assertEqual(plans['db'].action, 'recreate')
+        self.assertEqual(plans['web'].action, 'recreate')
+
+    def test_noop_up_with_state_makes_one_request(self):
+        self.mock_client.containers.return_value = [
+            self.ps('db', self.config_hash('db')),
+            self.ps('web', self.config_hash('web')),
+        ]
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+
+        with mock.patch.dict(os.environ, {'COMPOSE_STATE_DIR': state_dir}), \
+                mock.patch('sys.stdout', new_callable=StringIO):
+            self.project.up()
+            self.assertEqual(self.mock_client.images.call_count, 1)
+            self.mock_client.reset_mock()
+
+            self.project.up()
+
+        self.assertEqual(self.mock_client.method_calls, [
+            mock.call.containers(all=True, filters={'label': self.project.labels()}),
+        ])
+
+    def test_state_of_changed_containers_is_not_used(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        state = ProjectState.load('composetest', state_dir=state_dir)
+        state.record('db', ['other'], 'stale-id')
+        state.save()
+        listed = [self.ps('db', self.config_hash('db'))]
+
+        with mock.patch.dict(os.environ, {'COMPOSE_STATE_DIR': state_dir}):
+            image_ids = self.project._get_image_ids(
+                self.project.services,
+                listed,
+                state=ProjectState.load('composetest'))
+
+        self.assertEqual(image_ids, {'db': 'busybox-id', 'web': 'busybox-id'})
+
+    def test_build_and_pull_forget_state(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        state = ProjectState.load('composetest', state_dir=state_dir)
+        state.record('db', ['db'], 'busybox-id')
+        state.record('web', ['web'], 'busybox-id')
+        state.save()
+
+        with mock.patch.dict(os.environ, {'COMPOSE_STATE_DIR': state_dir}), \
+                mock.patch('compose.service.Service.pull'):
+            self.project.pull(['db'])
+
+        state = ProjectState.load('composetest', state_dir=state_dir)
+        self.assertEqual(list(state.services), ['web'])
+
+    def test_containers_including_one_off(self):
+        one_off = self.ps('web', 'hash', status='Exited (0)')
+        one_off['Labels']['com.docker.compose.oneoff'] = 'True'
+        self.mock_client.containers.return_value = [self.ps('db', 'hash'), one_off]
+
+        containers = self.project.containers(stopped=True, one_off=None)
+
+        self.assertEqual([c.id for c in containers], ['db', 'web'])
+        self.mock_client.containers.assert_called_once_with(
+            all=True,
+            filters={'label': ['com.docker.compose.project=composetest']})
+
+    def renamed(self, container):
+        container['Id'] = 'leftover%s' % container['Id']
+        container['Names'] = ['/%s_%s' % (container['Id'][:10], container['Names'][0][1:])]
+        container['Created'] = 1
+        return container
+
+    def test_replaced_leftover_is_removed(self):
+        leftover = self.renamed(self.ps('db', 'stale', status='Exited (0)'))
+        new = self.ps('db', self.config_hash('db'), status='Created')
+        new['Created'] = 2
+        self.mock_client.containers.return_value = [leftover, new]
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            listed = self.project._remove_replaced_containers(
+                self.project._list_containers(self.project.services))
+        plans = self.project._get_convergence_plans(
+            self.project.services,
+            listed=listed,
+            unfinished=self.project._get_unfinished_recreates(
+                self.project.services, listed))
+
+        self.mock_client.remove_container.assert_called_once_with(leftover['Id'])
+        self.assertFalse(self.mock_client.stop.called)
+        self.assertEqual(plans['db'].action, 'start')
+
+    def test_leftover_of_a_journaled_recreate_is_kept(self):
+        state = ProjectState(None)
+        state.save = mock.Mock()
+        state.plan_recreates('db', [1])
+        state.step('db', 1, 'rename')
+        state.step('db', 1, 'create', container_id='db')
+        leftover = self.renamed(self.ps('db', 'stale'))
+        self.mock_client.containers.return_value = [leftover, self.ps('db', self.config_hash('db'))]
+
+        listed = self.project._remove_replaced_containers(
+            self.project._list_containers(self.project.services),
+            state=state)
+
+        self.assertFalse(self.mock_client.remove_container.called)
+        self.assertFalse(self.mock_client.stop.called)
+        self.assertIn(leftover['Id'], [c['Id'] for c in listed])
+
+    def test_lone_leftover_is_recreated(self):
+        leftover = self.renamed(self.ps('db', self.config_hash('db'), status='Exited (0)'))
+        listed = [leftover, self.ps('web', self.config_hash('web'))]
+
+        unfinished = self.project._get_unfinished_recreates(self.project.services, listed)
+        plans = self.project._get_convergence_plans(
+            self.project.services,
+            listed=listed,
+            unfinished=unfinished)
+
+        self.assertEqual(unfinished, {'db': set([1]), 'web': set()})
+        self.assertEqual(plans['db'].action, 'recreate')
+        self.assertEqual(plans['web'].action, 'recreate')
+
+    def test_journaled_recreates_are_resumed(self):
+        state = ProjectState(None)
+        state.save = mock.Mock()
+        state.plan_recreates('db', [1])
+        state.plan_recreates('web', [1])
+        state.step('web', 1, 'create', container_id='web')
+        listed = [
+            self.ps('db', self.config_hash('db')),
+            self.ps('web', self.config_hash('web')),
+        ]
+
+        unfinished = self.project._get_unfinished_recreates(
+            self.project.services, listed, state=state)
+
+        self.assertEqual(unfinished, {'db': set([1]), 'web': set()})
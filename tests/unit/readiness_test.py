@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import re
+import socket
+
+import docker
+import mock
+
+from .. import unittest
+from compose.container import Container
+from compose.readiness import (
+    NotReadyError,
+    check_command,
+    check_log,
+    check_port,
+    wait_until_ready,
+)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_container(client, running=True, ip='127.0.0.1'):
+    client.inspect_container.return_value = {
+        'Id': 'abc',
+        'Name': '/composetest_db_1',
+        'State': {'Running': running},
+        'NetworkSettings': {'IPAddress': ip},
+    }
+    container = Container(client, {'Id': 'abc'})
+    container.inspect()
+    return container
+
+
+class WaitUntilReadyTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.clock = FakeClock()
+
+    def test_waits_until_check_passes(self):
+        container = make_container(self.mock_client)
+        self.mock_client.logs.side_effect = ['starting', 'starting', 'ready to accept']
+
+        wait_until_ready(container, {'log': 'ready', 'interval': 2}, clock=self.clock)
+        self.assertEqual(self.clock.now, 4)
+        self.assertEqual(self.mock_client.logs.call_count, 3)
+
+    def test_times_out(self):
+        container = make_container(self.mock_client)
+        self.mock_client.logs.return_value = 'starting'
+
+        with self.assertRaises(NotReadyError) as cm:
+            wait_until_ready(container, {'log': 'ready', 'timeout': 5}, clock=self.clock)
+        self.assertEqual(cm.exception.container, container)
+        self.assertEqual(self.clock.now, 5)
+
+    def test_fails_when_container_stops(self):
+        container = make_container(self.mock_client, running=False)
+
+        with self.assertRaises(NotReadyError):
+            wait_until_ready(container, {'log': 'ready'}, clock=self.clock)
+        self.assertFalse(self.mock_client.logs.called)
+
+
+class ChecksTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+
+    def test_check_port(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+        container = make_container(self.mock_client)
+
+        try:
+            self.assertFalse(check_port(container, port))
+            server.listen(1)
+            self.assertTrue(check_port(container, port))
+        finally:
+            server.close()
+
+    def test_check_log(self):
+        container = make_container(self.mock_client)
+        self.mock_client.logs.return_value = b'booting\nlistening on 5432\n'
+
+        self.assertTrue(check_log(container, re.compile('^listening on', re.MULTILINE)))
+        self.assertFalse(check_log(container, re.compile('^ready', re.MULTILINE)))
+
+    def test_check_command(self):
+        container = make_container(self.mock_client)
+        self.mock_client.exec_create.return_value = {'Id': 'exec1'}
+        self.mock_client.exec_inspect.return_value = {'ExitCode': 0}
+
+        self.assertTrue(check_command(container, 'pg_isready'))
+        self.mock_client.exec_create.assert_called_once_with('abc', 'pg_isready')
+        self.mock_client.exec_start.assert_called_once_with({'Id': 'exec1'})
+
+        self.mock_client.exec_inspect.return_value = {'ExitCode': 1}
+        self.assertFalse(check_command(container, 'pg_isready'))
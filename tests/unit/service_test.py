@@ -3,17 +3,29 @@ from __future__ import absolute_import
 
 from .. import unittest
 import mock
+import threading
+from six import StringIO
 
 import docker
 from docker.utils import LogConfig
 
+from compose import service as service_module
 from compose.service import Service
 from compose.container import Container
-from compose.const import LABEL_SERVICE, LABEL_PROJECT, LABEL_ONE_OFF
+from compose.const import (
+    LABEL_CONFIG_HASH,
+    LABEL_CONTAINER_NUMBER,
+    LABEL_ONE_OFF,
+    LABEL_PROJECT,
+    LABEL_SERVICE,
+)
 from compose.service import (
     ConfigError,
+    ConvergencePlan,
     NeedsBuildError,
     NoSuchImageError,
+    RolloutError,
+    build_pinned_cpuset,
     build_port_bindings,
     build_volume_binding,
     get_container_data_volumes,
@@ -174,6 +186,33 @@ class ServiceTest(unittest.TestCase):
         self.assertEqual(opts['host_config']['LogConfig'].type, 'syslog')
         self.assertEqual(opts['host_config']['LogConfig'].config, log_opt)
 
+    def test_spread(self):
+        service = Service('foo', image='foo', client=self.mock_client, spread='soft')
+        service.image = lambda: {'Id': 'abc123'}
+        opts = service._get_container_create_options({}, 1)
+        self.assertEqual(opts['environment']['affinity:container!'], '~default_foo_*')
+
+        service = Service('foo', image='foo', client=self.mock_client, spread='hard')
+        service.image = lambda: {'Id': 'abc123'}
+        opts = service._get_container_create_options({}, 1)
+        self.assertEqual(opts['environment']['affinity:container!'], 'default_foo_*')
+
+    def test_spread_not_applied_to_one_off_or_recreated_containers(self):
+        service = Service('foo', image='foo', client=self.mock_client, spread='hard')
+        service.image = lambda: {'Id': 'abc123'}
+        previous_container = mock.Mock(
+            id='abc123',
+            image_config={'ContainerConfig': {}})
+        previous_container.get.return_value = None
+
+        opts = service._get_container_create_options({}, 1, one_off=True)
+        self.assertNotIn('affinity:container!', opts['environment'])
+
+        opts = service._get_container_create_options(
+            {}, 1, previous_container=previous_container)
+        self.assertNotIn('affinity:container!', opts['environment'])
+        self.assertEqual(opts['environment']['affinity:container'], '=abc123')
+
     def test_split_domainname_fqdn(self):
         service = Service(
             'foo',
@@ -247,6 +286,7 @@ class ServiceTest(unittest.TestCase):
     @mock.patch('compose.service.Container', autospec=True)
     def test_recreate_container(self, _):
         mock_container = mock.create_autospec(Container)
+        mock_container.is_renamed = False
         service = Service('foo', client=self.mock_client, image='someimage')
         service.image = lambda: {'Id': 'abc123'}
         new_container = service.recreate_container(mock_container)
@@ -259,15 +299,388 @@ class ServiceTest(unittest.TestCase):
         new_container.start.assert_called_once_with()
         mock_container.remove.assert_called_once_with()
 
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_recreate_container_journals_steps(self, _):
+        mock_container = mock.create_autospec(Container)
+        mock_container.is_renamed = False
+        mock_container.labels = {LABEL_CONTAINER_NUMBER: '2'}
+        journal = mock.Mock()
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.image = lambda: {'Id': 'abc123'}
+
+        new_container = service.recreate_container(mock_container, journal=journal)
+
+        self.assertEqual(journal.step.mock_calls, [
+            mock.call('foo', '2', 'rename', container_id=None),
+            mock.call('foo', '2', 'create', container_id=new_container.id),
+            mock.call('foo', '2', 'start', container_id=None),
+            mock.call('foo', '2', 'remove', container_id=None),
+        ])
+
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_recreate_renamed_container_is_resumed(self, _):
+        mock_container = mock.create_autospec(Container)
+        mock_container.is_renamed = True
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.image = lambda: {'Id': 'abc123'}
+
+        new_container = service.recreate_container(mock_container)
+
+        self.assertFalse(self.mock_client.rename.called)
+        new_container.start.assert_called_once_with()
+        mock_container.remove.assert_called_once_with()
+
     @mock.patch('compose.service.Container', autospec=True)
     def test_recreate_container_with_timeout(self, _):
         mock_container = mock.create_autospec(Container)
+        mock_container.is_renamed = False
         self.mock_client.inspect_image.return_value = {'Id': 'abc123'}
         service = Service('foo', client=self.mock_client, image='someimage')
         service.recreate_container(mock_container, timeout=1)
 
         mock_container.stop.assert_called_once_with(timeout=1)
 
+    def test_convergence_plan_only_recreates_diverged_containers(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.config_hash = lambda **kwargs: 'current'
+        fresh = mock_container('1', 'current', running=True)
+        stale = mock_container('2', 'stale', running=True)
+        stopped = mock_container('3', 'current', running=False)
+        service.containers = lambda **kwargs: [fresh, stale, stopped]
+
+        plan = service.convergence_plan()
+
+        self.assertEqual(plan.action, 'recreate')
+        self.assertEqual(plan.containers, [fresh, stale, stopped])
+        self.assertEqual(plan.actions, {
+            fresh: 'noop',
+            stale: 'recreate',
+            stopped: 'start',
+        })
+
+    def test_convergence_plan_force_recreate(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.config_hash = lambda **kwargs: 'current'
+        containers = [mock_container('1', 'current', running=True)]
+        service.containers = lambda **kwargs: containers
+
+        plan = service.convergence_plan(force_recreate=True)
+        self.assertEqual(plan, ConvergencePlan('recreate', containers))
+
+    def test_convergence_plan_no_recreate_starts_diverged_containers(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.config_hash = lambda **kwargs: 'current'
+        containers = [mock_container('1', 'stale', running=False)]
+        service.containers = lambda **kwargs: containers
+
+        plan = service.convergence_plan(allow_recreate=False)
+        self.assertEqual(plan, ConvergencePlan('start', containers))
+
+    def test_execute_convergence_plan_only_touches_planned_containers(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.recreate_container = mock.Mock()
+        service.start_container_if_stopped = mock.Mock()
+        fresh = mock_container('1', 'current', running=True)
+        stale = mock_container('2', 'stale', running=True)
+        stopped = mock_container('3', 'current', running=False)
+
+        plan = ConvergencePlan.from_actions(
+            [fresh, stale, stopped],
+            {fresh: 'noop', stale: 'recreate', stopped: 'start'})
+        containers = service.execute_convergence_plan(plan, timeout=1)
+
+        service.recreate_container.assert_called_once_with(
+            stale, timeout=1, start_first=False, journal=None)
+        service.start_container_if_stopped.assert_called_once_with(stopped)
+        self.assertEqual(containers, [
+            fresh,
+            service.recreate_container.return_value,
+            service.start_container_if_stopped.return_value,
+        ])
+
+    @mock.patch('compose.service.time.sleep', autospec=True)
+    def test_execute_convergence_plan_rolling_batches(self, mock_sleep):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        containers = [mock_container(str(i), 'stale') for i in range(5)]
+        batches = []
+
+        def recreate(container, **kwargs):
+            batches.append(mock_sleep.call_count)
+            return container
+
+        service.recreate_container = mock.Mock(side_effect=recreate)
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            new_containers = service.execute_convergence_plan(
+                ConvergencePlan('recreate', containers),
+                batch_size=2,
+                batch_delay=3)
+
+        self.assertEqual(new_containers, containers)
+        self.assertEqual(sorted(batches), [0, 0, 1, 1, 2])
+        self.assertEqual(mock_sleep.mock_calls, [mock.call(3), mock.call(3)])
+
+    def test_execute_convergence_plan_rolling_stops_after_failed_batch(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        containers = [mock_container(str(i), 'stale') for i in range(4)]
+
+        def recreate(container, **kwargs):
+            if container.id == '1':
+                raise Exception("boom")
+            return container
+
+        service.recreate_container = mock.Mock(side_effect=recreate)
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            with self.assertRaises(RolloutError) as cm:
+                service.execute_convergence_plan(
+                    ConvergencePlan('recreate', containers),
+                    batch_size=2)
+
+        self.assertEqual(cm.exception.failed, ['foo_1'])
+        self.assertEqual(cm.exception.remaining, ['foo_2', 'foo_3'])
+        self.assertEqual(service.recreate_container.call_count, 2)
+
+    def test_execute_convergence_plan_start_first_with_host_port(self):
+        service = Service(
+            'foo',
+            client=self.mock_client,
+            image='someimage',
+            ports=['8000:8000'])
+        service.recreate_container = mock.Mock()
+        container = mock_container('1', 'stale')
+
+        service.execute_convergence_plan(
+            ConvergencePlan('recreate', [container]),
+            start_first=True)
+
+        service.recreate_container.assert_called_once_with(
+            container, timeout=10, start_first=False, journal=None)
+
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_recreate_container_start_first(self, _):
+        mock_container = mock.create_autospec(Container)
+        mock_container.is_renamed = False
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.image = lambda: {'Id': 'abc123'}
+        calls = mock.Mock()
+        calls.attach_mock(mock_container.stop, 'stop')
+        calls.attach_mock(self.mock_client.rename, 'rename')
+
+        new_container = service.recreate_container(mock_container, start_first=True)
+
+        new_container.start.assert_called_once_with()
+        self.assertEqual(
+            [call[0] for call in calls.mock_calls],
+            ['rename', 'stop'])
+        mock_container.remove.assert_called_once_with()
+
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_scale_computes_create_options_once(self, mock_container_class):
+        service = Service('foo', client=self.mock_client, image='someimage', links=[])
+        service.image = lambda: {'Id': 'abc123'}
+        service.containers = lambda **kwargs: []
+        service._next_container_number = lambda **kwargs: 4
+        service.remove_stopped = mock.Mock()
+        self.mock_client.containers.return_value = []
+        new_containers = []
+
+        def create(client, **options):
+            new_containers.append(mock.create_autospec(Container))
+            return new_containers[-1]
+        mock_container_class.create.side_effect = create
+
+        with mock.patch.object(
+                service,
+                '_get_container_create_options',
+                wraps=service._get_container_create_options) as get_options:
+            with mock.patch('sys.stdout', new_callable=StringIO):
+                service.scale(3)
+
+        self.assertEqual(get_options.call_count, 1)
+        created = sorted(
+            (kwargs['name'], kwargs['labels'][LABEL_CONTAINER_NUMBER])
+            for _, kwargs in mock_container_class.create.call_args_list)
+        self.assertEqual(created, [
+            ('default_foo_4', '4'),
+            ('default_foo_5', '5'),
+            ('default_foo_6', '6'),
+        ])
+        for container in new_containers:
+            container.start.assert_called_once_with()
+
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_scale_pins_each_container_to_its_own_cpus(self, mock_container_class):
+        service = Service('foo', client=self.mock_client, image='someimage', pin_cpus=2)
+        service.image = lambda: {'Id': 'abc123'}
+        service.containers = lambda **kwargs: []
+        service._next_container_number = lambda **kwargs: 1
+        service.remove_stopped = mock.Mock()
+        self.mock_client.info.return_value = {'NCPU': 4}
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            service.scale(3)
+
+        created = sorted(
+            (kwargs['name'], kwargs['cpuset'])
+            for _, kwargs in mock_container_class.create.call_args_list)
+        self.assertEqual(created, [
+            ('default_foo_1', '0-1'),
+            ('default_foo_2', '2-3'),
+            ('default_foo_3', '0-1'),
+        ])
+        self.assertEqual(self.mock_client.info.call_count, 1)
+
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_pinned_cpus_are_kept_when_recreating(self, mock_container_class):
+        service = Service('foo', client=self.mock_client, image='someimage', pin_cpus=1)
+        service.image = lambda: {'Id': 'abc123'}
+        self.mock_client.info.return_value = {'NCPU': 4}
+        previous_container = mock.create_autospec(Container)
+        previous_container.is_renamed = False
+        previous_container.labels = {LABEL_CONTAINER_NUMBER: '3'}
+        previous_container.image_config = {'ContainerConfig': {}}
+        previous_container.get.return_value = None
+
+        service.recreate_container(previous_container)
+
+        _, kwargs = mock_container_class.create.call_args
+        self.assertEqual(kwargs['cpuset'], '2')
+
+    def test_pinned_cpus_are_not_used_for_one_off_containers(self):
+        service = Service('foo', client=self.mock_client, image='someimage', pin_cpus=1)
+        service.image = lambda: {'Id': 'abc123'}
+
+        opts = service._get_container_create_options({}, 1, one_off=True)
+        self.assertNotIn('cpuset', opts)
+
+    def test_build_pinned_cpuset(self):
+        self.assertEqual(
+            [build_pinned_cpuset(number, 1, 2) for number in range(1, 5)],
+            ['0', '1', '0', '1'])
+        self.assertEqual(
+            [build_pinned_cpuset(number, 3, 8) for number in range(1, 5)],
+            ['0-2', '3-5', '0-2', '3-5'])
+        self.assertEqual(build_pinned_cpuset(2, 4, 2), '0-1')
+
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_scale_quiet(self, mock_container_class):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.image = lambda: {'Id': 'abc123'}
+        service.containers = lambda **kwargs: []
+        self.mock_client.containers.return_value = []
+
+        with mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            service.scale(2, quiet=True)
+
+        self.assertEqual(mock_container_class.create.call_count, 2)
+        self.assertEqual(mock_stdout.getvalue(), '')
+
+    def test_create_options_do_not_change_service_labels(self):
+        labels = {'com.example.role': 'web'}
+        service = Service('foo', client=self.mock_client, image='someimage', labels=labels)
+        service.image = lambda: {'Id': 'abc123'}
+
+        service._get_container_create_options({}, 1)
+        self.assertEqual(service.options['labels'], {'com.example.role': 'web'})
+
+    def test_next_container_number_reads_list_labels(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        self.mock_client.containers.return_value = [
+            {'Id': 'abc', 'Labels': {LABEL_CONTAINER_NUMBER: '3'}},
+            {'Id': 'def', 'Labels': {LABEL_CONTAINER_NUMBER: '7'}},
+        ]
+
+        self.assertEqual(service._next_container_number(), 8)
+        self.assertFalse(self.mock_client.inspect_container.called)
+
+    def test_next_container_number_reserves_ranges(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        self.mock_client.containers.return_value = []
+
+        self.assertEqual(service._next_container_number(count=3), 1)
+        self.assertEqual(service._next_container_number(), 4)
+        self.assertEqual(service._next_container_number(one_off=True), 1)
+
+        other = Service('foo', client=mock.create_autospec(docker.Client), image='someimage')
+        other.client.containers.return_value = []
+        self.assertEqual(other._next_container_number(), 1)
+
+    def test_next_container_number_reuses_released_numbers(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        self.mock_client.containers.return_value = []
+        self.assertEqual(service._next_container_number(count=3), 1)
+        service._release_container_numbers([1, 2, 3])
+
+        # Scaled back down to one container
+        self.mock_client.containers.return_value = [
+            {'Id': 'abc', 'Labels': {LABEL_CONTAINER_NUMBER: '1'}},
+        ]
+        self.assertEqual(service._next_container_number(count=2), 2)
+
+    def test_next_container_number_lists_without_holding_locks(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        self.mock_client.containers.return_value = []
+        self.assertEqual(service._next_container_number(), 1)
+
+        def containers(**kwargs):
+            # A number released while the listing runs may be missing from it
+            service._release_container_numbers([1])
+            for lock in [
+                    service_module._reserved_numbers_lock,
+                    service_module._reserved_numbers[self.mock_client].lock]:
+                self.assertTrue(lock.acquire(False))
+                lock.release()
+            return []
+        self.mock_client.containers.side_effect = containers
+
+        self.assertEqual(service._next_container_number(), 2)
+
+    def test_next_container_number_is_unique_across_threads(self):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        self.mock_client.containers.return_value = []
+        numbers = []
+
+        threads = [
+            threading.Thread(target=lambda: numbers.append(service._next_container_number()))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(numbers), list(range(1, 21)))
+
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_create_container_retries_name_conflict(self, mock_container_class):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.image = lambda: {'Id': 'abc123'}
+        self.mock_client.containers.return_value = []
+        conflict = docker.errors.APIError(
+            'Conflict', mock.Mock(status_code=409), explanation='name in use')
+        mock_container_class.create.side_effect = [conflict, mock.Mock()]
+
+        service.create_container()
+
+        names = [
+            kwargs['name']
+            for _, kwargs in mock_container_class.create.call_args_list
+        ]
+        self.assertEqual(names, ['default_foo_1', 'default_foo_2'])
+
+    @mock.patch('compose.service.Container', autospec=True)
+    def test_create_container_with_number_does_not_retry(self, mock_container_class):
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.image = lambda: {'Id': 'abc123'}
+        conflict = docker.errors.APIError(
+            'Conflict', mock.Mock(status_code=409), explanation='name in use')
+        mock_container_class.create.side_effect = conflict
+
+        with self.assertRaises(docker.errors.APIError):
+            service.create_container(number=3)
+        self.assertEqual(mock_container_class.create.call_count, 1)
+
     def test_parse_repository_tag(self):
         self.assertEqual(parse_repository_tag("root"), ("root", ""))
         self.assertEqual(parse_repository_tag("root:tag"), ("root", "tag"))
@@ -329,6 +742,15 @@ class ServiceTest(unittest.TestCase):
         self.assertFalse(self.mock_client.build.call_args[1]['pull'])
 
 
+def mock_container(id, config_hash, running=True):
+    return Container(None, {
+        'Id': id,
+        'Name': '/foo_%s' % id,
+        'Config': {'Labels': {LABEL_CONFIG_HASH: config_hash}},
+        'State': {'Running': running},
+    }, has_been_inspected=True)
+
+
 def mock_get_image(images):
     if images:
         return images[0]
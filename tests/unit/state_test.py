@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from .. import unittest
+from compose.state import ProjectState
+
+
+class ProjectStateTest(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+    def load(self):
+        return ProjectState.load('composetest', state_dir=self.state_dir)
+
+    def test_disabled_without_state_dir(self):
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertIsNone(ProjectState.load('composetest'))
+
+    def test_state_dir_from_environment(self):
+        with mock.patch.dict(os.environ, {'COMPOSE_STATE_DIR': self.state_dir}):
+            state = ProjectState.load('composetest')
+        self.assertEqual(state.path, os.path.join(self.state_dir, 'composetest.json'))
+
+    def test_missing_or_invalid_file_is_empty(self):
+        self.assertEqual(self.load().services, {})
+
+        with open(os.path.join(self.state_dir, 'composetest.json'), 'w') as f:
+            f.write('not json')
+        self.assertEqual(self.load().services, {})
+
+    def test_record_and_load(self):
+        state = self.load()
+        state.record('web', ['b', 'a'], 'image-id')
+        state.save()
+
+        state = self.load()
+        self.assertEqual(state.image_id('web', ['a', 'b']), 'image-id')
+        self.assertIsNone(state.image_id('web', ['a']))
+        self.assertIsNone(state.image_id('db', []))
+
+    def test_forget(self):
+        state = self.load()
+        state.record('web', ['a'], 'image-id')
+        state.record('db', ['b'], None)
+        state.save()
+
+        state = self.load()
+        self.assertEqual(list(state.services), ['web'])
+        state.forget(['web'])
+        state.save()
+        self.assertEqual(self.load().services, {})
+
+    def test_save_only_when_changed(self):
+        state = self.load()
+        state.save()
+        self.assertEqual(os.listdir(self.state_dir), [])
+
+        state.record('web', ['a'], 'image-id')
+        state.save()
+        with open(state.path) as f:
+            self.assertEqual(json.load(f), {
+                'services': {'web': {'containers': ['a'], 'image_id': 'image-id'}},
+                'journal': {},
+            })
+
+    def test_save_failure_is_ignored(self):
+        state = ProjectState(os.path.join(self.state_dir, 'file', 'composetest.json'))
+        open(os.path.join(self.state_dir, 'file'), 'w').close()
+        state.record('web', ['a'], 'image-id')
+        state.save()
+        self.assertTrue(state.changed)
+
+    def test_journal(self):
+        state = self.load()
+        state.plan_recreates('web', [1, 2])
+        state.step('web', '1', 'rename')
+        state.step('web', '1', 'create', container_id='new')
+
+        state = self.load()
+        self.assertEqual(state.recreates('web'), {
+            1: {'steps': ['rename', 'create'], 'container': 'new'},
+            2: {'steps': []},
+        })
+
+        state.step('web', '1', 'start')
+        state.step('web', '1', 'remove')
+        self.assertEqual(list(self.load().recreates('web')), [2])
+
+    def test_plan_recreates_keeps_steps(self):
+        state = self.load()
+        state.plan_recreates('web', [1, 2])
+        state.step('web', 1, 'rename')
+
+        state.plan_recreates('web', [1])
+        self.assertEqual(state.recreates('web'), {1: {'steps': ['rename']}})
+
+        state.plan_recreates('web', [])
+        self.assertEqual(state.journal, {})
@@ -0,0 +1,180 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import threading
+import time
+
+from docker.errors import APIError
+import mock
+
+from .. import unittest
+from compose.utils import parallel_execute
+
+
+class ParallelExecuteTest(unittest.TestCase):
+
+    def test_limit(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0}
+
+        def work(obj):
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+
+        parallel_execute(
+            objects=list(range(10)),
+            obj_callable=work,
+            msg_index=lambda n: n,
+            msg="Working",
+            limit=2,
+        )
+
+        self.assertEqual(state['max_running'], 2)
+
+    def threads_used(self, objects, limit=None):
+        threads = set()
+
+        def work(obj):
+            threads.add(threading.current_thread().ident)
+            time.sleep(0.01)
+
+        parallel_execute(
+            objects=objects,
+            obj_callable=work,
+            msg_index=lambda n: n,
+            msg="Working",
+            limit=limit,
+        )
+        return threads
+
+    def test_limit_bounds_threads(self):
+        self.assertLessEqual(len(self.threads_used(list(range(10)), limit=2)), 2)
+
+    def test_limit_from_environment(self):
+        with mock.patch.dict(os.environ, {'COMPOSE_PARALLEL_LIMIT': '3'}):
+            self.assertLessEqual(len(self.threads_used(list(range(10)))), 3)
+            self.assertLessEqual(len(self.threads_used(list(range(10)), limit=1)), 1)
+
+        with mock.patch.dict(os.environ, {'COMPOSE_PARALLEL_LIMIT': 'lots'}):
+            self.assertEqual(len(self.threads_used(list(range(5)))), 5)
+
+    def test_dependencies_with_one_thread(self):
+        order = []
+        deps = {'web': ['db', 'db'], 'db': ['data'], 'data': []}
+
+        parallel_execute(
+            objects=['web', 'db', 'data'],
+            obj_callable=order.append,
+            msg_index=lambda name: name,
+            msg="Working",
+            limit=1,
+            get_deps=lambda name: deps[name],
+        )
+
+        self.assertEqual(order, ['data', 'db', 'web'])
+
+    def test_dependencies_finish_first(self):
+        order = []
+        deps = {'web': ['db'], 'db': ['data'], 'data': []}
+
+        def work(name):
+            time.sleep(0.01 if name == 'data' else 0)
+            order.append(name)
+
+        parallel_execute(
+            objects=['web', 'db', 'data'],
+            obj_callable=work,
+            msg_index=lambda name: name,
+            msg="Working",
+            get_deps=lambda name: deps[name],
+        )
+
+        self.assertEqual(order, ['data', 'db', 'web'])
+
+    def test_dependents_of_failures_are_skipped(self):
+        calls = []
+
+        def work(name):
+            calls.append(name)
+            if name == 'db':
+                raise APIError('boom', mock.Mock(status_code=500), explanation='boom')
+
+        parallel_execute(
+            objects=['web', 'db', 'cache'],
+            obj_callable=work,
+            msg_index=lambda name: name,
+            msg="Working",
+            get_deps=lambda name: ['db'] if name == 'web' else [],
+        )
+
+        self.assertEqual(sorted(calls), ['cache', 'db'])
+
+    def test_dependents_of_skipped_objects_are_skipped(self):
+        calls = []
+        deps = {'web': ['db'], 'db': ['data'], 'data': []}
+
+        def work(name):
+            calls.append(name)
+            raise ValueError(name)
+
+        _, errors = parallel_execute(
+            objects=['web', 'db', 'data'],
+            obj_callable=work,
+            msg_index=lambda name: name,
+            msg="Working",
+            get_deps=lambda name: deps[name],
+        )
+
+        self.assertEqual(calls, ['data'])
+        self.assertEqual(errors['db'], "not attempted, because data failed")
+        self.assertEqual(errors['web'], "not attempted, because db failed")
+
+    def test_unexpected_error_does_not_block(self):
+        def work(name):
+            raise ValueError(name)
+
+        parallel_execute(
+            objects=['web'],
+            obj_callable=work,
+            msg_index=lambda name: name,
+            msg="Working",
+        )
+
+    def test_returns_results_and_errors(self):
+        def work(name):
+            if name == 'db':
+                raise ValueError(name)
+            return name.upper()
+
+        results, errors = parallel_execute(
+            objects=['web', 'db'],
+            obj_callable=work,
+            msg_index=lambda name: name,
+            msg="Working",
+        )
+
+        self.assertEqual(results, {'web': 'WEB'})
+        self.assertEqual(list(errors), ['db'])
+
+    def test_quiet(self):
+        def work(name):
+            if name == 'db':
+                raise ValueError(name)
+            return name
+
+        with mock.patch('sys.stdout') as mock_stdout:
+            results, errors = parallel_execute(
+                objects=['web', 'db'],
+                obj_callable=work,
+                msg_index=lambda name: name,
+                msg="Working",
+                quiet=True,
+            )
+
+        self.assertFalse(mock_stdout.write.called)
+        self.assertEqual(results, {'web': 'web'})
+        self.assertEqual(list(errors), ['db'])
@@ -0,0 +1,233 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import docker
+import mock
+from requests.packages.urllib3.exceptions import ReadTimeoutError
+
+from .. import unittest
+from .helpers import container_listing
+from compose.container import Container
+from compose.project import Project
+from compose.readiness import NotReadyError
+from compose.service import ConvergencePlan
+from compose.watch import MAX_RETRY_BACKOFF
+from compose.watch import ProjectWatcher
+
+
+class ProjectWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.project = Project.from_dicts('composetest', [
+            {'name': 'db', 'image': 'busybox:latest', 'restart': 'always'},
+            {'name': 'web', 'image': 'busybox:latest', 'links': ['db']},
+        ], self.mock_client)
+        self.mock_client.images.return_value = [
+            {'Id': 'busybox-id', 'RepoTags': ['busybox:latest']},
+        ]
+        self.mock_client.containers.return_value = [
+            self.ps('db', 1),
+            self.ps('web', 1),
+        ]
+        self.watcher = ProjectWatcher(self.project, self.project.services)
+        self.watcher.load()
+        self.mock_client.reset_mock()
+
+    def config_hash(self, name):
+        return self.project.get_service(name).config_hash(image_id='busybox-id')
+
+    def ps(self, service, number, config_hash=None, status='Up 1 second'):
+        return container_listing(
+            service, number, status=status,
+            config_hash=config_hash or self.config_hash(service))
+
+    def inspected(self, service, number, config_hash=None, one_off=False):
+        listed = self.ps(service, number, config_hash=config_hash)
+        labels = listed['Labels']
+        labels['com.docker.compose.oneoff'] = 'True' if one_off else 'False'
+        return {
+            'Id': listed['Id'],
+            'Name': listed['Names'][0],
+            'Config': {'Labels': labels},
+            'State': {'Running': False},
+        }
+
+    def test_converged_events_make_no_requests(self):
+        for status in ['start', 'restart', 'exec_create', 'attach']:
+            self.assertEqual(
+                self.watcher.handle_event({'status': status, 'id': 'web1'}),
+                set())
+        self.assertEqual(
+            self.watcher.handle_event({'status': 'die', 'id': 'other'}),
+            set())
+        self.assertEqual(self.mock_client.method_calls, [])
+
+    def test_died_container_is_started(self):
+        service_names = self.watcher.handle_event({'status': 'die', 'id': 'web1'})
+        self.assertEqual(service_names, set(['web']))
+
+        self.watcher.reconcile(service_names)
+
+        self.mock_client.start.assert_called_once_with('web1')
+        self.assertTrue(self.watcher.containers['web1'].is_running)
+
+    def test_died_container_with_restart_policy_is_left_to_docker(self):
+        self.assertEqual(
+            self.watcher.handle_event({'status': 'die', 'id': 'db1'}),
+            set())
+
+    def test_removed_container_is_replaced(self):
+        web = self.project.get_service('web')
+        new_container = Container(None, self.inspected('web', 2))
+        web.create_container = mock.Mock(return_value=new_container)
+        web.start_container = mock.Mock()
+
+        service_names = self.watcher.handle_event({'status': 'destroy', 'id': 'web1'})
+        self.watcher.reconcile(service_names)
+
+        web.start_container.assert_called_once_with(new_container)
+        self.assertEqual(
+            [c.id for c in self.watcher.service_containers('web')],
+            ['web2'])
+        self.assertEqual(
+            self.watcher.handle_event({'status': 'create', 'id': 'web2'}),
+            set())
+
+    def test_drifted_container_is_recreated(self):
+        self.mock_client.inspect_container.return_value = self.inspected(
+            'web', 2, config_hash='stale')
+        web = self.project.get_service('web')
+        new_container = Container(None, self.inspected('web', 3))
+        web.execute_convergence_plan = mock.Mock(return_value=[
+            self.watcher.containers['web1'],
+            new_container,
+        ])
+
+        service_names = self.watcher.handle_event({'status': 'create', 'id': 'web2'})
+        self.assertEqual(service_names, set(['web']))
+        self.watcher.reconcile(service_names)
+
+        (plan,), _ = web.execute_convergence_plan.call_args
+        self.assertEqual(plan.action, 'recreate')
+        self.assertEqual(
+            dict((c.id, action) for c, action in plan.actions.items()),
+            {'web1': 'noop', 'web2': 'recreate'})
+        self.assertEqual(
+            sorted(c.id for c in self.watcher.service_containers('web')),
+            ['web1', 'web3'])
+
+    def test_one_off_containers_are_ignored(self):
+        self.mock_client.inspect_container.return_value = self.inspected(
+            'web', 1, one_off=True)
+
+        self.assertEqual(
+            self.watcher.handle_event({'status': 'create', 'id': 'run1'}),
+            set())
+        self.assertNotIn('run1', self.watcher.containers)
+
+    def test_reconcile_in_dependency_order(self):
+        converged = []
+        for service in self.project.services:
+            service.execute_convergence_plan = mock.Mock(
+                side_effect=lambda plan, name=service.name, **kwargs:
+                    converged.append(name) or [])
+            service.convergence_plan = mock.Mock(return_value=ConvergencePlan('noop', []))
+
+        self.watcher.reconcile(set(['web', 'db']))
+
+        self.assertEqual(converged, ['db', 'web'])
+
+    def test_reconcile_logs_errors_and_converges_the_other_services(self):
+        db, web = self.project.get_service('db'), self.project.get_service('web')
+        db_container = Container(self.mock_client, {'Name': '/composetest_db_1'})
+        db.convergence_plan = mock.Mock(side_effect=NotReadyError(
+            db_container, "the container is not running"))
+        web.convergence_plan = mock.Mock(side_effect=ValueError("bad plan"))
+        web.execute_convergence_plan = mock.Mock(return_value=[])
+
+        with mock.patch('compose.watch.log') as mock_log:
+            self.watcher.reconcile(set(['web', 'db']))
+
+        mock_log.error.assert_called_once_with(
+            "Failed to converge db: composetest_db_1 did not become ready: "
+            "the container is not running")
+        mock_log.exception.assert_called_once_with(
+            "Failed to converge web: bad plan")
+
+    def test_watch_keeps_going_after_an_error_handling_an_event(self):
+        self.mock_client.events.return_value = iter([
+            {'status': 'create', 'id': 'web2', 'time': 100},
+            {'status': 'die', 'id': 'web1', 'time': 101},
+        ])
+        self.mock_client.inspect_container.side_effect = IOError("Connection reset")
+        self.watcher.load = mock.Mock()
+        self.watcher.reconcile = mock.Mock()
+
+        with mock.patch('compose.watch.log'):
+            self.watcher.watch()
+
+        self.watcher.reconcile.assert_called_once_with(set(['web']))
+
+    @mock.patch('compose.watch.threading.Timer', autospec=True)
+    @mock.patch('compose.watch.time.time', autospec=True)
+    def test_converging_again_backs_off(self, mock_time, mock_timer):
+        web = self.project.get_service('web')
+        self.watcher.converge = mock.Mock()
+        self.watcher.is_converged = mock.Mock(return_value=False)
+
+        def reconcile_at(now):
+            mock_time.return_value = now
+            self.watcher.reconcile(set(['web']))
+
+        def retry_at(now):
+            mock_time.return_value = now
+            self.watcher.retry('web')
+
+        reconcile_at(100)
+        self.watcher.converge.assert_called_once_with(web)
+
+        # Converging again is put off until the backoff has passed
+        reconcile_at(100.5)
+        reconcile_at(100.8)
+        self.assertEqual(self.watcher.converge.call_count, 1)
+        mock_timer.assert_called_once_with(0.5, self.watcher.retry, args=['web'])
+
+        retry_at(101)
+        self.assertEqual(self.watcher.converge.call_count, 2)
+
+        # The backoff doubles each time the service is converged again
+        reconcile_at(102)
+        self.assertEqual(mock_timer.call_args[0][0], 1)
+        retry_at(103)
+        self.assertEqual(self.watcher.converge.call_count, 3)
+
+        # and starts over once the service has stayed converged long enough
+        reconcile_at(103 + MAX_RETRY_BACKOFF)
+        self.assertEqual(self.watcher.converge.call_count, 4)
+        reconcile_at(103.5 + MAX_RETRY_BACKOFF)
+        self.assertEqual(mock_timer.call_args[0][0], 0.5)
+
+    def test_retry_skips_a_service_which_has_converged(self):
+        self.watcher.retries['web'] = mock.Mock()
+        self.watcher.reconcile = mock.Mock()
+
+        self.watcher.retry('web')
+
+        self.assertEqual(self.watcher.retries, {})
+        self.assertEqual(self.watcher.reconcile.call_count, 0)
+
+    def test_watch_resubscribes_after_a_read_timeout(self):
+        def events(since=None, **kwargs):
+            if self.mock_client.events.call_count == 1:
+                yield {'status': 'start', 'id': 'web1', 'time': 100}
+                raise ReadTimeoutError(None, None, 'Read timed out.')
+            yield {'status': 'start', 'id': 'web1', 'time': 101}
+
+        self.mock_client.events.side_effect = events
+
+        self.watcher.watch()
+
+        self.assertEqual(self.mock_client.events.call_count, 2)
+        _, kwargs = self.mock_client.events.call_args
+        self.assertEqual(kwargs['since'], 100)
+        self.assertEqual(kwargs['filters'], {'label': self.project.labels()})